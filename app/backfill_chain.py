@@ -0,0 +1,85 @@
+"""
+Number interactions written before the chain sequencer existed and re-stamp
+the whole Merkle chain from GENESIS.
+
+    python -m app.backfill_chain
+    python -m app.backfill_chain --batch-size 10000
+
+Rows added by the `seq` upgrade in schema.sql have seq NULL: the sequencer,
+verification, tiering and the jobs all skip them, and the API refuses to start
+while any are left. This tool puts them first, in (timestamp, id) order, then
+the already sequenced rows in seq order, and recomputes every seq and
+merkle_root in one transaction. Chain checkpoints are dropped (they anchor
+roots that change) and job watermarks are shifted past the legacy rows, except
+compaction's, which is reset so legacy rows demoted to warm are compacted too.
+
+It takes the chain writer lock, so stop the API (ROLE=api or ROLE=all) first.
+"""
+import argparse
+import asyncio
+import asyncpg
+from .chain import GENESIS, ChainSequencer
+from .db import DSN, compute_merkle, merkle_record
+from .memory_manager import COMPACTION_JOB
+from .settings import Settings
+
+settings = Settings()
+
+def restamp(head: str, seq: int, rows):
+    """Chain (id, input_text, output_text, timestamp) rows after (seq, head); returns (id, seq, root) updates."""
+    updates = []
+    for id_, input_text, output_text, ts in rows:
+        seq += 1
+        head = compute_merkle(head, merkle_record({"input_text": input_text, "output_text": output_text, "timestamp": ts}))
+        updates.append((id_, seq, head))
+    return updates
+
+async def backfill(batch_size: int) -> int:
+    writer = ChainSequencer()
+    await writer.acquire_writer_lock()
+    conn = await asyncpg.connect(DSN)
+    try:
+        legacy = await conn.fetchval("SELECT count(1) FROM interactions WHERE seq IS NULL")
+        if not legacy:
+            print("no interactions without a seq; nothing to do")
+            return 0
+        async with conn.transaction():
+            # park the sequenced rows on negative seqs so renumbering never hits the unique index
+            await conn.execute("UPDATE interactions SET seq = -seq WHERE seq IS NOT NULL")
+            head, seq, batch = GENESIS, 0, []
+            cursor = conn.cursor("""
+                SELECT id, input_text, output_text, timestamp FROM interactions
+                ORDER BY seq IS NOT NULL, -seq, timestamp, id
+            """, prefetch=batch_size)
+            async for r in cursor:
+                batch.append((r["id"], r["input_text"], r["output_text"], r["timestamp"]))
+                if len(batch) >= batch_size:
+                    seq, head = await _write(conn, head, seq, batch)
+                    batch = []
+            if batch:
+                seq, head = await _write(conn, head, seq, batch)
+            await conn.execute("DELETE FROM chain_checkpoints")
+            await conn.execute("UPDATE job_state SET watermark = watermark + $1 WHERE watermark IS NOT NULL AND job <> $2",
+                               legacy, COMPACTION_JOB)
+            await conn.execute("UPDATE job_state SET watermark = 0 WHERE job = $1", COMPACTION_JOB)
+        print(f"numbered {legacy} legacy rows; chain re-stamped through seq {seq}")
+        return legacy
+    finally:
+        await conn.close()
+        await writer.release_writer_lock()
+
+async def _write(conn, head, seq, batch):
+    updates = restamp(head, seq, batch)
+    # the cursor holds the rows' old order, so these updates do not disturb it
+    await conn.executemany("UPDATE interactions SET seq = $2, merkle_root = $3 WHERE id = $1", updates)
+    print(f"stamped through seq {updates[-1][1]}", flush=True)
+    return updates[-1][1], updates[-1][2]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch-size", type=int, default=5000)
+    args = ap.parse_args()
+    asyncio.run(backfill(args.batch_size))
+
+if __name__ == "__main__":
+    main()
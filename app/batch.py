@@ -0,0 +1,130 @@
+import asyncio
+import time
+import uuid
+import httpx
+from cachetools import TTLCache
+from .binder import binder_lookup_many
+from .cache import cache_hit, prompt_key, response_cache
+from .chain import chain_sequencer
+from .embeddings import embed_text, embed_texts
+from .pipeline import interaction_record, prepare_call, proxy_result
+from .router import model_router
+from .settings import Settings
+from .writer import interaction_writer
+
+settings = Settings()
+
+# running jobs must not expire or be evicted under their pollers; they move to
+# the TTL cache once finished
+running_jobs = {}
+finished_jobs = TTLCache(maxsize=settings.batch_job_max, ttl=settings.batch_job_ttl_seconds)
+_job_tasks = set()
+
+def _error(index: int, e: BaseException) -> dict:
+    return {"index": index, "error": "Upstream error" if isinstance(e, httpx.HTTPError) else str(e)}
+
+async def run_batch(pool, items, use_cache: bool = True):
+    """
+    Proxy many prompts at once, yielding one result dict (with its `index`)
+    per item as it completes. Exact cache hits are answered first; the rest
+    are embedded in batched upstream calls and looked up in the binder with
+    one vectorised search, then sent to the LLM under a concurrency limit.
+    Completed interactions are stamped together in completion order and
+    handed to the write-behind queue, which inserts them in bulk.
+    """
+    # memory context changes the upstream prompt, so those items skip the cache entirely
+    keys = [prompt_key(it["prompt"], it.get("tier")) if use_cache and not it.get("use_memory") else None
+            for it in items]
+    todo = []
+    for i, it in enumerate(items):
+        cached = await response_cache.get_exact(keys[i]) if keys[i] is not None else None
+        if cached:
+            yield dict(cache_hit(cached, "exact"), index=i)
+        else:
+            todo.append(i)
+    if not todo:
+        return
+    E, C = await embed_texts([items[i]["prompt"] for i in todo])
+    if use_cache:
+        rows = []
+        for j, i in enumerate(todo):
+            cached = await response_cache.get_semantic(C[j], items[i].get("tier")) if keys[i] is not None else None
+            if cached:
+                yield dict(cache_hit(cached, "semantic"), index=i)
+            else:
+                rows.append(j)
+        todo, E, C = [todo[j] for j in rows], E[rows], C[rows]
+        if not todo:
+            return
+    candidates = await binder_lookup_many(pool, C, top_k=3)
+
+    done = asyncio.Queue()
+    sem = asyncio.Semaphore(settings.batch_llm_concurrency)
+
+    async def one(j, i):
+        it = items[i]
+        try:
+            async with sem:
+                upstream, model, context = prepare_call(it["prompt"], E[j], C[j], candidates[j], keys[i],
+                                                        use_memory=it.get("use_memory", False),
+                                                        max_latency_ms=it.get("max_latency_ms"), tier=it.get("tier"))
+                provider_resp, model = await model_router.call(upstream, model, max_latency_ms=it.get("max_latency_ms"))
+            output_text = provider_resp["choices"][0]["message"]["content"]
+            output_emb, output_emb_c = await embed_text(output_text)
+            record = interaction_record(context, output_text, provider_resp, model)
+            record["output_embedding"], record["output_emb_compressed"] = output_emb, output_emb_c
+            done.put_nowait((i, record, context, model, None))
+        except Exception as e:
+            done.put_nowait((i, None, None, None, e))
+
+    tasks = [asyncio.create_task(one(j, i)) for j, i in enumerate(todo)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            completed = [await done.get()]
+            while not done.empty():
+                completed.append(done.get_nowait())
+            remaining -= len(completed)
+            ok = [c for c in completed if c[1] is not None]
+            # queue every stamped record before yielding: a consumer that stops
+            # reading must not leave stamped records behind as chain gaps
+            await interaction_writer.enqueue(*chain_sequencer.stamp_batch([c[1] for c in ok]))
+            for i, record, context, model, _ in ok:
+                result = proxy_result(record, context, model)
+                if context["cache_key"] is not None:
+                    await response_cache.put(context["cache_key"], context["input_emb_c"], result, tier=context["tier"])
+                yield dict(result, index=i)
+            for i, _, _, _, e in completed:
+                if e is not None:
+                    yield _error(i, e)
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def get_batch_job(job_id: str):
+    return running_jobs.get(job_id) or finished_jobs.get(job_id)
+
+def start_batch_job(pool, items, use_cache: bool = True) -> dict:
+    """Run a batch in the background; results are kept for batch_job_ttl_seconds once it finishes."""
+    job = {"job_id": str(uuid.uuid4()), "status": "running", "total": len(items), "completed": 0,
+           "errors": 0, "created_at": time.time(), "finished_at": None, "results": []}
+    running_jobs[job["job_id"]] = job
+
+    async def run():
+        try:
+            async for r in run_batch(pool, items, use_cache):
+                job["results"].append(r)
+                job["completed"] += 1
+                job["errors"] += "error" in r
+            job["status"] = "done"
+        except Exception as e:
+            print("Batch job error", repr(e))
+            job["status"], job["error"] = "failed", str(e)
+        finally:
+            job["finished_at"] = time.time()
+            finished_jobs[job["job_id"]] = running_jobs.pop(job["job_id"])
+
+    task = asyncio.create_task(run())
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    return job
@@ -1,8 +1,11 @@
 import asyncio
+import hashlib
 import json
 import numpy as np
-from collections import Counter
-from .db import create_pool
+from .db import create_pool, run_exclusive
+from .executor import run_in_process
+from .mining import mine_new_interactions
+from .scoring import score_candidates
 from .settings import Settings
 
 settings = Settings()
@@ -17,71 +20,96 @@ async def fetch_recent_texts(limit=5000):
         rows = await conn.fetch("SELECT input_text FROM interactions ORDER BY timestamp DESC LIMIT $1", limit)
     return [r['input_text'] or "" for r in rows]
 
-async def discover_candidates_fallback():
-    texts = await fetch_recent_texts(limit=2000)
-    freq = Counter()
-    for t in texts:
-        for n in (1,2,3):
-            freq.update(ngrams_from_text(t, n=n))
-    proposals = []
-    for p, count in freq.most_common(100)[:40]:
-        proposals.append({
-            "pattern": p,
-            "label": f"ATOM_{p.upper().replace(' ', '_')[:64]}",
-            "canonical_meaning": p,
-            "compression_gain": 0.01 * count,
-            "predictive_delta": 0.005 * count,
-            "causal_utility": 0.1 + 0.01 * min(count, 50),
-            "safety_risks": []
-        })
-    pool = await create_pool()
-    async with pool.acquire() as conn:
-        for p in proposals:
-            await conn.execute("""
-                INSERT INTO rebase_proposals (candidate_atoms, compression_gain, predictive_delta, causal_utility, safety_risks)
-                VALUES ($1,$2,$3,$4,$5::jsonb)
-            """, json.dumps([p]), p["compression_gain"], p["predictive_delta"], p["causal_utility"], json.dumps(p["safety_risks"]))
-    return proposals
+def _proposal(p, count, sim):
+    return {
+        "pattern": p,
+        "label": f"ATOM_{p.upper().replace(' ', '_')[:64]}",
+        "canonical_meaning": p,
+        "count": count,
+        "compression_gain": sim["byte_ratio_saved"],
+        "predictive_delta": sim["coverage"],
+        # discount gains already covered by existing atoms or contested by other candidates
+        "causal_utility": sim["byte_ratio_saved"] * (1.0 - sim["atom_overlap"]) * (1.0 - 0.5 * sim["collisions"]),
+        "simulation": sim,
+        "safety_risks": []
+    }
+
+def pattern_signature(pattern: str) -> str:
+    return hashlib.sha256(" ".join(pattern.split()).encode("utf-8")).hexdigest()
+
+async def upsert_proposals(pool, proposals):
+    """
+    Write a BEE cycle's proposals in one statement. Proposals are keyed by
+    pattern signature: a pending proposal that is seen again gets fresh scores
+    and last_seen_at instead of a duplicate row, an expired one is revived, and
+    approved, rejected or needs_review proposals are left alone. Pending
+    proposals not seen for bee_proposal_ttl_seconds are expired in the same
+    round-trip.
+    """
+    unique = {}
+    for p in proposals:
+        unique.setdefault(pattern_signature(p["pattern"]), p)
+    await pool.execute("""
+        WITH expired AS (
+            UPDATE rebase_proposals SET status = 'expired'
+            WHERE status = 'pending' AND last_seen_at < NOW() - make_interval(secs => $7)
+              AND signature <> ALL($1::text[])
+        )
+        INSERT INTO rebase_proposals (signature, candidate_atoms, compression_gain, predictive_delta, causal_utility,
+                                      safety_risks, last_seen_at)
+        SELECT sig, atoms::jsonb, gain, delta, utility, risks::jsonb, NOW()
+        FROM unnest($1::text[], $2::text[], $3::float8[], $4::float8[], $5::float8[], $6::text[])
+             AS v(sig, atoms, gain, delta, utility, risks)
+        ON CONFLICT (signature) DO UPDATE SET
+            candidate_atoms = EXCLUDED.candidate_atoms,
+            compression_gain = EXCLUDED.compression_gain,
+            predictive_delta = EXCLUDED.predictive_delta,
+            causal_utility = EXCLUDED.causal_utility,
+            safety_risks = EXCLUDED.safety_risks,
+            last_seen_at = NOW(),
+            status = 'pending'
+        WHERE rebase_proposals.status IN ('pending', 'expired')
+    """, list(unique), [json.dumps([p]) for p in unique.values()],
+        [p["compression_gain"] for p in unique.values()], [p["predictive_delta"] for p in unique.values()],
+        [p["causal_utility"] for p in unique.values()], [json.dumps(p["safety_risks"]) for p in unique.values()],
+        float(settings.bee_proposal_ttl_seconds))
 
 async def discover_candidates():
-    # Check database size first; if small and lite_mode true, use fallback
+    """
+    Mine interactions newer than the last run into the persistent n-gram sketch
+    (sharded across the process pool), then score the sketch's top patterns by
+    simulating the binder rewrite over a sample of recent prompts. Only
+    patterns whose marker actually saves bytes are proposed.
+    """
     pool = await create_pool()
+    sketch = await mine_new_interactions(pool)
     async with pool.acquire() as conn:
         row = await conn.fetchrow("SELECT count(1) as cnt FROM interactions")
+        # only trusted atoms take part in rewriting, so only they compete in the simulation
+        atom_rows = await conn.fetch("SELECT base_repr, label, trust_score FROM atomic_tokens "
+                                     "WHERE base_repr IS NOT NULL AND trust_score >= $1",
+                                     settings.binder_score_threshold)
     cnt = int(row["cnt"]) if row else 0
-    if settings.lite_mode and cnt < max(1000, settings.compaction_min_rows):
-        return await discover_candidates_fallback()
-
-    # when data large enough, run heavier pattern mining
-    texts = await fetch_recent_texts(limit=20000)
-    freq = Counter()
-    for t in texts:
-        for n in (1,2,3):
-            freq.update(ngrams_from_text(t, n=n))
-    proposals = []
-    for p, count in freq.most_common(500)[:100]:
-        proposals.append({
-            "pattern": p,
-            "label": f"ATOM_{p.upper().replace(' ', '_')[:64]}",
-            "canonical_meaning": p,
-            "compression_gain": min(0.5, 0.001*count),
-            "predictive_delta": 0.01 * min(count, 100),
-            "causal_utility": 0.2 + 0.01 * min(count, 100),
-            "safety_risks": []
-        })
-    pool = await create_pool()
-    async with pool.acquire() as conn:
-        for p in proposals:
-            await conn.execute("""
-                INSERT INTO rebase_proposals (candidate_atoms, compression_gain, predictive_delta, causal_utility, safety_risks)
-                VALUES ($1,$2,$3,$4,$5::jsonb)
-            """, json.dumps([p]), p["compression_gain"], p["predictive_delta"], p["causal_utility"], json.dumps(p["safety_risks"]))
+    # small databases in lite mode get fewer proposals
+    limit = 40 if settings.lite_mode and cnt < max(1000, settings.compaction_min_rows) else 100
+    ranked = sketch.top(settings.bee_candidate_pool)
+    if not ranked:
+        return []
+    prompts = await fetch_recent_texts(limit=settings.bee_scoring_sample)
+    candidates = [{"pattern": p, "label": f"ATOM_{p.upper().replace(' ', '_')[:64]}"} for p, _ in ranked]
+    atoms = [{"base_repr": r["base_repr"], "label": r["label"], "score": float(r["trust_score"])} for r in atom_rows]
+    sims = await run_in_process(score_candidates, candidates, prompts, atoms)
+    proposals = [_proposal(p, count, sim) for (p, count), sim in zip(ranked, sims) if sim["bytes_saved"] > 0]
+    proposals.sort(key=lambda p: p["causal_utility"], reverse=True)
+    proposals = proposals[:limit]
+    await upsert_proposals(pool, proposals)
     return proposals
 
 async def bee_loop():
+    pool = await create_pool()
     while True:
         try:
-            await discover_candidates()
+            await run_exclusive(pool, "bee", discover_candidates)
         except Exception as e:
             print("BEE error", e)
         await asyncio.sleep(600)
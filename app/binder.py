@@ -1,40 +1,271 @@
+import asyncio
+import time
 from typing import List, Dict
+import ahocorasick
+from .db import get_job_state
+from .memory_manager import PCA_JOB, get_projection_engine
+from .metrics import track_job
+from .scoring import atom_marker, select_rewrites
+from .quantize import sign_bits, stores_sign_codes
 from .settings import Settings
+from .vector_codec import raw_vector_sql, stack_vector_bytes
+from .vector_index import VectorIndex
 import numpy as np
 
 settings = Settings()
 
-async def binder_lookup(conn, emb_compressed, top_k=3):
+def _token_info(r) -> Dict:
+    return {
+        "token_id": str(r["token_id"]),
+        "essence_id": str(r["essence_id"]) if r["essence_id"] else None,
+        "label": r["label"],
+        "base_repr": r["base_repr"],
+        "meaning": r["meaning"],
+        "score": float(r["trust_score"])
+    }
+
+def _build_automaton(atoms: Dict[str, Dict]):
+    automaton = ahocorasick.Automaton()
+    for pattern, info in atoms.items():
+        automaton.add_word(pattern, (len(pattern), info))
+    if atoms:
+        automaton.make_automaton()
+    return automaton
+
+class RewriteEngine:
+    """
+    Aho-Corasick automaton over the base_repr of every trusted atom, so a prompt
+    is scanned once regardless of vocabulary size. Atoms promoted between
+    reloads go into a small delta automaton that is rebuilt on each promotion
+    and folded into the main one once it grows past rewrite_delta_max.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._atoms: Dict[str, Dict] = {}    # base_repr -> token info
+        self._delta: Dict[str, Dict] = {}
+        self._main = _build_automaton({})
+        self._delta_automaton = _build_automaton({})
+
+    def __len__(self):
+        return len(self._atoms) + len(self._delta)
+
+    @staticmethod
+    def _trusted(atoms):
+        out = {}
+        for a in atoms:
+            p = a.get("base_repr")
+            if not p or a.get("score", 0) < settings.binder_score_threshold:
+                continue
+            if p not in out or a["score"] > out[p]["score"]:
+                out[p] = a
+        return out
+
+    def build(self, atoms: List[Dict]):
+        """Rebuild from the full atom list (runs in a worker thread on index reload)."""
+        trusted = self._trusted(atoms)
+        main = _build_automaton(trusted)
+        self._atoms, self._main = trusted, main
+        self._delta, self._delta_automaton = {}, _build_automaton({})
+        self.ready = True
+
+    def add(self, atoms: List[Dict]):
+        delta = dict(self._delta)
+        for p, a in self._trusted(atoms).items():
+            if p not in self._atoms or a["score"] > self._atoms[p]["score"]:
+                delta[p] = a
+        if len(delta) > settings.rewrite_delta_max:
+            merged = dict(self._atoms)
+            merged.update(delta)
+            self._atoms, self._main = merged, _build_automaton(merged)
+            delta = {}
+        self._delta, self._delta_automaton = delta, _build_automaton(delta)
+
+    def matches(self, prompt: str):
+        """Every (start, end, info) occurrence of a trusted atom; end is exclusive."""
+        spans = []
+        for automaton in (self._main, self._delta_automaton):
+            if automaton.kind != ahocorasick.AHOCORASICK:
+                continue
+            for end, (length, info) in automaton.iter(prompt):
+                if automaton is self._main and info["base_repr"] in self._delta:
+                    continue   # superseded by a newer promotion
+                spans.append((end - length + 1, end + 1, info))
+        return spans
+
+rewrite_engine = RewriteEngine()
+
+def _candidate_matches(prompt: str, candidates: List[Dict]):
+    spans = []
+    for p, info in RewriteEngine._trusted(candidates).items():
+        i = prompt.find(p)
+        while i >= 0:
+            spans.append((i, i + len(p), info))
+            i = prompt.find(p, i + 1)
+    return spans
+
+def apply_rewrites(prompt: str, spans):
+    """
+    Pick non-overlapping occurrences greedily by value (select_rewrites) and
+    substitute their markers. Returns (new_prompt, chosen infos).
+    """
+    chosen = select_rewrites(spans)
+    if not chosen:
+        return prompt, []
+    parts, pos = [], 0
+    for start, end, info in chosen:
+        parts.append(prompt[pos:start])
+        parts.append(atom_marker(info["label"]))
+        pos = end
+    parts.append(prompt[pos:])
+    return "".join(parts), [info for _, _, info in chosen]
+
+def _new_index(dim: int) -> VectorIndex:
+    return VectorIndex(dim, hnsw_threshold=settings.binder_index_hnsw_threshold,
+                       binary=settings.binary_codes, rerank_factor=settings.binary_rerank_factor)
+
+class BinderIndex:
+    """
+    In-process nearest-neighbour index over atomic_tokens.embedding_compressed,
+    with the token metadata held alongside in index order.
+    """
+
+    def __init__(self, dim: int = settings.compressed_dim):
+        self.dim = dim
+        self.ready = False
+        self.pca_version = None    # model the index was loaded under
+        self.stale = False         # some atoms were still in an older basis at load time
+        self._index = _new_index(dim)
+        self._meta: List[Dict] = []
+        self._pending = None   # atoms added while a reload is in flight
+
+    def __len__(self):
+        return len(self._meta)
+
+    async def load(self, pool):
+        self._pending = []
+        try:
+            version = get_projection_engine().version
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT token_id, essence_id, label, base_repr, meaning, trust_score, pca_version, "
+                    f"{raw_vector_sql('embedding_compressed')} "
+                    "FROM atomic_tokens WHERE embedding_compressed IS NOT NULL"
+                )
+                _, done = await get_job_state(conn, PCA_JOB)
+            meta = [_token_info(r) for r in rows]
+            X = await asyncio.to_thread(stack_vector_bytes, [r["embedding_compressed"] for r in rows], self.dim)
+            index = _new_index(self.dim)
+            await asyncio.to_thread(index.build, X)
+            await asyncio.to_thread(rewrite_engine.build, meta)
+            # replay atoms promoted while the table was being read
+            loaded = {m["token_id"] for m in meta}
+            for info, emb in self._pending:
+                if info["token_id"] not in loaded:
+                    index.add(emb)
+                    meta.append(info)
+            self._index, self._meta = index, meta
+            self.pca_version = version
+            # after a refit the PCA job maps atoms into the new basis; until its pass is
+            # done, some of them may still be in the old one
+            self.stale = bool(version) and any(r["pca_version"] != version for r in rows) \
+                and done != str(version).encode()
+            if self._pending:
+                rewrite_engine.add([info for info, _ in self._pending])
+            self.ready = True
+        finally:
+            self._pending = None
+
+    def add_atoms(self, atoms: List[Dict], embeddings):
+        """Add freshly inserted atoms (token info dicts) with their compressed embeddings."""
+        X = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        self._index.add(X)
+        self._meta.extend(atoms)
+        rewrite_engine.add(atoms)
+        if self._pending is not None:
+            self._pending.extend(zip(atoms, X))
+
+    def search(self, emb_compressed, top_k=3) -> List[Dict]:
+        distances, positions = self._index.search(emb_compressed, top_k)
+        results = []
+        for dist, pos in zip(distances[0], positions[0]):
+            if pos < 0:
+                continue
+            results.append(dict(self._meta[pos], distance=float(dist)))
+        return results
+
+    def search_many(self, embs_compressed, top_k=3) -> List[List[Dict]]:
+        """Vectorised search: one result list per query row."""
+        distances, positions = self._index.search(embs_compressed, top_k)
+        return [[dict(self._meta[pos], distance=float(dist)) for dist, pos in zip(d, p) if pos >= 0]
+                for d, p in zip(distances, positions)]
+
+binder_index = BinderIndex()
+
+async def binder_lookup(pool, emb_compressed, top_k=3):
     """
     Find nearest atomic tokens by compressed embedding.
     Return token info including essence_id and form history reference.
+    Served from the resident index once loaded; falls back to pgvector otherwise.
+    """
+    if binder_index.ready:
+        return binder_index.search(emb_compressed, top_k)
+    async with pool.acquire() as conn:
+        if stores_sign_codes():
+            # Hamming prefilter on the sign codes, exact re-rank of the survivors
+            rows = await conn.fetch("""
+                SELECT token_id, essence_id, label, base_repr, meaning, trust_score,
+                       embedding_compressed <-> $1::vector AS distance
+                FROM (SELECT * FROM atomic_tokens WHERE embedding_bits IS NOT NULL
+                      ORDER BY embedding_bits <~> $2 LIMIT $3) candidates
+                ORDER BY distance LIMIT $4
+            """, emb_compressed, sign_bits(emb_compressed), top_k * settings.binary_rerank_factor, top_k)
+        else:
+            rows = await conn.fetch(
+                "SELECT token_id, essence_id, label, base_repr, meaning, trust_score, "
+                "embedding_compressed <-> $1::vector AS distance FROM atomic_tokens "
+                "ORDER BY embedding_compressed <-> $1::vector LIMIT $2",
+                emb_compressed, top_k
+            )
+    return [dict(_token_info(r), distance=float(r["distance"])) for r in rows]
+
+async def binder_lookup_many(pool, embs_compressed, top_k=3):
+    """binder_lookup for a matrix of compressed embeddings, one FAISS call when the index is loaded."""
+    if binder_index.ready:
+        return binder_index.search_many(embs_compressed, top_k)
+    return list(await asyncio.gather(*[binder_lookup(pool, e, top_k) for e in np.asarray(embs_compressed)]))
+
+async def binder_index_loop(pool):
+    """
+    Resync the binder index every binder_index_resync_seconds, and sooner when
+    a new PCA model was promoted (queries are then projected into a basis the
+    loaded atoms are not in) or atoms were still being mapped at the last load.
     """
-    rows = await conn.fetch(
-        "SELECT token_id, essence_id, label, base_repr, meaning, trust_score FROM atomic_tokens "
-        "ORDER BY embedding_compressed <-> $1::vector LIMIT $2",
-        emb_compressed, top_k
-    )
-    results = []
-    for r in rows:
-        results.append({
-            "token_id": str(r["token_id"]),
-            "essence_id": str(r["essence_id"]) if r["essence_id"] else None,
-            "label": r["label"],
-            "base_repr": r["base_repr"],
-            "meaning": r["meaning"],
-            "score": float(r["trust_score"])
-        })
-    return results
+    loaded_at = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.binder_version_check_seconds)
+        due = time.monotonic() - loaded_at >= settings.binder_index_resync_seconds
+        if not (due or binder_index.stale or get_projection_engine().version != binder_index.pca_version):
+            continue
+        try:
+            with track_job("binder_resync"):
+                await binder_index.load(pool)
+            loaded_at = time.monotonic()
+        except Exception as e:
+            print("Binder index resync error", e)
 
 def maybe_rewrite_prompt(prompt: str, binder_candidates: List[Dict]):
     """
-    Rewrite using top candidate if confident. Also returns essence mapping in metadata.
+    Rewrite every non-overlapping occurrence of a trusted atom's base_repr,
+    preferring the highest-value ones. Uses the rewrite engine once loaded and
+    the binder candidates otherwise. Also returns essence mapping in metadata.
     """
-    if not binder_candidates:
+    spans = rewrite_engine.matches(prompt) if rewrite_engine.ready else _candidate_matches(prompt, binder_candidates)
+    new_prompt, used = apply_rewrites(prompt, spans)
+    if not used:
         return prompt, {"rewritten": False, "essence": None}
-    top = binder_candidates[0]
-    if top["score"] >= settings.binder_score_threshold and top.get("base_repr") and top["base_repr"] in prompt:
-        atom_marker = f"<ATOM:{top['label']}>"
-        new_prompt = prompt.replace(top["base_repr"], atom_marker)
-        return new_prompt, {"rewritten": True, "token_used": top, "essence": top.get("essence_id")}
-    return prompt, {"rewritten": False, "essence": None}
+    used = list({u["token_id"]: u for u in used}.values())
+    top = max(used, key=lambda u: u["score"])
+    return new_prompt, {"rewritten": True, "token_used": top, "essence": top.get("essence_id"),
+                        "tokens_used": [u["label"] for u in used],
+                        "essences": list(dict.fromkeys(u["essence_id"] for u in used if u.get("essence_id")))}
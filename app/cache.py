@@ -0,0 +1,171 @@
+import hashlib
+import json
+import numpy as np
+from cachetools import TTLCache
+from prometheus_client import Counter, Gauge
+from .settings import Settings
+
+settings = Settings()
+
+CACHE_REQUESTS = Counter('sems_cache_requests_total', 'Response cache lookups', ['tier', 'result'])
+CACHE_ENTRIES = Gauge('sems_cache_entries', 'Entries held in the in-process response cache', ['tier'])
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+def prompt_key(prompt: str, tier: str = None) -> str:
+    """Exact-tier key: the normalised prompt, scoped by the pinned model tier (if any)."""
+    text = normalize_prompt(prompt)
+    if tier:
+        text = f"{tier}\x00{text}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+PROVENANCE_FIELDS = ("interaction_id", "seq", "merkle_root")
+
+def cache_hit(result: dict, how: str) -> dict:
+    """
+    A cached reply served to a new request: the original interaction's id, seq
+    and Merkle root move under `cached_from` so they are not mistaken for this
+    request's own provenance.
+    """
+    hit = {k: v for k, v in result.items() if k not in PROVENANCE_FIELDS}
+    hit["cached_from"] = {k: result.get(k) for k in PROVENANCE_FIELDS}
+    hit["cache"] = how
+    return hit
+
+class LocalExactStore:
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def get(self, key: str):
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: dict):
+        self._cache[key] = value
+
+class RedisExactStore:
+    """
+    Exact tier shared across replicas. `client` is any redis.asyncio-compatible
+    client (get / set with `ex`), so a fake can stand in for tests.
+    Redis failures degrade to cache misses.
+    """
+
+    def __init__(self, client, ttl: int, prefix: str = "sems:resp:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        try:
+            raw = await self.client.get(self.prefix + key)
+        except Exception as e:
+            print("Redis cache get error", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict):
+        try:
+            await self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            print("Redis cache set error", e)
+
+class SemanticIndex:
+    """
+    Maps unit-normalised compressed input embeddings to exact-tier keys. Entries
+    follow the same TTL/LRU policy as the exact tier; the stacked matrix used for
+    lookups is rebuilt only after the entry set changes. Each entry carries the
+    model tier it was answered for, and lookups only match the same tier.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, max_distance: float):
+        self.max_distance = max_distance
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)   # eviction policy only
+        self._vectors = {}                                   # key -> unit vector
+        self._tiers = {}                                     # key -> tier code
+        self._tier_codes = {}
+        self._keys = []
+        self._matrix = None
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _unit(self, emb):
+        v = np.asarray(emb, dtype=np.float32).reshape(-1)
+        return v / (np.linalg.norm(v) + 1e-12)
+
+    def _tier_code(self, tier) -> int:
+        return self._tier_codes.setdefault(tier, len(self._tier_codes))
+
+    def nearest(self, emb, tier: str = None):
+        """Return the exact-tier key of the closest entry for `tier` within max_distance (cosine), or None."""
+        self._entries.expire()
+        if self._dirty or len(self._entries) != len(self._keys):
+            self._keys = list(self._entries)
+            self._vectors = {k: self._vectors[k] for k in self._keys}
+            self._tiers = {k: self._tiers[k] for k in self._keys}
+            self._matrix = np.stack([self._vectors[k] for k in self._keys]) if self._keys else None
+            self._tier_array = np.fromiter((self._tiers[k] for k in self._keys), dtype=np.int64, count=len(self._keys))
+            self._dirty = False
+        if self._matrix is None:
+            return None
+        sims = np.where(self._tier_array == self._tier_code(tier), self._matrix @ self._unit(emb), -np.inf)
+        best = int(np.argmax(sims))
+        if 1.0 - float(sims[best]) > self.max_distance:
+            return None
+        key = self._keys[best]
+        if self._entries.get(key) is None:   # get() also refreshes the LRU position
+            return None
+        return key
+
+    def add(self, key: str, emb, tier: str = None):
+        self._entries[key] = True
+        self._vectors[key] = self._unit(emb)
+        self._tiers[key] = self._tier_code(tier)
+        self._dirty = True
+
+class ResponseCache:
+    """
+    Two-tier /v1/proxy response cache: an exact tier keyed on the normalised
+    prompt hash (checked before any embedding call) and a semantic tier that
+    resolves a compressed input embedding to a nearby exact-tier entry.
+    """
+
+    def __init__(self, exact_store, semantic: SemanticIndex):
+        self.exact = exact_store
+        self.semantic = semantic
+
+    async def get_exact(self, key: str):
+        value = await self.exact.get(key)
+        CACHE_REQUESTS.labels("exact", "hit" if value else "miss").inc()
+        return value
+
+    async def get_semantic(self, emb_compressed, tier: str = None):
+        key = self.semantic.nearest(emb_compressed, tier)
+        value = await self.exact.get(key) if key else None
+        CACHE_REQUESTS.labels("semantic", "hit" if value else "miss").inc()
+        return value
+
+    async def put(self, key: str, emb_compressed, value: dict, tier: str = None):
+        await self.exact.set(key, value)
+        self.semantic.add(key, emb_compressed, tier)
+        if isinstance(self.exact, LocalExactStore):
+            CACHE_ENTRIES.labels("exact").set(len(self.exact))
+        CACHE_ENTRIES.labels("semantic").set(len(self.semantic))
+
+def build_response_cache(redis_client=None) -> ResponseCache:
+    if redis_client is None and settings.use_redis_cache:
+        import redis.asyncio as redis
+        redis_client = redis.from_url(settings.redis_url)
+    if redis_client is not None:
+        exact = RedisExactStore(redis_client, settings.cache_ttl_seconds)
+    else:
+        exact = LocalExactStore(settings.cache_max_items, settings.cache_ttl_seconds)
+    semantic = SemanticIndex(settings.cache_max_items, settings.cache_ttl_seconds,
+                             settings.semantic_cache_max_distance)
+    return ResponseCache(exact, semantic)
+
+response_cache = build_response_cache()
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import signal
+import asyncpg
+from .db import DSN, compute_merkle, merkle_record
+from .executor import run_in_process
+from .settings import Settings
+
+settings = Settings()
+
+GENESIS = "0" * 64
+CHAIN_WRITER_LOCK = "sems:chain_writer"
+
+class ChainSequencer:
+    """
+    Single writer for the interaction Merkle chain. Owns the head hash and the
+    next sequence number in memory, so stamping a record is a synchronous step
+    on the event loop: concurrent handlers are serialised without locks or a
+    round-trip to read the previous root. The head is recovered from the
+    database (and any not-yet-replayed spill) at startup.
+
+    That only holds with one writer: acquire_writer_lock() takes a
+    session-level advisory lock on a dedicated connection and fails fast if
+    another process holds it. If that connection is lost the lock may pass to
+    another process, so this one terminates instead of stamping on a stale head.
+    """
+
+    def __init__(self):
+        self.head = GENESIS
+        self.seq = 0
+        self._lock_conn = None
+
+    async def acquire_writer_lock(self):
+        conn = await asyncpg.connect(DSN)
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", CHAIN_WRITER_LOCK):
+            await conn.close()
+            raise RuntimeError("another process is writing the interaction chain; "
+                               "run a single API process (ROLE=api or ROLE=all)")
+        conn.add_termination_listener(self._lock_lost)
+        self._lock_conn = conn
+
+    def _lock_lost(self, conn=None):
+        print("Chain writer lock lost; shutting down")
+        self._lock_conn = None
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    async def watch_writer_lock(self, interval: float):
+        """Ping the lock connection so a silently dropped session is noticed."""
+        while self._lock_conn is not None:
+            await asyncio.sleep(interval)
+            conn = self._lock_conn
+            if conn is None:
+                return
+            try:
+                await asyncio.wait_for(conn.fetchval("SELECT 1"), interval)
+            except Exception as e:
+                print("Chain writer lock check error", repr(e))
+                conn.remove_termination_listener(self._lock_lost)
+                conn.terminate()
+                self._lock_lost()
+                return
+
+    async def release_writer_lock(self):
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is not None:
+            conn.remove_termination_listener(self._lock_lost)
+            await conn.close()
+
+    async def recover(self, pool, pending=None):
+        async with pool.acquire() as conn:
+            # rows from before the seq column are outside the chain until numbered
+            if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM interactions WHERE seq IS NULL)"):
+                raise RuntimeError("interactions without a seq found; stop the API and run "
+                                   "`python -m app.backfill_chain` to number them")
+            row = await conn.fetchrow("SELECT seq, merkle_root FROM interactions WHERE seq IS NOT NULL ORDER BY seq DESC LIMIT 1")
+        if row:
+            self.seq, self.head = int(row["seq"]), row["merkle_root"]
+        if pending and pending["seq"] > self.seq:
+            self.seq, self.head = pending["seq"], pending["merkle_root"]
+
+    def stamp(self, record: dict) -> dict:
+        """Assign the next seq and merkle_root to record (in place) and advance the head."""
+        self.seq += 1
+        self.head = compute_merkle(self.head, merkle_record(record))
+        record["seq"], record["merkle_root"] = self.seq, self.head
+        return record
+
+    def stamp_batch(self, records):
+        for r in records:
+            self.stamp(r)
+        return records
+
+chain_sequencer = ChainSequencer()
+
+def verify_segment(anchor: str, first_seq: int, rows):
+    """
+    Verify a contiguous run of chain rows, given as (seq, input, output,
+    timestamp_iso, merkle_root) tuples, against the stored root that precedes
+    it. Each row is checked against its predecessor's stored root, so a
+    tampered row is reported on its own rather than invalidating the rest of
+    the segment. Runs in a worker process.
+    """
+    problems = []
+    prev, expected_seq = anchor, first_seq
+    for seq, input_text, output_text, ts, root in rows:
+        if seq != expected_seq:
+            problems.append({"seq": expected_seq, "error": "missing", "next_seq": seq})
+        recomputed = compute_merkle(prev, {"input": input_text, "output": output_text, "timestamp": ts})
+        if recomputed != root:
+            problems.append({"seq": seq, "expected": root, "recomputed": recomputed})
+        prev, expected_seq = root, seq + 1
+    return problems
+
+async def _chain_bounds(conn, from_seq, to_seq):
+    """Resolve the seq range to verify and the root it is anchored on."""
+    if to_seq is None:
+        to_seq = await conn.fetchval("SELECT max(seq) FROM interactions")
+    if from_seq is None:
+        cp = await conn.fetchrow("SELECT seq, merkle_root FROM chain_checkpoints WHERE seq <= $1 ORDER BY seq DESC LIMIT 1",
+                                 to_seq or 0)
+        if cp:
+            return int(cp["seq"]) + 1, to_seq, cp["merkle_root"], True
+        return 1, to_seq, GENESIS, True
+    if from_seq <= 1:
+        return 1, to_seq, GENESIS, True
+    anchor = await conn.fetchval("SELECT merkle_root FROM interactions WHERE seq = $1", from_seq - 1)
+    return from_seq, to_seq, anchor, False
+
+async def verify_chain_stream(pool, from_seq=None, to_seq=None):
+    """
+    Stream chain verification results as dicts (one per segment, then a summary).
+    Rows are read with a server-side cursor and verified in segments of
+    chain_segment_size on the process pool. Without an explicit `from_seq` the
+    run resumes after the latest checkpoint; while every segment verified so far
+    is clean, a checkpoint is recorded at the end of each segment.
+    """
+    async with pool.acquire() as conn:
+        start, end, anchor, checkpointing = await _chain_bounds(conn, from_seq, to_seq)
+        yield {"type": "start", "from": start, "to": end}
+        if end is None or start > end:
+            yield {"type": "summary", "valid": True, "verified_rows": 0, "checkpoint": None}
+            return
+        if anchor is None:
+            yield {"type": "summary", "valid": False, "verified_rows": 0, "checkpoint": None,
+                   "problems": [{"seq": start - 1, "error": "missing"}]}
+            return
+
+        valid, verified, checkpoint = True, 0, None
+        inflight = []   # segments submitted to the pool, settled in chain order
+
+        def submit(rows):
+            nonlocal anchor
+            first, last = seg_first, rows[-1][0]
+            fut = asyncio.ensure_future(run_in_process(verify_segment, anchor, seg_first, rows))
+            inflight.append((first, last, rows[-1][4], len(rows), fut))
+            anchor = rows[-1][4]
+            return last + 1
+
+        async def settle():
+            nonlocal valid, verified, checkpoint, checkpointing
+            first, last, last_root, n, fut = inflight.pop(0)
+            problems = await fut
+            verified += n
+            if problems:
+                valid, checkpointing = False, False
+            elif checkpointing:
+                # on its own pooled connection so checkpoints survive an aborted stream
+                await pool.execute(
+                    "INSERT INTO chain_checkpoints (seq, merkle_root) VALUES ($1, $2) ON CONFLICT (seq) DO NOTHING",
+                    last, last_root)
+                checkpoint = last
+            return {"type": "segment", "from": first, "to": last, "rows": n, "valid": not problems, "problems": problems}
+
+        async with conn.transaction():
+            rows, seg_first = [], start
+            cursor = conn.cursor(
+                "SELECT seq, input_text, output_text, timestamp, merkle_root FROM interactions "
+                "WHERE seq BETWEEN $1 AND $2 ORDER BY seq", start, end, prefetch=2000)
+            async for r in cursor:
+                rows.append((int(r["seq"]), r["input_text"], r["output_text"], r["timestamp"].isoformat(), r["merkle_root"]))
+                if len(rows) >= settings.chain_segment_size:
+                    seg_first, rows = submit(rows), []
+                    if len(inflight) >= settings.chain_verify_parallelism:
+                        yield await settle()
+            if rows:
+                submit(rows)
+            while inflight:
+                yield await settle()
+        yield {"type": "summary", "valid": valid, "verified_rows": verified, "checkpoint": checkpoint}
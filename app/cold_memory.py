@@ -0,0 +1,130 @@
+import asyncio
+from typing import Dict, List
+import numpy as np
+from .memory_manager import get_projection_engine, l2_normalize
+from .metrics import track_job
+from .settings import Settings
+from .vector_codec import raw_vector_sql, stack_vector_bytes
+from .vector_index import VectorIndex
+
+settings = Settings()
+
+def _new_index(dim: int) -> VectorIndex:
+    return VectorIndex(dim, metric="ip", hnsw_threshold=settings.cold_memory_hnsw_threshold,
+                       binary=settings.binary_codes, rerank_factor=settings.binary_rerank_factor)
+
+class ColdMemoryIndex:
+    """
+    In-process inner-product index over unit-normalised centroid embeddings, so
+    scores are cosine similarities. Refreshed incrementally from
+    centroids.updated_at: a changed centroid is appended and its old position
+    tombstoned, and the index is rebuilt once tombstones pass a quarter of it
+    or the PCA model changes.
+    """
+
+    def __init__(self, dim: int = settings.compressed_dim):
+        self.dim = dim
+        self.ready = False
+        self.pca_version = None
+        self._index = _new_index(dim)
+        self._meta: List[Dict] = []        # by index position; None = tombstoned
+        self._positions: Dict[str, int] = {}
+        self._updated: Dict[str, object] = {}   # centroid_id -> updated_at indexed
+        self._dead = 0
+        self._since = None                 # max(updated_at) seen
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    async def _fetch(self, pool, since=None, ids=None):
+        async with pool.acquire() as conn:
+            return await conn.fetch(f"""
+                SELECT centroid_id, label, {raw_vector_sql('centroid_emb')}, summary, member_count, updated_at
+                FROM centroids
+                WHERE centroid_emb IS NOT NULL AND pca_version IS NOT DISTINCT FROM $1
+                  AND ($2::timestamptz IS NULL OR updated_at >= $2)
+                  AND ($3::uuid[] IS NULL OR centroid_id = ANY($3::uuid[]))
+            """, self.pca_version, since, ids)
+
+    @staticmethod
+    def _unpack(rows, dim):
+        X = stack_vector_bytes([r["centroid_emb"] for r in rows], dim)
+        meta = [{"centroid_id": str(r["centroid_id"]), "label": r["label"], "summary": r["summary"],
+                 "member_count": r["member_count"]} for r in rows]
+        return l2_normalize(X), meta
+
+    async def load(self, pool):
+        async with self._lock:
+            self.pca_version = get_projection_engine().version
+            rows = await self._fetch(pool)
+            X, meta = self._unpack(rows, self.dim)
+            index = _new_index(self.dim)
+            await asyncio.to_thread(index.build, X)
+            self._index, self._meta, self._dead = index, meta, 0
+            self._positions = {m["centroid_id"]: i for i, m in enumerate(meta)}
+            self._updated = {str(r["centroid_id"]): r["updated_at"] for r in rows}
+            self._since = max((r["updated_at"] for r in rows), default=None)
+            self.ready = True
+
+    async def refresh(self, pool, centroid_ids=None):
+        """Pick up centroids created or updated since the last refresh (or just `centroid_ids`)."""
+        if not self.ready or get_projection_engine().version != self.pca_version:
+            await self.load(pool)
+            return
+        async with self._lock:
+            rows = await self._fetch(pool, since=None if centroid_ids else self._since, ids=centroid_ids)
+            # `since` is inclusive, so rows already indexed at that timestamp come back unchanged
+            rows = [r for r in rows if self._updated.get(str(r["centroid_id"])) != r["updated_at"]]
+            if not rows:
+                return
+            X, meta = self._unpack(rows, self.dim)
+            for m in meta:
+                old = self._positions.get(m["centroid_id"])
+                if old is not None:
+                    self._meta[old] = None
+                    self._dead += 1
+            base = len(self._meta)
+            self._index.add(X)
+            self._meta.extend(meta)
+            for i, m in enumerate(meta):
+                self._positions[m["centroid_id"]] = base + i
+            self._updated.update((str(r["centroid_id"]), r["updated_at"]) for r in rows)
+            self._since = max([r["updated_at"] for r in rows] + ([self._since] if self._since else []))
+        if self._dead > max(1000, len(self._meta) // 4):
+            await self.load(pool)
+
+    def search(self, emb_compressed, top_k: int = 3, min_similarity: float = 0.0) -> List[Dict]:
+        if not self.ready or not self._positions:
+            return []
+        q = l2_normalize(np.asarray(emb_compressed, dtype=np.float32).reshape(1, -1))
+        sims, positions = self._index.search(q, top_k + min(self._dead, 4 * top_k))
+        results = []
+        for sim, pos in zip(sims[0], positions[0]):
+            if pos < 0 or sim < min_similarity:
+                continue
+            meta = self._meta[pos]
+            if meta is None:
+                continue
+            results.append(dict(meta, similarity=float(sim)))
+            if len(results) >= top_k:
+                break
+        return results
+
+cold_memory_index = ColdMemoryIndex()
+
+def memory_context(prompt: str, memories: List[Dict]) -> str:
+    """Prepend retrieved centroid summaries to a prompt."""
+    lines = [f"- {m['summary']}" for m in memories if m.get("summary")]
+    if not lines:
+        return prompt
+    return "Relevant context from memory:\n" + "\n".join(lines) + "\n\n" + prompt
+
+async def cold_memory_loop(pool):
+    while True:
+        await asyncio.sleep(settings.cold_memory_refresh_seconds)
+        try:
+            with track_job("cold_memory_refresh"):
+                await cold_memory_index.refresh(pool)
+        except Exception as e:
+            print("Cold memory refresh error", e)
@@ -2,7 +2,11 @@ import asyncpg
 import json
 import hashlib
 import datetime
+import uuid
+from .metrics import JOB_SKIPPED, InstrumentedPool, track_job
+from .quantize import encode_full, sign_bits, storage_column, stores_sign_codes
 from .settings import Settings
+from .vector_codec import register_vector_codec
 
 settings = Settings()
 DSN = f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
@@ -12,7 +16,8 @@ _pool = None
 async def create_pool():
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(dsn=DSN, min_size=1, max_size=10)
+        _pool = InstrumentedPool(await asyncpg.create_pool(dsn=DSN, min_size=1, max_size=settings.db_pool_max_size,
+                                                         init=register_vector_codec))
     return _pool
 
 def compute_merkle(prev_hash: str, record: dict) -> str:
@@ -20,37 +25,144 @@ def compute_merkle(prev_hash: str, record: dict) -> str:
     combined = prev_hash.encode("utf-8") + payload
     return hashlib.sha256(combined).hexdigest()
 
-async def get_latest_merkle(pool) -> str:
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT merkle_root FROM interactions ORDER BY timestamp DESC LIMIT 1")
-        if not row:
-            return "0" * 64
-        return row["merkle_root"]
-
-async def insert_interaction(pool, input_text, output_text, input_emb, output_emb,
-                             input_emb_c=None, output_emb_c=None, text_summary=None,
-                             atom_refs=None, essence_refs=None, provider_response=None, metadata=None):
-    prev = await get_latest_merkle(pool)
-    record = {"input": input_text, "output": output_text, "timestamp": datetime.datetime.utcnow().isoformat()}
-    merkle = compute_merkle(prev, record)
+def new_interaction_record(input_text, output_text, input_emb, output_emb,
+                           input_emb_c=None, output_emb_c=None, text_summary=None,
+                           atom_refs=None, essence_refs=None, provider_response=None, metadata=None,
+                           pca_version=None) -> dict:
+    """Build an interaction row for the write-behind queue; id and timestamp are fixed here."""
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc),
+        "input_text": input_text, "output_text": output_text,
+        "input_embedding": input_emb, "output_embedding": output_emb,
+        "input_emb_compressed": input_emb_c, "output_emb_compressed": output_emb_c,
+        "text_summary": text_summary,
+        "atom_refs": atom_refs or [], "essence_refs": essence_refs or [],
+        "provider_response": provider_response or {}, "metadata": metadata or {},
+        "pca_version": pca_version,
+    }
+
+def merkle_record(record: dict) -> dict:
+    return {"input": record["input_text"], "output": record["output_text"], "timestamp": record["timestamp"].isoformat()}
+
+def _insert_interactions_sql() -> str:
+    (in_col, typ), (out_col, _) = storage_column("input_embedding"), storage_column("output_embedding")
+    return f"""
+        INSERT INTO interactions (id, seq, timestamp, input_text, output_text, {in_col}, {out_col},
+                                  input_emb_compressed, output_emb_compressed, text_summary,
+                                  atom_refs, essence_refs, merkle_root, provider_response, metadata, pca_version)
+        VALUES ($1::uuid,$2,$3,$4,$5,$6::{typ},$7::{typ},$8::vector,$9::vector,$10,$11::jsonb,$12::jsonb,$13,$14::jsonb,$15::jsonb,$16)
+        ON CONFLICT (id) DO NOTHING
+    """
+
+INSERT_INTERACTIONS_SQL = _insert_interactions_sql()
+
+async def insert_interactions(conn, records):
+    """
+    Bulk insert interaction records already stamped with seq and merkle_root. Re-inserting an id is a no-op.
+    Full embeddings go to the embedding_storage columns.
+    """
+    await conn.executemany(INSERT_INTERACTIONS_SQL, [
+        (r["id"], r["seq"], r["timestamp"], r["input_text"], r["output_text"],
+         encode_full(r["input_embedding"]), encode_full(r["output_embedding"]),
+         r["input_emb_compressed"], r["output_emb_compressed"], r["text_summary"],
+         json.dumps(r["atom_refs"]), json.dumps(r["essence_refs"]), r["merkle_root"],
+         json.dumps(r["provider_response"]), json.dumps(r["metadata"]), r.get("pca_version")) for r in records])
+
+def _insert_atoms_sql() -> str:
+    col, typ = storage_column("embedding")
+    bits_col, bits_param = (", embedding_bits", ",$11") if stores_sign_codes() else ("", "")
+    return f"""
+        INSERT INTO atomic_tokens (token_id, essence_id, label, base_repr, meaning, {col}, embedding_compressed,
+                                   provenance, trust_score, pca_version{bits_col})
+        VALUES ($1,$2,$3,$4,$5,$6::{typ},$7::vector,$8,$9,$10{bits_param})
+        ON CONFLICT DO NOTHING
+    """
+
+INSERT_ATOMS_SQL = _insert_atoms_sql()
+
+def _atom_row(a) -> tuple:
+    row = (a.get("token_id") or uuid.uuid4(), a["essence_id"], a["label"], a["base_repr"], a["meaning"],
+           encode_full(a["embedding"]), a["embedding_compressed"], a["provenance"], a["trust_score"],
+           a.get("pca_version"))
+    if stores_sign_codes():
+        emb_c = a["embedding_compressed"]
+        row += (None if emb_c is None else sign_bits(emb_c),)
+    return row
+
+async def insert_atoms(conn, atoms):
+    """Insert atomic tokens (dicts with the column names; embedding is the full float vector)."""
+    await conn.executemany(INSERT_ATOMS_SQL, [_atom_row(a) for a in atoms])
+
+async def get_job_state(conn, job: str):
+    """Return (watermark, payload) for a background job, or (None, None) if it has never run."""
+    row = await conn.fetchrow("SELECT watermark, payload FROM job_state WHERE job = $1", job)
+    if not row:
+        return None, None
+    return row["watermark"], row["payload"]
+
+async def set_job_state(conn, job: str, watermark: int, payload: bytes = None):
+    await conn.execute("""
+        INSERT INTO job_state (job, watermark, payload, updated_at) VALUES ($1, $2, $3, NOW())
+        ON CONFLICT (job) DO UPDATE SET watermark = EXCLUDED.watermark,
+            payload = coalesce(EXCLUDED.payload, job_state.payload), updated_at = NOW()
+    """, job, watermark, payload)
+
+async def run_exclusive(pool, job: str, fn) -> bool:
+    """
+    Run `await fn()` (timed as `job`) while holding the Postgres advisory lock
+    for `job`, so at most one worker process runs it at a time; returns False
+    without calling fn if another process holds the lock. The lock is
+    session-scoped, so it is released with the connection if this process
+    dies mid-run.
+    """
     async with pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO interactions (input_text, output_text, input_embedding, output_embedding,
-                                      input_emb_compressed, output_emb_compressed, text_summary,
-                                      atom_refs, essence_refs, merkle_root, provider_response, metadata)
-            VALUES ($1,$2,$3::vector,$4::vector,$5::vector,$6::vector,$7,$8::jsonb,$9::jsonb,$10,$11::jsonb,$12::jsonb)
-        """, input_text, output_text, input_emb, output_emb, input_emb_c, output_emb_c, text_summary,
-             json.dumps(atom_refs or []), json.dumps(essence_refs or []), merkle, json.dumps(provider_response or {}), json.dumps(metadata or {}))
-    return merkle
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", f"sems:{job}"):
+            JOB_SKIPPED.labels(job).inc()
+            return False
+        try:
+            with track_job(job):
+                await fn()
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", f"sems:{job}")
+    return True
 
 # Essence helpers: ensure an essence exists (based on signature), return essence_id
+def essence_signature(canonical_meaning: str) -> str:
+    return hashlib.sha256(canonical_meaning.encode("utf-8")).hexdigest()
+
+async def upsert_essences(conn, forms):
+    """
+    Ensure essences exist for a batch of {canonical_meaning, form, generation, meta}
+    dicts and append each form to its essence's history, in one statement.
+    History is appended in SQL with jsonb ||, so concurrent approvals do not
+    overwrite each other. Returns {canonical_meaning: essence_id}.
+    """
+    grouped = {}
+    now = datetime.datetime.utcnow().isoformat()
+    for f in forms:
+        sig = essence_signature(f["canonical_meaning"])
+        entry = grouped.setdefault(sig, [f["canonical_meaning"], []])
+        if f.get("form"):
+            entry[1].append({"form": f["form"], "generation": f.get("generation") or "unknown",
+                             "added_at": now, "meta": f.get("meta") or {}})
+    if not grouped:
+        return {}
+    rows = await conn.fetch("""
+        INSERT INTO essences (canonical_meaning, signature, form_history)
+        SELECT meaning, sig, history::jsonb FROM unnest($1::text[], $2::text[], $3::text[]) AS v(meaning, sig, history)
+        ON CONFLICT (signature) DO UPDATE SET form_history = essences.form_history || EXCLUDED.form_history
+        RETURNING essence_id, canonical_meaning
+    """, [g[0] for g in grouped.values()], list(grouped), [json.dumps(g[1]) for g in grouped.values()])
+    return {r["canonical_meaning"]: str(r["essence_id"]) for r in rows}
+
 async def ensure_essence(pool, canonical_meaning: str, form: str = None, generation: str = None, meta: dict = None):
     """
     Ensure a canonical essence exists. Use signature (sha256 of canonical_meaning) to dedupe.
     If new, create essence row and add initial form_history entry.
     Returns essence_id (string UUID).
     """
-    signature = hashlib.sha256(canonical_meaning.encode("utf-8")).hexdigest()
+    signature = essence_signature(canonical_meaning)
     async with pool.acquire() as conn:
         row = await conn.fetchrow("SELECT essence_id FROM essences WHERE signature = $1", signature)
         if row:
@@ -68,13 +180,8 @@ async def ensure_essence(pool, canonical_meaning: str, form: str = None, generat
         return str(row2["essence_id"])
 
 async def append_form_history(pool, essence_id: str, form: str, generation: str = None, meta: dict = None):
+    entry = {"form": form, "generation": generation or "unknown", "added_at": datetime.datetime.utcnow().isoformat(), "meta": meta or {}}
     async with pool.acquire() as conn:
-        # fetch existing history
-        row = await conn.fetchrow("SELECT form_history FROM essences WHERE essence_id = $1", essence_id)
-        if not row:
-            return False
-        history = row["form_history"] or []
-        entry = {"form": form, "generation": generation or "unknown", "added_at": datetime.datetime.utcnow().isoformat(), "meta": meta or {}}
-        history.append(entry)
-        await conn.execute("UPDATE essences SET form_history = $1::jsonb WHERE essence_id = $2", json.dumps(history), essence_id)
-        return True
+        result = await conn.execute("UPDATE essences SET form_history = form_history || $1::jsonb WHERE essence_id = $2",
+                                    json.dumps([entry]), essence_id)
+    return result != "UPDATE 0"
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Tuple
+import numpy as np
+from .memory_manager import compress_embeddings
+from .metrics import STAGE_LATENCY
+from .provider import provider_embedding_batch
+from .settings import Settings
+
+settings = Settings()
+
+class EmbeddingBatcher:
+    """
+    Micro-batches embedding requests from concurrent handlers. Requests are held
+    for up to max_wait_ms or until max_items distinct texts are queued, then sent
+    as one upstream call; the stacked matrix is compressed once and each waiter
+    gets its (embedding, compressed) row. Identical texts share a single slot.
+    """
+
+    def __init__(self, max_items: int, max_wait_ms: float):
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000.0
+        self._futures = {}    # text -> future, until its batch resolves
+        self._queued = []     # texts waiting for the next flush
+        self._timer = None
+        self._sending = set() # in-flight _send tasks; the loop only keeps weak references
+
+    async def embed(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        fut = self._futures.get(text)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            fut.add_done_callback(_mark_retrieved)
+            self._futures[text] = fut
+            self._queued.append(text)
+            if len(self._queued) >= self.max_items:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+        return await asyncio.shield(fut)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        texts, self._queued = self._queued, []
+        if texts:
+            task = asyncio.ensure_future(self._send(texts))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, texts):
+        futures = [self._futures[t] for t in texts]
+        try:
+            X = np.asarray(await provider_embedding_batch(texts), dtype=np.float32)
+            start = time.perf_counter()
+            C = compress_embeddings(X)
+            STAGE_LATENCY.labels("compress").observe(time.perf_counter() - start)
+        except Exception as e:
+            for fut in futures:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            for t in texts:
+                self._futures.pop(t, None)
+        for i, fut in enumerate(futures):
+            if not fut.done():
+                fut.set_result((X[i], C[i]))
+
+def _mark_retrieved(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+embedding_batcher = EmbeddingBatcher(settings.embedding_batch_max_items, settings.embedding_batch_max_wait_ms)
+
+async def embed_text(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (embedding, compressed embedding) for text via the shared batcher."""
+    return await embedding_batcher.embed(text)
+
+async def embed_texts(texts) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Embed many texts directly (bypassing the micro-batcher) in upstream calls of
+    embedding_batch_max_items distinct inputs; returns (embeddings, compressed)
+    matrices in input order.
+    """
+    unique = list(dict.fromkeys(texts))
+    step = settings.embedding_batch_max_items
+    chunks = await asyncio.gather(*[provider_embedding_batch(unique[i:i + step]) for i in range(0, len(unique), step)])
+    X = np.asarray([e for chunk in chunks for e in chunk], dtype=np.float32).reshape(len(unique), -1)
+    start = time.perf_counter()
+    # batch-sized projections are a large matmul; BLAS releases the GIL
+    C = await asyncio.to_thread(compress_embeddings, X)
+    STAGE_LATENCY.labels("compress").observe(time.perf_counter() - start)
+    pos = {t: i for i, t in enumerate(unique)}
+    idx = np.fromiter((pos[t] for t in texts), dtype=np.int64, count=len(texts))
+    return X[idx], C[idx]
@@ -0,0 +1,26 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .settings import Settings
+
+settings = Settings()
+
+_process_pool = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.cpu_workers or os.cpu_count())
+    return _process_pool
+
+async def run_in_process(fn, *args, **kwargs):
+    """Run a picklable, module-level function on the shared process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(fn, *args, **kwargs))
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
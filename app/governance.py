@@ -20,10 +20,16 @@ async def verify_approver(api_key: str):
             return {"user_id": str(row["user_id"]), "username": row["username"], "role": row["role"]}
     return None
 
-async def log_proposal_action(proposal_id: str, action: str, actor_user_id: str=None, actor_meta: dict=None):
+async def log_proposal_action(proposal_id: str, action: str, actor_user_id: str=None, actor_meta: dict=None, conn=None):
+    """Append to the audit log; pass `conn` to log inside the caller's transaction."""
+    sql = """
+        INSERT INTO proposal_audit_log (proposal_id, action, actor_user_id, actor_meta)
+        VALUES ($1,$2,$3,$4::jsonb)
+    """
+    args = (proposal_id, action, actor_user_id, json.dumps(actor_meta or {}))
+    if conn is not None:
+        await conn.execute(sql, *args)
+        return
     pool = await create_pool()
     async with pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO proposal_audit_log (proposal_id, action, actor_user_id, actor_meta)
-            VALUES ($1,$2,$3,$4::jsonb)
-        """, proposal_id, action, actor_user_id, json.dumps(actor_meta or {}))
+        await conn.execute(sql, *args)
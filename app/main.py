@@ -1,48 +1,45 @@
-import os, asyncio, json
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
+import os, asyncio, json, math, time, uuid
+import numpy as np
+from typing import Optional
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from .settings import Settings
-from .db import create_pool, insert_interaction, compute_merkle, get_latest_merkle, ensure_essence, append_form_history
-from .memory_manager import compress_embedding, cluster_and_compact
-from .binder import binder_lookup, maybe_rewrite_prompt
-from .bee import bee_loop
+from .db import create_pool, insert_atoms, upsert_essences
+from .memory_manager import compress_embeddings, get_projection_engine
+from .binder import binder_lookup, binder_index, binder_index_loop
 from .governance import verify_approver, log_proposal_action
+from .cache import cache_hit, response_cache, prompt_key
+from .provider import start_client, close_client, provider_embedding_batch
+from .router import model_router
+from .embeddings import embed_text
+from .writer import interaction_writer
+from .chain import chain_sequencer, verify_chain_stream
+from .executor import shutdown_process_pool
+from .worker import start_background_jobs
+from .cold_memory import cold_memory_index, cold_memory_loop
+from .pipeline import prepare_call, interaction_record, proxy_result
+from .scoring import PROMOTED_TRUST
+from .batch import run_batch, start_batch_job, get_batch_job
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from .metrics import REQUESTS_IN_PROGRESS, ServerTimingMiddleware, stage, loop_lag_monitor
 
 settings = Settings()
 app = FastAPI(title="SEMS Phase0 Monolith (Generational)")
 
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=settings.rate_limit_enabled)
 app.state.limiter = limiter
 app.add_exception_handler(429, _rate_limit_exceeded_handler)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(ServerTimingMiddleware, enabled=settings.server_timing)
 
 db_pool = None
 REQUEST_COUNT = Counter('sems_requests_total', 'Total proxy requests', ['status'])
 REQUEST_LATENCY = Histogram('sems_request_latency_seconds', 'Latency of proxy', ['operation'])
 
-async def provider_embedding_call(text: str):
-    headers = {"Authorization": f"Bearer {settings.provider_api_key}"}
-    payload = {"model": settings.embedding_model, "input": text}
-    async with httpx.AsyncClient(timeout=25.0) as client:
-        r = await client.post(settings.embedding_url, json=payload, headers=headers)
-        r.raise_for_status()
-        data = r.json()
-        return data["data"][0]["embedding"]
-
-async def provider_llm_call(prompt: str):
-    headers = {"Authorization": f"Bearer {settings.provider_api_key}"}
-    payload = {"model": settings.llm_model, "messages":[{"role":"user","content":prompt}]}
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        r = await client.post(settings.llm_url, json=payload, headers=headers)
-        r.raise_for_status()
-        return r.json()
-
 def verify_api_key(request: Request):
     provided = request.headers.get("x-api-key") or request.query_params.get("api_key")
     if not provided or provided != settings.api_key:
@@ -53,62 +50,223 @@ def verify_api_key(request: Request):
 async def startup():
     global db_pool
     db_pool = await create_pool()
-    asyncio.create_task(periodic_tasks())
-    asyncio.create_task(bee_loop())
+    # only one process may stamp the chain; fail startup if another one already does
+    await chain_sequencer.acquire_writer_lock()
+    asyncio.create_task(chain_sequencer.watch_writer_lock(settings.chain_lock_check_seconds))
+    await start_client()
+    await interaction_writer.start(db_pool)
+    await chain_sequencer.recover(db_pool, pending=interaction_writer.spilled_head())
+    try:
+        await binder_index.load(db_pool)
+    except Exception as e:
+        print("Binder index load error", e)
+    try:
+        await cold_memory_index.load(db_pool)
+    except Exception as e:
+        print("Cold memory index load error", e)
+    asyncio.create_task(loop_lag_monitor(settings.loop_lag_interval_seconds))
+    asyncio.create_task(binder_index_loop(db_pool))
+    asyncio.create_task(cold_memory_loop(db_pool))
+    if settings.role != "api":
+        start_background_jobs()
 
 @app.on_event("shutdown")
 async def shutdown():
+    if _background:
+        _, pending = await asyncio.wait(list(_background), timeout=10)
+        # cancelled persist tasks still queue their stamped record on the way out
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=1)
+    await interaction_writer.stop()
+    await chain_sequencer.release_writer_lock()
+    await close_client()
+    shutdown_process_pool()
     await db_pool.close()
 
+def _sse(data, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _cached_response(result, stream: bool):
+    if not stream:
+        return JSONResponse(result)
+    async def replay():
+        yield _sse({"delta": result["output"]})
+        yield _sse(result, event="done")
+    return StreamingResponse(replay(), media_type="text/event-stream")
+
+_background = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+async def _persist_streamed(record, context, result, complete: bool):
+    """Embed the streamed output, then queue the (already stamped) record and cache the reply."""
+    try:
+        output_emb, output_emb_c = await embed_text(record["output_text"])
+        record["output_embedding"], record["output_emb_compressed"] = output_emb, output_emb_c
+    except Exception as e:
+        print("Streamed output embedding error", repr(e))
+    finally:
+        # the seq is already taken, so the row is written even without its output
+        # embedding, including when this task is cancelled at shutdown
+        await interaction_writer.enqueue(record)
+    if complete and context["cache_key"] is not None:
+        await response_cache.put(context["cache_key"], context["input_emb_c"], result, tier=context["tier"])
+
+async def _stream_proxy(prompt, model, max_latency_ms, context, started):
+    """
+    Forward upstream chunks as server-sent events while accumulating the text.
+    At the end the record is stamped so the final `done` event carries its seq
+    and Merkle root; embedding the output and queueing the row happen in the
+    background. A disconnected client still gets its partial output recorded.
+    The request's count, latency and in-progress gauge are settled here, when
+    the stream ends, rather than when the response starts.
+    """
+    parts, complete, status = [], False, "499"   # 499: the client went away mid-stream
+    try:
+        async for model, delta in model_router.stream(prompt, model, max_latency_ms=max_latency_ms):
+            parts.append(delta)
+            yield _sse({"delta": delta})
+        complete, status = True, "200"
+    except Exception as e:
+        status = str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else "500"
+        yield _sse({"error": "Upstream error" if isinstance(e, httpx.HTTPError) else str(e)}, event="error")
+    finally:
+        REQUEST_COUNT.labels(status).inc()
+        REQUEST_LATENCY.labels("total").observe(time.perf_counter() - started)
+        REQUESTS_IN_PROGRESS.dec()
+        if parts or complete:
+            output_text = "".join(parts)
+            provider_resp = {"model": model, "stream": True,
+                             "choices": [{"message": {"role": "assistant", "content": output_text}}]}
+            record = interaction_record(context, output_text, provider_resp, model)
+            if not complete:
+                record["metadata"]["incomplete"] = True
+            chain_sequencer.stamp(record)
+            result = proxy_result(record, context, model)
+            _spawn(_persist_streamed(record, context, result, complete))
+    if complete:
+        yield _sse(result, event="done")
+
+def _latency_budget(value):
+    """An optional `max_latency_ms` from a request body, as a positive number of milliseconds."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not (value > 0 and math.isfinite(value)):
+        raise HTTPException(status_code=400, detail="`max_latency_ms` must be a positive number")
+    return float(value)
+
 @app.post("/v1/proxy", dependencies=[Depends(verify_api_key)])
-@limiter.limit("100/minute")
+@limiter.limit(settings.proxy_rate_limit)
 async def proxy_endpoint(request: Request):
     body = await request.json()
     prompt = body.get("prompt") or body.get("input")
     if not prompt:
         raise HTTPException(status_code=400, detail="`prompt` required")
-    with REQUEST_LATENCY.labels("total").time():
-        REQUEST_COUNT.labels("in_progress").inc()
-        try:
-            input_emb = await provider_embedding_call(prompt)
-            input_emb_c = compress_embedding(input_emb)
-            async with db_pool.acquire() as conn:
-                binder_candidates = await binder_lookup(conn, input_emb_c, top_k=3)
-            rewritten_prompt, rewrite_meta = maybe_rewrite_prompt(prompt, binder_candidates)
-            provider_resp = await provider_llm_call(rewritten_prompt)
-            output_text = provider_resp["choices"][0]["message"]["content"]
-            output_emb = await provider_embedding_call(output_text)
-            output_emb_c = compress_embedding(output_emb)
-            summary = (output_text[:512] + '...') if len(output_text) > 512 else output_text
-
-            # determine essence_refs: collect essence_id(s) from binder candidates and rewrite metadata
-            essence_refs = []
-            for c in binder_candidates:
-                if c.get("essence_id"):
-                    essence_refs.append(c["essence_id"])
-            if rewrite_meta.get("essence"):
-                essence_refs.append(rewrite_meta["essence"])
-            # dedupe
-            essence_refs = list(dict.fromkeys([e for e in essence_refs if e]))
-
-            merkle = await insert_interaction(db_pool, prompt, output_text, input_emb, output_emb,
-                                              input_emb_c, output_emb_c, summary, [c['label'] for c in binder_candidates],
-                                              essence_refs, provider_resp, {"rewrite": rewrite_meta})
-            REQUEST_COUNT.labels("200").inc()
-            return JSONResponse({"output": output_text, "merkle_root": merkle, "binder_used": rewrite_meta})
-        except httpx.HTTPStatusError as e:
-            REQUEST_COUNT.labels(str(e.response.status_code)).inc()
-            raise HTTPException(status_code=502, detail="Upstream error")
-        except Exception as e:
-            REQUEST_COUNT.labels("500").inc()
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            REQUEST_COUNT.labels("in_progress").dec()
+    use_memory = body.get("use_memory", False)
+    max_latency_ms = _latency_budget(body.get("max_latency_ms"))
+    tier = body.get("tier")
+    stream = bool(body.get("stream", False))
+    # memory context changes the upstream prompt, so those replies are not cached
+    use_cache = body.get("cache", True) and not use_memory
+    started = time.perf_counter()
+    REQUESTS_IN_PROGRESS.inc()
+    streaming = False
+    try:
+        cache_key = prompt_key(prompt, tier)
+        if use_cache:
+            with stage("cache"):
+                cached = await response_cache.get_exact(cache_key)
+            if cached:
+                REQUEST_COUNT.labels("200").inc()
+                return _cached_response(cache_hit(cached, "exact"), stream)
+        with stage("embed_input"):
+            input_emb, input_emb_c = await embed_text(prompt)
+        if use_cache:
+            with stage("cache"):
+                cached = await response_cache.get_semantic(input_emb_c, tier)
+            if cached:
+                REQUEST_COUNT.labels("200").inc()
+                return _cached_response(cache_hit(cached, "semantic"), stream)
+        with stage("binder"):
+            binder_candidates = await binder_lookup(db_pool, input_emb_c, top_k=3)
+        rewritten_prompt, model, context = prepare_call(prompt, input_emb, input_emb_c, binder_candidates,
+                                                        cache_key if use_cache else None,
+                                                        use_memory=use_memory, max_latency_ms=max_latency_ms, tier=tier)
+        if stream:
+            # from here the stream settles the request's metrics when it ends
+            streaming = True
+            return StreamingResponse(_stream_proxy(rewritten_prompt, model, max_latency_ms, context, started),
+                                     media_type="text/event-stream")
+        with stage("llm"):
+            provider_resp, model = await model_router.call(rewritten_prompt, model, max_latency_ms=max_latency_ms)
+        output_text = provider_resp["choices"][0]["message"]["content"]
+        with stage("embed_output"):
+            output_emb, output_emb_c = await embed_text(output_text)
+        with stage("persist"):
+            record = interaction_record(context, output_text, provider_resp, model)
+            record["output_embedding"], record["output_emb_compressed"] = output_emb, output_emb_c
+            chain_sequencer.stamp(record)
+            await interaction_writer.enqueue(record)
+            result = proxy_result(record, context, model)
+            if use_cache:
+                await response_cache.put(cache_key, input_emb_c, result, tier=tier)
+        REQUEST_COUNT.labels("200").inc()
+        return JSONResponse(result)
+    except httpx.HTTPStatusError as e:
+        REQUEST_COUNT.labels(str(e.response.status_code)).inc()
+        raise HTTPException(status_code=502, detail="Upstream error")
+    except Exception as e:
+        REQUEST_COUNT.labels("500").inc()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not streaming:
+            REQUEST_LATENCY.labels("total").observe(time.perf_counter() - started)
+            REQUESTS_IN_PROGRESS.dec()
+
+@app.post("/v1/proxy/batch", dependencies=[Depends(verify_api_key)])
+@limiter.limit(settings.batch_rate_limit)
+async def proxy_batch_endpoint(request: Request):
+    """
+    Body: {"prompts": [...]} or {"items": [{"prompt", "tier", "max_latency_ms", "use_memory"}, ...]}.
+    Small batches stream NDJSON results as they complete; large ones (or
+    "async": true) return a job id to poll at /v1/proxy/batch/{job_id}.
+    """
+    body = await request.json()
+    items = body.get("items") or [{"prompt": p} for p in body.get("prompts") or []]
+    if not items or any(not isinstance(it, dict) or not it.get("prompt") for it in items):
+        raise HTTPException(status_code=400, detail="`prompts` or `items` with a `prompt` each required")
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"at most {settings.batch_max_items} prompts per batch")
+    for it in items:
+        if "max_latency_ms" in it:
+            it["max_latency_ms"] = _latency_budget(it["max_latency_ms"])
+    use_cache = body.get("cache", True)
+    if body.get("async") or len(items) > settings.batch_inline_max:
+        job = start_batch_job(db_pool, items, use_cache)
+        return JSONResponse({"job_id": job["job_id"], "status": job["status"], "total": job["total"]}, status_code=202)
+
+    async def ndjson():
+        async for r in run_batch(db_pool, items, use_cache):
+            yield json.dumps(r) + "\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/v1/proxy/batch/{job_id}", dependencies=[Depends(verify_api_key)])
+async def proxy_batch_status(job_id: str, offset: int = 0, limit: int = 1000):
+    job = get_batch_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="batch job not found or expired")
+    return dict(job, results=job["results"][offset:offset + limit])
 
 @app.get("/v1/proposals", dependencies=[Depends(verify_api_key)])
-async def list_proposals(limit: int = 50):
+async def list_proposals(limit: int = 50, status: Optional[str] = None):
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("SELECT proposal_id, candidate_atoms, compression_gain, predictive_delta, causal_utility, safety_risks, status, created_at FROM rebase_proposals ORDER BY created_at DESC LIMIT $1", limit)
+        rows = await conn.fetch("SELECT proposal_id, candidate_atoms, compression_gain, predictive_delta, causal_utility, safety_risks, status, created_at, last_seen_at FROM rebase_proposals WHERE ($2::text IS NULL OR status = $2) ORDER BY last_seen_at DESC NULLS LAST LIMIT $1", limit, status)
     return [dict(r) for r in rows]
 
 @app.get("/v1/proposals/{proposal_id}", dependencies=[Depends(verify_api_key)])
@@ -137,26 +295,40 @@ async def approve_proposal(proposal_id: str, request: Request):
             await conn.execute("UPDATE rebase_proposals SET status = 'needs_review' WHERE proposal_id = $1", proposal_id)
             await log_proposal_action(proposal_id, "marked_needs_review", user["user_id"], {"reason": "safety_risks_present"})
             raise HTTPException(status_code=400, detail="proposal has safety risks; marked for review")
-        candidates = row["candidate_atoms"]
-        promoted_count = 0
-        for cand in candidates:
-            label = cand.get("label")
-            pattern = cand.get("pattern") or cand.get("base_repr") or ""
-            canonical = cand.get("canonical_meaning") or pattern
-            # ensure essence
-            essence_id = await ensure_essence(db_pool, canonical, form=pattern, generation="G_next")
-            # add form history entry for this new form
-            await append_form_history(db_pool, essence_id, pattern, generation="G_next", meta={"proposal": proposal_id})
-            # compute embedding for pattern if available (best-effort)
-            emb = await provider_embedding_call(pattern) if pattern else [0.0]*1536
-            emb_c = compress_embedding(emb)
-            await conn.execute("""
-                INSERT INTO atomic_tokens (essence_id, label, base_repr, meaning, embedding, embedding_compressed, provenance, trust_score)
-                VALUES ($1,$2,$3,$4,$5::vector,$6::vector,$7,$8)
-            """, essence_id, label, pattern, canonical, emb, emb_c, f"promoted_from:{proposal_id}", 0.8)
-            promoted_count += 1
-        await conn.execute("UPDATE rebase_proposals SET status='approved' WHERE proposal_id = $1", proposal_id)
-        await log_proposal_action(proposal_id, "approved", user["user_id"], {"promoted_count": promoted_count})
+    candidates = [c for c in (row["candidate_atoms"] or []) if c.get("label")]
+    patterns = [c.get("pattern") or c.get("base_repr") or "" for c in candidates]
+    # embed every pattern in one upstream call before taking any locks
+    texts = [p for p in patterns if p]
+    embs = await provider_embedding_batch(texts) if texts else []
+    E = np.zeros((len(candidates), settings.input_dim), dtype=np.float32)
+    it = iter(embs)
+    for i, p in enumerate(patterns):
+        if p:
+            E[i] = next(it)
+    C = compress_embeddings(E)
+    pca_version = get_projection_engine().version
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            status = await conn.fetchval("SELECT status FROM rebase_proposals WHERE proposal_id = $1 FOR UPDATE", proposal_id)
+            if status != "pending":
+                raise HTTPException(status_code=409, detail="proposal no longer pending")
+            canonicals = [c.get("canonical_meaning") or p for c, p in zip(candidates, patterns)]
+            essence_ids = await upsert_essences(conn, [
+                {"canonical_meaning": m, "form": p, "generation": "G_next", "meta": {"proposal": proposal_id}}
+                for m, p in zip(canonicals, patterns)])
+            token_ids = [uuid.uuid4() for _ in candidates]
+            await insert_atoms(conn, [
+                {"token_id": token_ids[i], "essence_id": essence_ids[canonicals[i]], "label": c["label"],
+                 "base_repr": patterns[i], "meaning": canonicals[i], "embedding": E[i], "embedding_compressed": C[i],
+                 "provenance": f"promoted_from:{proposal_id}", "trust_score": PROMOTED_TRUST, "pca_version": pca_version}
+                for i, c in enumerate(candidates)])
+            await conn.execute("UPDATE rebase_proposals SET status='approved' WHERE proposal_id = $1", proposal_id)
+            promoted_count = len(candidates)
+            await log_proposal_action(proposal_id, "approved", user["user_id"], {"promoted_count": promoted_count}, conn=conn)
+    if candidates:
+        binder_index.add_atoms([{"token_id": str(token_ids[i]), "essence_id": essence_ids[canonicals[i]], "label": c["label"],
+                                 "base_repr": patterns[i], "meaning": canonicals[i], "score": PROMOTED_TRUST}
+                                for i, c in enumerate(candidates)], C)
     return {"status": "approved", "promoted": promoted_count}
 
 @app.post("/v1/proposals/{proposal_id}/reject")
@@ -178,27 +350,13 @@ async def reject_proposal(proposal_id: str, request: Request):
     return {"status": "rejected"}
 
 @app.get("/v1/verify_chain", dependencies=[Depends(verify_api_key)])
-async def verify_chain():
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("SELECT input_text, output_text, timestamp, merkle_root FROM interactions ORDER BY timestamp ASC")
-    prev = "0"*64
-    bad = []
-    for r in rows:
-        record = {"input": r["input_text"], "output": r["output_text"], "timestamp": r["timestamp"].isoformat()}
-        recomputed = compute_merkle(prev, record)
-        if recomputed != r["merkle_root"]:
-            bad.append({"expected": r["merkle_root"], "recomputed": recomputed})
-        prev = recomputed
-    return {"valid": len(bad) == 0, "problems": bad}
+async def verify_chain(from_seq: Optional[int] = Query(None, alias="from"), to_seq: Optional[int] = Query(None, alias="to")):
+    async def lines():
+        async for item in verify_chain_stream(db_pool, from_seq, to_seq):
+            yield json.dumps(item) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.get("/metrics")
 async def metrics():
     return PlainTextResponse(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-async def periodic_tasks():
-    while True:
-        try:
-            await cluster_and_compact()
-        except Exception as e:
-            print("Compaction error", e)
-        await asyncio.sleep(300)
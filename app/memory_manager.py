@@ -1,45 +1,149 @@
 import os
+import time
 import pickle
 import asyncio
-from typing import List
+import threading
+import uuid
 import numpy as np
 from sklearn.decomposition import IncrementalPCA
 import faiss
 import hdbscan
-from .db import create_pool
+from .db import create_pool, get_job_state, set_job_state
+from .executor import run_in_process
 from .settings import Settings
+from .vector_codec import raw_vector_sql, stack_vector_bytes
 import json
 
 settings = Settings()
-PCA_PATH = "/app/pca_model.pkl"
+PCA_PATH = settings.pca_model_path
 BATCH_SIZE = 256
 
+def write_pickle_atomic(obj, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    # atomic swap so the projection engine never reads a partially written model
+    os.replace(tmp_path, path)
+
 def fit_pca_on_stream(embeddings_iter, compressed_dim=settings.compressed_dim):
     ipca = IncrementalPCA(n_components=compressed_dim, batch_size=BATCH_SIZE)
     for batch in embeddings_iter:
         ipca.partial_fit(np.array(batch, dtype=np.float32))
-    with open(PCA_PATH, "wb") as f:
-        pickle.dump(ipca, f)
+    write_pickle_atomic(ipca, PCA_PATH)
     return ipca
 
-def load_pca():
-    if os.path.exists(PCA_PATH):
-        with open(PCA_PATH, "rb") as f:
-            return pickle.load(f)
-    return None
-
-def compress_embedding(emb: List[float]) -> List[float]:
-    ipca = load_pca()
-    arr = np.array(emb, dtype=np.float32).reshape(1, -1)
-    if ipca:
-        comp = ipca.transform(arr)[0].astype(np.float32)
-        return comp.tolist()
-    else:
-        arr16 = arr.astype(np.float16)[0]
+class ProjectionEngine:
+    """
+    Process-wide PCA projection. The fitted IncrementalPCA is unpickled once and
+    reduced to a contiguous float32 projection matrix and bias, so projecting N
+    embeddings is a single matmul. The model file is re-read when its mtime changes.
+    `version` is the promoted model version (0 for an unversioned model, None
+    while falling back to truncation).
+    """
+
+    def __init__(self, path: str = PCA_PATH, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = float("-inf")
+        self._weights = None   # (input_dim, compressed_dim), float32, C-contiguous
+        self._bias = None      # (compressed_dim,), mean_ projected through weights
+        self._version = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._weights is not None
+
+    @property
+    def version(self):
+        self._maybe_reload()
+        return self._version
+
+    def reload(self):
+        """Re-check the model file now, ignoring check_interval."""
+        self._checked_at = float("-inf")
+        self._maybe_reload()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            if mtime is None:
+                self._weights, self._bias, self._version = None, None, None
+            else:
+                with open(self.path, "rb") as f:
+                    self._set_model(pickle.load(f))
+            self._mtime = mtime
+
+    def _set_model(self, ipca):
+        weights = np.asarray(ipca.components_, dtype=np.float64).T
+        if getattr(ipca, "whiten", False):
+            weights = weights / np.sqrt(ipca.explained_variance_)
+        mean = np.asarray(ipca.mean_, dtype=np.float64)
+        self._weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self._bias = np.ascontiguousarray(mean @ weights, dtype=np.float32)
+        self._version = int(getattr(ipca, "sems_version", 0))
+
+    def project(self, matrix) -> np.ndarray:
+        X = np.asarray(matrix, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        self._maybe_reload()
+        weights, bias = self._weights, self._bias
+        if weights is not None:
+            out = X @ weights
+            out -= bias
+            return out
+        # no fitted model yet: keep the leading dims at float16 precision
         target = settings.compressed_dim
-        out = np.zeros((target,), dtype=np.float32)
-        out[:min(len(arr16), target)] = arr16[:min(len(arr16), target)]
-        return out.tolist()
+        out = np.zeros((X.shape[0], target), dtype=np.float32)
+        width = min(X.shape[1], target)
+        out[:, :width] = X[:, :width].astype(np.float16)
+        return out
+
+_projection = ProjectionEngine()
+
+def get_projection_engine() -> ProjectionEngine:
+    return _projection
+
+def compress_embeddings(matrix) -> np.ndarray:
+    """Project an (N, input_dim) matrix of embeddings to (N, compressed_dim) float32."""
+    return _projection.project(matrix)
+
+def compress_embedding(emb) -> np.ndarray:
+    return _projection.project(emb)[0]
+
+def basis_change(old_ipca, new_ipca, input_dim: int = settings.input_dim):
+    """
+    Affine map (A, b) taking vectors compressed by `old_ipca` to the basis of
+    `new_ipca`: c_new = c_old @ A + b, i.e. new.transform(old.inverse_transform(c_old)).
+    Used for rows whose full embeddings are gone, so they stay comparable with
+    freshly projected ones after a refit. old_ipca=None stands for the
+    truncation fallback, whose inverse pads with zeros.
+    """
+    k = settings.compressed_dim if old_ipca is None else old_ipca.n_components_
+    basis = np.vstack([np.zeros((1, k)), np.eye(k)])
+    if old_ipca is None:
+        X = np.zeros((k + 1, input_dim))
+        X[:, :k] = basis
+    else:
+        X = old_ipca.inverse_transform(basis)
+    Y = new_ipca.transform(X)
+    return (Y[1:] - Y[0]).astype(np.float32), Y[0].astype(np.float32)
 
 async def estimate_interaction_count():
     pool = await create_pool()
@@ -50,61 +154,153 @@ async def estimate_interaction_count():
 async def fetch_compressed_embeddings(limit=20000):
     pool = await create_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT id, input_emb_compressed, text_summary FROM interactions
+        rows = await conn.fetch(f"""
+            SELECT id, {raw_vector_sql('input_emb_compressed')}, text_summary FROM interactions
             WHERE input_emb_compressed IS NOT NULL
             ORDER BY timestamp ASC
             LIMIT $1
         """, limit)
-    ids, embs, sums = [], [], []
-    for r in rows:
-        emb = r['input_emb_compressed']
-        if emb is None:
-            continue
-        ids.append(str(r['id']))
-        embs.append(np.array(emb, dtype=np.float32))
-        sums.append(r['text_summary'] or "")
-    return ids, np.stack(embs) if embs else np.array([]), sums
+    return _unpack_rows(rows)
+
+def _unpack_rows(rows):
+    rows = [r for r in rows if r['input_emb_compressed'] is not None]
+    ids = [str(r['id']) for r in rows]
+    sums = [r['text_summary'] or "" for r in rows]
+    X = stack_vector_bytes([r['input_emb_compressed'] for r in rows]) if rows else np.array([])
+    return ids, X, sums
 
 def l2_normalize(X: np.ndarray):
     norms = np.linalg.norm(X, axis=1, keepdims=True) + 1e-12
     return X / norms
 
+def assign_and_cluster(X: np.ndarray, C: np.ndarray, max_distance: float, min_cluster_size: int):
+    """
+    Assign each row of X to its nearest centroid in C when the cosine distance is
+    within max_distance, then run HDBSCAN on the unassigned residue only.
+    Returns (X_norm, nearest, assigned_mask, residue_idx, residue_labels).
+    Runs in a worker process.
+    """
+    X_norm = l2_normalize(X)
+    nearest = np.full(X.shape[0], -1, dtype=np.int64)
+    assigned = np.zeros(X.shape[0], dtype=bool)
+    if C.shape[0]:
+        sims = X_norm @ l2_normalize(C).T
+        nearest = np.argmax(sims, axis=1)
+        assigned = sims[np.arange(X.shape[0]), nearest] >= 1.0 - max_distance
+    residue_idx = np.flatnonzero(~assigned)
+    residue_labels = np.full(residue_idx.shape[0], -1, dtype=np.int64)
+    if residue_idx.shape[0] >= min_cluster_size:
+        clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric='euclidean', cluster_selection_method='eom')
+        residue_labels = clusterer.fit_predict(X_norm[residue_idx])
+    return X_norm, nearest, assigned, residue_idx, residue_labels
+
+COMPACTION_JOB = "compaction"
+PCA_JOB = "pca_fit"   # job_state payload: the model version whose re-projection pass finished
+
+async def fetch_compaction_batch(conn, watermark: int, pca_version):
+    """
+    Warm interactions past the watermark and older than warm_max_age_seconds,
+    plus a bounded residue of earlier, still unclustered ones. Only rows
+    projected by the current PCA model are returned; after a refit the PCA job
+    brings older rows into the new basis (pca_job.reproject_compressed).
+    """
+    new_rows = await conn.fetch(f"""
+        SELECT id, seq, {raw_vector_sql('input_emb_compressed')}, text_summary FROM interactions
+        WHERE seq > $1 AND tier = 'warm' AND input_emb_compressed IS NOT NULL AND centroid_id IS NULL
+          AND pca_version IS NOT DISTINCT FROM $4
+          AND timestamp < NOW() - make_interval(secs => $3)
+        ORDER BY seq ASC
+        LIMIT $2
+    """, watermark, settings.compaction_batch_max, float(settings.warm_max_age_seconds), pca_version)
+    if not new_rows:
+        return [], watermark
+    residue_rows = await conn.fetch(f"""
+        SELECT id, seq, {raw_vector_sql('input_emb_compressed')}, text_summary FROM interactions
+        WHERE seq <= $1 AND tier = 'warm' AND input_emb_compressed IS NOT NULL AND centroid_id IS NULL
+          AND pca_version IS NOT DISTINCT FROM $3
+        ORDER BY seq DESC
+        LIMIT $2
+    """, watermark, settings.compaction_residue_max, pca_version)
+    return list(new_rows) + list(residue_rows), int(new_rows[-1]["seq"])
+
 async def cluster_and_compact(min_cluster_size=8):
-    # gate compaction in outer loop; here we assume called only when threshold exceeded
-    ids, X, sums = await fetch_compressed_embeddings(limit=20000)
+    """
+    Incremental compaction. Only interactions newer than the stored watermark
+    (plus a bounded residue of earlier unclustered rows) are considered: rows
+    close enough to an existing centroid are folded into it, and density
+    clustering runs on what is left. Assignment and HDBSCAN run on the process
+    pool. Folded rows move to the cold tier: they keep their text and chain
+    fields but drop their compressed vectors. Returns the centroids created or
+    updated.
+    """
+    pool = await create_pool()
+    async with pool.acquire() as conn:
+        # rows and centroids from another PCA model live in a different space
+        pca_version = get_projection_engine().version
+        watermark, _ = await get_job_state(conn, COMPACTION_JOB)
+        rows, new_watermark = await fetch_compaction_batch(conn, watermark or 0, pca_version)
+        centroid_rows = await conn.fetch(f"""
+            SELECT centroid_id, {raw_vector_sql('centroid_emb')}, member_count FROM centroids
+            WHERE centroid_emb IS NOT NULL AND pca_version IS NOT DISTINCT FROM $1
+        """, pca_version)
+    ids, X, sums = _unpack_rows(rows)
     if X.size == 0:
-        return
-    # subsample if large
-    max_points = 20000
-    if X.shape[0] > max_points:
-        idxs = np.random.choice(X.shape[0], max_points, replace=False)
-        X = X[idxs]
-        ids = [ids[i] for i in idxs]
-        sums = [sums[i] for i in idxs]
+        return []
+    c_ids = [str(r["centroid_id"]) for r in centroid_rows]
+    C = stack_vector_bytes([r["centroid_emb"] for r in centroid_rows], X.shape[1])
+    counts = np.array([max(int(r["member_count"] or 0), 1) for r in centroid_rows], dtype=np.float64)
 
-    X_norm = l2_normalize(X)
-    # run HDBSCAN
-    clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric='euclidean', cluster_selection_method='eom')
-    labels = clusterer.fit_predict(X_norm)
-    clusters = {}
-    for i, lbl in enumerate(labels):
+    X_norm, nearest, assigned, residue_idx, residue_labels = await run_in_process(
+        assign_and_cluster, X, C, settings.compaction_assign_max_distance, min_cluster_size)
+
+    # fold assigned rows into their centroids with a running mean
+    updates, row_centroid = [], {}
+    for c in np.unique(nearest[assigned]):
+        members = np.flatnonzero(assigned & (nearest == c))
+        n = counts[c]
+        mean = (C[c] * n + X_norm[members].sum(axis=0)) / (n + len(members))
+        refs = [ids[i] for i in members]
+        summary = " ".join(sums[i] for i in members)
+        updates.append((c_ids[c], mean.astype(np.float32), int(n) + len(members), json.dumps(refs), summary))
+        for i in members:
+            row_centroid[ids[i]] = c_ids[c]
+
+    # new clusters from the residue
+    inserts = []
+    for lbl in np.unique(residue_labels):
         if lbl == -1:
             continue
-        clusters.setdefault(lbl, []).append(i)
-
-    pool = await create_pool()
-    for lbl, idx_list in clusters.items():
-        if len(idx_list) < min_cluster_size:
+        members = residue_idx[residue_labels == lbl]
+        if len(members) < min_cluster_size:
             continue
-        chunk = X_norm[idx_list]
-        centroid = np.mean(chunk, axis=0)
-        refs = [ids[i] for i in idx_list]
-        summary = " ".join(sums[i] for i in idx_list)[:2000]
-        async with pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO centroids (label, centroid_emb, summary, refs)
-                VALUES ($1, $2::vector, $3, $4::jsonb)
-            """, f"cluster_{lbl}", centroid.tolist(), summary, json.dumps(refs))
-            # delete originals to reclaim storage
-            await conn.execute("DELETE FROM interactions WHERE id = ANY($1::uuid[])", refs)
+        centroid_id = str(uuid.uuid4())
+        refs = [ids[i] for i in members]
+        summary = " ".join(sums[i] for i in members)[:2000]
+        inserts.append((centroid_id, f"cluster_{centroid_id[:8]}", X_norm[members].mean(axis=0),
+                        summary, json.dumps(refs), len(members), pca_version))
+        for i in members:
+            row_centroid[ids[i]] = centroid_id
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if inserts:
+                await conn.executemany("""
+                    INSERT INTO centroids (centroid_id, label, centroid_emb, summary, refs, member_count, pca_version)
+                    VALUES ($1::uuid, $2, $3::vector, $4, $5::jsonb, $6, $7)
+                """, inserts)
+            if updates:
+                await conn.executemany("""
+                    UPDATE centroids SET centroid_emb = $2::vector, member_count = $3, refs = refs || $4::jsonb,
+                           summary = left(coalesce(summary, '') || ' ' || $5, 2000), updated_at = NOW()
+                    WHERE centroid_id = $1::uuid
+                """, updates)
+            if row_centroid:
+                # fold: keep text and chain fields, reclaim the compressed vectors
+                await conn.execute("""
+                    UPDATE interactions SET centroid_id = v.centroid_id, tier = 'cold',
+                           input_emb_compressed = NULL, output_emb_compressed = NULL
+                    FROM unnest($1::uuid[], $2::uuid[]) AS v(id, centroid_id)
+                    WHERE interactions.id = v.id
+                """, list(row_centroid.keys()), list(row_centroid.values()))
+            await set_job_state(conn, COMPACTION_JOB, new_watermark)
+    return [(u[0], u[1]) for u in updates] + [(i[0], i[2]) for i in inserts]
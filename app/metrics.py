@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager, contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_LATENCY = Histogram('sems_stage_latency_seconds', 'Latency of proxy pipeline stages', ['stage'])
+REQUESTS_IN_PROGRESS = Gauge('sems_requests_in_progress', 'Proxy requests currently being handled')
+POOL_ACQUIRE_WAIT = Histogram('sems_db_pool_acquire_seconds', 'Time spent waiting for a pooled Postgres connection',
+                              buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+POOL_CONNECTIONS = Gauge('sems_db_pool_connections', 'Postgres pool connections', ['state'])
+JOB_DURATION = Histogram('sems_job_duration_seconds', 'Background job run duration', ['job', 'outcome'],
+                         buckets=(.1, .5, 1, 5, 15, 30, 60, 120, 300, 600, 1800))
+JOB_SKIPPED = Counter('sems_job_skipped_total', 'Background job runs skipped because another worker held the lock', ['job'])
+LOOP_LAG = Histogram('sems_event_loop_lag_seconds', 'Extra delay of a scheduled wake-up on the event loop',
+                     buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+_trace = contextvars.ContextVar("sems_trace", default=None)
+
+def start_trace():
+    """Collect stage timings for the current request (and tasks it spawns) for a Server-Timing header."""
+    trace = []
+    _trace.set(trace)
+    return trace
+
+def server_timing(trace) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in trace)
+
+def _opted_in(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"x-server-timing":
+            return value in (b"1", b"true")
+    return False
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware for the opt-in per-request stage breakdown: send
+    `x-server-timing: 1` (or pass enabled=True, from SERVER_TIMING). Requests
+    that do not opt in go straight to the app, and opted-in ones only have a
+    Server-Timing header added to the response start, so SSE and NDJSON streams
+    are never buffered. For a streamed response the header covers the stages
+    up to the first byte.
+    """
+
+    def __init__(self, app, enabled: bool = False):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.enabled or _opted_in(scope)):
+            await self.app(scope, receive, send)
+            return
+        trace = start_trace()
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.append(("app", (time.perf_counter() - start) * 1000.0))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace).encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+def observe_stage(name: str, seconds: float):
+    STAGE_LATENCY.labels(name).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, seconds * 1000.0))
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+@contextmanager
+def track_job(job: str):
+    start, outcome = time.perf_counter(), "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        JOB_DURATION.labels(job, outcome).observe(time.perf_counter() - start)
+
+class InstrumentedPool:
+    """
+    asyncpg pool wrapper that times connection acquisition and tracks pool
+    saturation. Everything else is delegated to the wrapped pool.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._waiting = 0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def _update_gauges(self):
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        POOL_CONNECTIONS.labels("max").set(self._pool.get_max_size())
+        POOL_CONNECTIONS.labels("open").set(size)
+        POOL_CONNECTIONS.labels("in_use").set(size - idle)
+        POOL_CONNECTIONS.labels("waiting").set(self._waiting)
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        self._waiting += 1
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        finally:
+            self._waiting -= 1
+            POOL_ACQUIRE_WAIT.observe(time.perf_counter() - start)
+        self._update_gauges()
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+            self._update_gauges()
+
+    async def execute(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.executemany(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchval(*args, **kwargs)
+
+async def loop_lag_monitor(interval: float = 0.25):
+    """Sleep `interval` repeatedly and record how late each wake-up is; blocking work on the loop shows up here."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
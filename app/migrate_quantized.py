@@ -0,0 +1,119 @@
+"""
+Convert stored full embeddings to a storage mode (quantize.STORAGE), in batches,
+and refresh the atoms' sign codes.
+
+    python -m app.migrate_quantized                     # to EMBEDDING_STORAGE
+    python -m app.migrate_quantized --to int8 --batch-size 2000
+    python -m app.migrate_quantized --codes-only
+    python -m app.migrate_quantized --schema --codes-only
+
+The halfvec columns and the atoms' sign codes need pgvector >= 0.7 and the
+schema_quantized.sql migration (--schema applies it), and are only used with
+PGVECTOR_QUANTIZED=true. Set EMBEDDING_STORAGE on the API and workers first so new rows are written in
+the target mode; the readers accept every mode, so the service keeps running
+while this converts older rows. Each batch writes the target column and clears
+the others, so the tool can be interrupted and re-run. Postgres reuses the
+freed space after VACUUM; VACUUM FULL (or pg_repack) returns it to the OS.
+"""
+import argparse
+import asyncio
+import os
+import asyncpg
+from .db import DSN, create_pool
+from .quantize import STORAGE, encode_full, full_embedding, full_embedding_sql, storage_column, storage_columns
+from .settings import Settings
+
+settings = Settings()
+
+# (table, key column, full embedding column)
+TARGETS = [
+    ("interactions", "id", "input_embedding"),
+    ("interactions", "id", "output_embedding"),
+    ("atomic_tokens", "token_id", "embedding"),
+]
+
+async def migrate_column(pool, table: str, key: str, col: str, mode: str, batch_size: int) -> int:
+    target, sql_type = storage_column(col, mode)
+    others = [c for c in storage_columns(col) if c != target]
+    pending = " OR ".join(f"{c} IS NOT NULL" for c in others)
+    clear = ", ".join(f"{c} = NULL" for c in others)
+    moved, last_key = 0, None
+    while True:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT {key} AS k, {full_embedding_sql(col, 'emb')} FROM {table}
+                WHERE ({pending})
+                  AND ($1::uuid IS NULL OR {key} > $1::uuid)
+                ORDER BY {key}
+                LIMIT $2
+            """, last_key, batch_size)
+            if not rows:
+                break
+            values = await asyncio.to_thread(
+                lambda: [(r["k"], encode_full(full_embedding(r, "emb"), mode)) for r in rows])
+            # re-check the source: a row demoted by tiering meanwhile has lost its full
+            # embeddings and must not get them back
+            await conn.executemany(f"""
+                UPDATE {table} SET {target} = $2::{sql_type}, {clear}
+                WHERE {key} = $1 AND ({pending})
+            """, values)
+        moved += len(rows)
+        last_key = rows[-1]["k"]
+        print(f"{table}.{col}: {moved} rows -> {target}", flush=True)
+    return moved
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema_quantized.sql")
+
+async def apply_schema():
+    """Run schema_quantized.sql (idempotent). Done before the pool exists so its connections see the new types."""
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        ddl = f.read()
+    conn = await asyncpg.connect(DSN)
+    try:
+        await conn.execute(ddl)
+    finally:
+        await conn.close()
+
+async def refresh_codes(pool) -> str:
+    """(Re)compute atomic_tokens.embedding_bits wherever it is missing or stale."""
+    async with pool.acquire() as conn:
+        return await conn.execute("""
+            UPDATE atomic_tokens SET embedding_bits = binary_quantize(embedding_compressed)
+            WHERE embedding_compressed IS NOT NULL
+              AND embedding_bits IS DISTINCT FROM binary_quantize(embedding_compressed)
+        """)
+
+async def migrate(mode: str, batch_size: int, codes: bool = True, embeddings: bool = True, schema: bool = False):
+    if schema:
+        await apply_schema()
+        print("schema_quantized.sql applied")
+        if not settings.pgvector_quantized:
+            print("set PGVECTOR_QUANTIZED=true on the API and workers (and for this tool) to use it")
+            return
+    pool = await create_pool()
+    try:
+        if embeddings:
+            for table, key, col in TARGETS:
+                moved = await migrate_column(pool, table, key, col, mode, batch_size)
+                print(f"{table}.{col}: done, {moved} rows converted to {mode}")
+        if codes and settings.pgvector_quantized:
+            print("atomic_tokens.embedding_bits:", await refresh_codes(pool))
+        elif codes:
+            print("atomic_tokens.embedding_bits: skipped, needs PGVECTOR_QUANTIZED=true")
+    finally:
+        await pool.close()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--to", choices=sorted(STORAGE), default=settings.embedding_storage)
+    ap.add_argument("--schema", action="store_true", help="apply schema_quantized.sql first (pgvector >= 0.7)")
+    ap.add_argument("--batch-size", type=int, default=settings.quantize_batch_size)
+    group = ap.add_mutually_exclusive_group()
+    group.add_argument("--codes-only", action="store_true", help="only refresh the atoms' sign codes")
+    group.add_argument("--skip-codes", action="store_true")
+    args = ap.parse_args()
+    asyncio.run(migrate(args.to, args.batch_size, codes=not args.skip_codes, embeddings=not args.codes_only,
+                        schema=args.schema))
+
+if __name__ == "__main__":
+    main()
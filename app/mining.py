@@ -0,0 +1,157 @@
+import asyncio
+import pickle
+import zlib
+import numpy as np
+from .db import get_job_state, set_job_state
+from .executor import run_in_process
+from .settings import Settings
+
+settings = Settings()
+MINING_JOB = "bee_mining"
+NGRAM_SIZES = (1, 2, 3)
+
+_MULT = np.uint64(0x9E3779B97F4A7C15)
+_SALTS = {n: np.uint64(0xA24BAED4963EE407 * n & 0xFFFFFFFFFFFFFFFF) for n in NGRAM_SIZES}
+
+def count_ngrams(texts, ns=NGRAM_SIZES, top_m=2000):
+    """
+    Count word n-grams over a shard of texts without building n-gram strings.
+    Words are hashed (crc32) into one token array for the whole shard; n-gram
+    ids are rolling uint64 combinations, masked where they would cross a text
+    boundary. Returns (ids, counts, examples) where examples maps the shard's
+    top_m ids back to their text. Runs in a worker process.
+    """
+    words, doc = [], []
+    for d, t in enumerate(texts):
+        w = (t or "").split()
+        words.extend(w)
+        doc.extend([d] * len(w))
+    if not words:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64), {}
+    tok = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    doc = np.asarray(doc, dtype=np.int64)
+    ids, starts, sizes = [], [], []
+    with np.errstate(over="ignore"):
+        for n in ns:
+            m = len(tok) - n + 1
+            if m <= 0:
+                continue
+            h = tok[:m].copy()
+            for j in range(1, n):
+                h = h * _MULT + tok[j:j + m]
+            h ^= _SALTS[n]
+            valid = doc[:m] == doc[n - 1:n - 1 + m]
+            pos = np.flatnonzero(valid)
+            ids.append(h[pos])
+            starts.append(pos)
+            sizes.append(np.full(pos.shape[0], n, dtype=np.int64))
+    ids, starts, sizes = np.concatenate(ids), np.concatenate(starts), np.concatenate(sizes)
+    uniq, first, counts = np.unique(ids, return_index=True, return_counts=True)
+    top = np.argsort(-counts)[:top_m]
+    examples = {int(uniq[i]): " ".join(words[starts[first[i]]:starts[first[i]] + sizes[first[i]]]) for i in top}
+    return uniq, counts.astype(np.int64), examples
+
+def merge_counts(parts):
+    """Merge (ids, counts, examples) results from several shards."""
+    ids = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.uint64)
+    counts = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    uniq, inverse = np.unique(ids, return_inverse=True)
+    merged = np.bincount(inverse, weights=counts, minlength=uniq.shape[0]).astype(np.int64)
+    examples = {}
+    for p in parts:
+        examples.update(p[2])
+    return uniq, merged, examples
+
+class NgramSketch:
+    """
+    Persistent n-gram frequency sketch: a Count-Min table for estimates plus a
+    bounded heavy-hitter set (id -> text) ranked by those estimates.
+    """
+
+    def __init__(self, width: int = 1 << 18, depth: int = 4, capacity: int = 5000, seed: int = 7):
+        self.width, self.depth, self.capacity = width, depth, capacity
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63 - 1, size=depth, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63 - 1, size=depth, dtype=np.uint64)
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.heavy = {}   # id -> text
+
+    def _buckets(self, ids):
+        with np.errstate(over="ignore"):
+            return [((ids * self._a[r] + self._b[r]) >> np.uint64(32)) % np.uint64(self.width) for r in range(self.depth)]
+
+    def estimate(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.uint64)
+        if not ids.shape[0]:
+            return np.zeros(0, dtype=np.int64)
+        return np.min([self.table[r][b] for r, b in enumerate(self._buckets(ids))], axis=0).astype(np.int64)
+
+    def update(self, ids, counts, examples):
+        ids = np.asarray(ids, dtype=np.uint64)
+        for r, b in enumerate(self._buckets(ids)):
+            np.add.at(self.table[r], b.astype(np.int64), counts.astype(np.uint32))
+        # only ids that were frequent in this batch (and have text) can enter the heavy set
+        batch_top = ids[np.argsort(-counts)[:self.capacity * 2]]
+        for i in batch_top:
+            i = int(i)
+            if i in examples and i not in self.heavy:
+                self.heavy[i] = examples[i]
+        if len(self.heavy) > self.capacity:
+            keys = np.fromiter(self.heavy.keys(), dtype=np.uint64, count=len(self.heavy))
+            keep = keys[np.argsort(-self.estimate(keys))[:self.capacity]]
+            self.heavy = {int(k): self.heavy[int(k)] for k in keep}
+
+    def top(self, limit: int):
+        """Ranked (text, estimated_count) pairs."""
+        if not self.heavy:
+            return []
+        keys = np.fromiter(self.heavy.keys(), dtype=np.uint64, count=len(self.heavy))
+        est = self.estimate(keys)
+        order = np.argsort(-est)[:limit]
+        return [(self.heavy[int(keys[i])], int(est[i])) for i in order]
+
+    def dumps(self) -> bytes:
+        return zlib.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def loads(payload: bytes) -> "NgramSketch":
+        return pickle.loads(zlib.decompress(payload))
+
+async def load_sketch(conn):
+    """
+    Return (watermark, sketch) as last saved in job_state. Always read fresh:
+    another worker may have advanced both since this process last mined, and
+    folding new rows into an older copy would overwrite its counts.
+    """
+    watermark, payload = await get_job_state(conn, MINING_JOB)
+    sketch = NgramSketch.loads(payload) if payload else NgramSketch(capacity=settings.bee_sketch_capacity)
+    return watermark or 0, sketch
+
+async def mine_new_interactions(pool):
+    """
+    Fold interactions newer than the mining watermark into the persistent sketch.
+    Texts are sharded across the process pool; the sketch and watermark are
+    saved after each batch. Callers hold the job's run_exclusive lock, so the
+    state loaded here is the latest. Returns the updated sketch.
+    """
+    async with pool.acquire() as conn:
+        watermark, sketch = await load_sketch(conn)
+    while True:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT seq, input_text FROM interactions WHERE seq > $1 ORDER BY seq LIMIT $2",
+                watermark, settings.bee_batch_max)
+        if not rows:
+            break
+        texts = [r["input_text"] or "" for r in rows]
+        shards = max(1, min(settings.cpu_workers or 4, len(texts) // 500 or 1))
+        parts = await asyncio.gather(*[run_in_process(count_ngrams, texts[i::shards]) for i in range(shards)])
+        ids, counts, examples = merge_counts(parts)
+        await asyncio.to_thread(sketch.update, ids, counts, examples)
+        watermark = int(rows[-1]["seq"])
+        payload = await asyncio.to_thread(sketch.dumps)
+        async with pool.acquire() as conn:
+            await set_job_state(conn, MINING_JOB, watermark, payload)
+        if len(rows) < settings.bee_batch_max:
+            break
+    return sketch
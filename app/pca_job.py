@@ -0,0 +1,306 @@
+import asyncio
+import glob
+import os
+import pickle
+import re
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+from .binder import binder_index
+from .db import create_pool, get_job_state, run_exclusive, set_job_state
+from .memory_manager import (BATCH_SIZE, PCA_JOB, PCA_PATH, basis_change, compress_embeddings, get_projection_engine,
+                             write_pickle_atomic)
+from .quantize import full_embedding, full_embedding_sql, has_full_embedding_sql, sign_bits, stores_sign_codes
+from .settings import Settings
+from .vector_codec import raw_vector_sql, stack_vector_bytes, stack_vectors
+
+settings = Settings()
+
+# (table, key column, ((full embedding column, compressed column, sign-code column), ...), guard).
+# All columns of a table are brought to a version by one UPDATE, since pca_version is per row.
+# Atoms first: the binder reloads once they are all at the new version. The guard keeps
+# rows folded into a centroid meanwhile from getting their compressed vectors back.
+REPROJECT_TARGETS = [
+    ("atomic_tokens", "token_id", (("embedding", "embedding_compressed", "embedding_bits"),), None),
+    ("interactions", "id", (("input_embedding", "input_emb_compressed", None),
+                            ("output_embedding", "output_emb_compressed", None)), "centroid_id IS NULL"),
+]
+
+def model_path(version: int) -> str:
+    return os.path.join(settings.pca_model_dir, f"pca_v{version}.pkl")
+
+def load_model_version(version):
+    """The saved model for `version`, or None if its file is gone."""
+    try:
+        with open(model_path(version), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+def latest_model_version() -> int:
+    versions = [int(m.group(1)) for p in glob.glob(os.path.join(settings.pca_model_dir, "pca_v*.pkl"))
+                for m in [re.search(r"pca_v(\d+)\.pkl$", p)] if m]
+    return max(versions, default=0)
+
+async def fit_pca_from_db(pool, compressed_dim=settings.compressed_dim):
+    """
+    Stream input_embedding rows through IncrementalPCA.partial_fit using a
+    server-side cursor. partial_fit runs in a worker thread so the event loop
+    keeps serving; batches smaller than n_components are carried over.
+    """
+    ipca = IncrementalPCA(n_components=compressed_dim, batch_size=BATCH_SIZE)
+    buf, fitted = [], 0
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            cursor = conn.cursor(f"SELECT {full_embedding_sql('input_embedding', 'emb')} FROM interactions "
+                                 f"WHERE {has_full_embedding_sql('input_embedding')}",
+                                 prefetch=settings.pca_fit_batch_size)
+            async for r in cursor:
+                buf.append(full_embedding(r, "emb"))
+                if len(buf) >= settings.pca_fit_batch_size:
+                    await asyncio.to_thread(ipca.partial_fit, stack_vectors(buf))
+                    fitted += len(buf)
+                    buf = []
+    if len(buf) >= compressed_dim:
+        await asyncio.to_thread(ipca.partial_fit, stack_vectors(buf))
+        fitted += len(buf)
+    return ipca if fitted else None
+
+def save_model_version(ipca, version: int) -> str:
+    ipca.sems_version = version
+    path = model_path(version)
+    write_pickle_atomic(ipca, path)
+    return path
+
+def promote_model_version(version: int):
+    """Make a saved version the one the projection engine serves (atomic replace of PCA_PATH)."""
+    with open(model_path(version), "rb") as f:
+        data = f.read()
+    tmp_path = PCA_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, PCA_PATH)
+
+class BasisMaps:
+    """basis_change maps into one model version, computed once per source version."""
+
+    def __init__(self, ipca):
+        self.ipca = ipca
+        self._maps = {}
+
+    def get(self, version):
+        """(A, b) from `version` (None: truncation fallback), or None when that model is gone."""
+        if version not in self._maps:
+            old = None if version is None else load_model_version(version)
+            self._maps[version] = None if version is not None and old is None else basis_change(old, self.ipca)
+        return self._maps[version]
+
+def _reproject_rows(rows, columns, version, maps):
+    """
+    UPDATE parameters for a batch: each compressed column is projected from its
+    full embedding when the row still has one, and otherwise mapped from the
+    row's old basis. A row with a value that cannot be mapped (its model file
+    is gone) is left at its old version, untouched. Runs in a worker thread.
+    """
+    out = {}
+    for j, _ in enumerate(columns):
+        embs = [full_embedding(r, f"emb{j}") for r in rows]
+        have = [i for i, e in enumerate(embs) if e is not None]
+        if have:
+            out.update({(i, j): c for i, c in zip(have, compress_embeddings(stack_vectors([embs[i] for i in have])))})
+    params = []
+    for i, r in enumerate(rows):
+        p = [r["k"], version, r["v"]]
+        for j, (_, _, bits_col) in enumerate(columns):
+            c = out.get((i, j))
+            if c is None and r[f"c{j}"] is not None:
+                m = maps.get(r["v"])
+                if m is None:
+                    break
+                c = stack_vector_bytes([r[f"c{j}"]])[0] @ m[0] + m[1]
+            p.append(c)
+            if bits_col:
+                p.append(None if c is None else sign_bits(c))
+        else:
+            params.append(p)
+    return params
+
+async def reproject_compressed(pool, version: int, ipca):
+    """
+    Bring every *_compressed column to model `version`, in keyset-paginated
+    batches: from the stored full embedding where there is one, otherwise by
+    mapping the old vector into the new basis (basis_change), so warm rows and
+    atoms whose full embeddings were dropped stay usable. A row's pca_version
+    moves only together with all its compressed columns. Centroids follow in
+    remap_centroids.
+    """
+    engine = get_projection_engine()
+    engine.reload()
+    maps = BasisMaps(ipca)
+    updated = 0
+    for table, key, columns, guard in REPROJECT_TARGETS:
+        columns = [(full_col, comp_col, bits_col if stores_sign_codes() else None)
+                   for full_col, comp_col, bits_col in columns]
+        select = ", ".join([full_embedding_sql(full_col, f"emb{j}") for j, (full_col, _, _) in enumerate(columns)] +
+                           [raw_vector_sql(comp_col, f"c{j}") for j, (_, comp_col, _) in enumerate(columns)])
+        pending = " OR ".join([has_full_embedding_sql(full_col) for full_col, _, _ in columns] +
+                              [f"{comp_col} IS NOT NULL" for _, comp_col, _ in columns])
+        sets, n = [], 4
+        for _, comp_col, bits_col in columns:
+            sets.append(f"{comp_col} = ${n}::vector")
+            n += 1
+            if bits_col:
+                sets.append(f"{bits_col} = ${n}")
+                n += 1
+        update_sql = (f"UPDATE {table} SET {', '.join(sets)}, pca_version = $2 "
+                      f"WHERE {key} = $1 AND pca_version IS NOT DISTINCT FROM $3" + (f" AND {guard}" if guard else ""))
+        last_key = None
+        while True:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {key} AS k, pca_version AS v, {select} FROM {table}
+                    WHERE ({pending}) AND pca_version IS DISTINCT FROM $1
+                      AND ($2::uuid IS NULL OR {key} > $2::uuid)
+                    ORDER BY {key}
+                    LIMIT $3
+                """, version, last_key, settings.pca_reproject_batch_size)
+                if not rows or engine.version != version:
+                    # done, or a newer model was promoted meanwhile (its own pass takes over)
+                    break
+                params = await asyncio.to_thread(_reproject_rows, rows, columns, version, maps)
+                if params:
+                    await conn.executemany(update_sql, params)
+            updated += len(params)
+            last_key = rows[-1]["k"]
+    return updated + await remap_centroids(pool, version, maps)
+
+async def remap_centroids(pool, version: int, maps: BasisMaps) -> int:
+    """
+    Map centroids from older models into the new basis. A centroid is a mean of
+    unit vectors, so only its direction is mapped (the models' mean offset does
+    not apply) and its length, which reflects how spread its members are, is
+    kept. updated_at is bumped so the API's cold-memory refresh picks them up.
+    """
+    updated, last_key = 0, None
+    while True:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT centroid_id AS k, pca_version AS v, {raw_vector_sql('centroid_emb')} FROM centroids
+                WHERE centroid_emb IS NOT NULL AND pca_version IS DISTINCT FROM $1
+                  AND ($2::uuid IS NULL OR centroid_id > $2::uuid)
+                ORDER BY centroid_id
+                LIMIT $3
+            """, version, last_key, settings.pca_reproject_batch_size)
+            if not rows or get_projection_engine().version != version:
+                break
+            params = []
+            for r in rows:
+                m = maps.get(r["v"])
+                if m is None:
+                    continue
+                c = stack_vector_bytes([r["centroid_emb"]])[0]
+                mapped = c @ m[0]
+                mapped *= np.linalg.norm(c) / (np.linalg.norm(mapped) + 1e-12)
+                params.append((r["k"], version, r["v"], mapped.astype(np.float32)))
+            if params:
+                await conn.executemany("""
+                    UPDATE centroids SET centroid_emb = $4::vector, pca_version = $2, updated_at = NOW()
+                    WHERE centroid_id = $1 AND pca_version IS NOT DISTINCT FROM $3
+                """, params)
+        updated += len(params)
+        last_key = rows[-1]["k"]
+    return updated
+
+def current_model():
+    """The promoted model (PCA_PATH), or None before the first fit."""
+    try:
+        with open(PCA_PATH, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+def retained_variance(ipca, X) -> float:
+    """Share of X's variance that survives a round trip through `ipca` (comparable to explained_variance_ratio_.sum())."""
+    X = np.asarray(X, dtype=np.float64)
+    residual = X - ipca.inverse_transform(ipca.transform(X))
+    total = ((X - X.mean(axis=0)) ** 2).sum()
+    return float(1.0 - (residual ** 2).sum() / total) if total else 1.0
+
+async def sample_full_embeddings(pool, n: int):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {full_embedding_sql('input_embedding', 'emb')} FROM interactions
+            WHERE seq IS NOT NULL AND {has_full_embedding_sql('input_embedding')}
+            ORDER BY seq DESC
+            LIMIT $1
+        """, n)
+    return stack_vectors([full_embedding(r, "emb") for r in rows])
+
+async def refit_pca(pool=None):
+    """
+    Fit a new model version from the database if enough new data arrived and
+    the current model no longer fits it, promote it and re-project. A pass
+    interrupted before it finished is resumed on the next run.
+    """
+    pool = pool or await create_pool()
+    async with pool.acquire() as conn:
+        last_seq, done = await get_job_state(conn, PCA_JOB)
+        head = await conn.fetchrow(f"SELECT max(seq) AS seq, count(*) FILTER (WHERE {has_full_embedding_sql('input_embedding')}) AS cnt "
+                                  "FROM interactions")
+    max_seq, rows = int(head["seq"] or 0), int(head["cnt"] or 0)
+    engine = get_projection_engine()
+    engine.reload()
+    current = current_model() if engine.loaded else None
+    if current is not None and engine.version and done != str(engine.version).encode():
+        updated = await reproject_compressed(pool, engine.version, current)
+        await _pass_done(pool, engine.version, updated)
+    if rows < settings.pca_min_rows:
+        return None
+    if last_seq is not None and current is not None and max_seq - last_seq < settings.pca_min_new_rows:
+        return None
+    if current is not None:
+        # a model that still explains the new rows as well as its own training data is
+        # kept: a refit would only churn every compressed vector for no gain
+        X = await sample_full_embeddings(pool, settings.pca_drift_sample)
+        fitted = float(np.sum(current.explained_variance_ratio_))
+        now = await asyncio.to_thread(retained_variance, current, X)
+        if fitted - now < settings.pca_variance_tolerance:
+            async with pool.acquire() as conn:
+                await set_job_state(conn, PCA_JOB, max_seq)
+            print(f"PCA model v{engine.version} kept: retains {now:.3f} of new rows' variance (fit: {fitted:.3f})")
+            return None
+        if not os.path.exists(model_path(engine.version or 0)):
+            # an unversioned model (mounted or fitted offline): keep it so its rows can be mapped
+            save_model_version(current, engine.version or 0)
+    ipca = await fit_pca_from_db(pool)
+    if ipca is None:
+        return None
+    version = latest_model_version() + 1
+    save_model_version(ipca, version)
+    promote_model_version(version)
+    async with pool.acquire() as conn:
+        await set_job_state(conn, PCA_JOB, max_seq, b"")
+    updated = await reproject_compressed(pool, version, ipca)
+    await _pass_done(pool, version, updated)
+    if binder_index.ready:
+        await binder_index.load(pool)
+    return version
+
+async def _pass_done(pool, version: int, updated: int):
+    """Record that every row that can be brought to `version` has been (unless a newer model took over)."""
+    if get_projection_engine().version != version:
+        return
+    async with pool.acquire() as conn:
+        watermark, _ = await get_job_state(conn, PCA_JOB)
+        await set_job_state(conn, PCA_JOB, watermark or 0, str(version).encode())
+    print(f"PCA model v{version}: {updated} vectors re-projected or mapped")
+
+async def pca_loop():
+    pool = await create_pool()
+    while True:
+        try:
+            await run_exclusive(pool, PCA_JOB, lambda: refit_pca(pool))
+        except Exception as e:
+            print("PCA fit error", e)
+        await asyncio.sleep(settings.pca_refit_interval_seconds)
@@ -0,0 +1,53 @@
+from .binder import maybe_rewrite_prompt
+from .cold_memory import cold_memory_index, memory_context
+from .db import new_interaction_record
+from .memory_manager import get_projection_engine
+from .metrics import stage
+from .router import model_router
+from .settings import Settings
+
+settings = Settings()
+
+def prepare_call(prompt, input_emb, input_emb_c, binder_candidates, cache_key=None,
+                 use_memory=False, max_latency_ms=None, tier=None):
+    """
+    Rewrite, memory lookup and routing for one prompt whose embedding and
+    binder candidates are known. Returns (upstream prompt, model, context).
+    `cache_key` is None when the reply must not be cached.
+    """
+    with stage("rewrite"):
+        rewritten_prompt, rewrite_meta = maybe_rewrite_prompt(prompt, binder_candidates)
+    with stage("memory"):
+        memories = cold_memory_index.search(input_emb_c, settings.cold_memory_top_k, settings.cold_memory_min_similarity)
+    if use_memory:
+        rewritten_prompt = memory_context(rewritten_prompt, memories)
+    with stage("route"):
+        model, route_reason = model_router.choose(rewritten_prompt, rewrite_meta, binder_candidates,
+                                                  max_latency_ms=max_latency_ms, tier=tier)
+    context = {"prompt": prompt, "input_emb": input_emb, "input_emb_c": input_emb_c,
+               "binder_candidates": binder_candidates, "rewrite_meta": rewrite_meta,
+               "memories": memories, "route_reason": route_reason, "cache_key": cache_key,
+               "tier": tier}
+    return rewritten_prompt, model, context
+
+def interaction_record(context, output_text, provider_resp, model):
+    """Interaction row for a completed call; output embeddings are filled in by the caller."""
+    binder_candidates, rewrite_meta = context["binder_candidates"], context["rewrite_meta"]
+    summary = (output_text[:512] + '...') if len(output_text) > 512 else output_text
+    # determine essence_refs: collect essence_id(s) from binder candidates and rewrite metadata
+    essence_refs = [c["essence_id"] for c in binder_candidates if c.get("essence_id")]
+    essence_refs.extend(rewrite_meta.get("essences", []))
+    # dedupe
+    essence_refs = list(dict.fromkeys([e for e in essence_refs if e]))
+    return new_interaction_record(context["prompt"], output_text, context["input_emb"], None,
+                                  context["input_emb_c"], None, summary, [c['label'] for c in binder_candidates],
+                                  essence_refs, provider_resp,
+                                  {"rewrite": rewrite_meta, "memory": [m["centroid_id"] for m in context["memories"]],
+                                   "model": model, "route": context["route_reason"]},
+                                  pca_version=get_projection_engine().version)
+
+def proxy_result(record, context, model):
+    return {"output": record["output_text"], "interaction_id": record["id"], "seq": record["seq"],
+            "merkle_root": record["merkle_root"], "binder_used": context["rewrite_meta"], "model": model,
+            "memory": [{"centroid_id": m["centroid_id"], "similarity": m["similarity"], "summary": m["summary"]}
+                       for m in context["memories"]]}
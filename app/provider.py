@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import json
+import httpx
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from .settings import Settings
+
+settings = Settings()
+
+_client = None
+_inflight = {}
+
+def _headers():
+    return {"Authorization": f"Bearer {settings.provider_api_key}"}
+
+async def start_client():
+    """Create the shared provider client; called from the app startup hook."""
+    global _client
+    if _client is None:
+        limits = httpx.Limits(max_connections=settings.provider_max_connections,
+                              max_keepalive_connections=settings.provider_max_keepalive,
+                              keepalive_expiry=30.0)
+        _client = httpx.AsyncClient(http2=settings.provider_http2, limits=limits, headers=_headers(),
+                                    timeout=httpx.Timeout(settings.llm_timeout_seconds, connect=5.0))
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("provider client not started")
+    return _client
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+provider_retry = retry(
+    retry=retry_if_exception(_is_retryable),
+    stop=stop_after_attempt(settings.provider_max_attempts),
+    wait=wait_random_exponential(multiplier=0.2, max=4.0),
+    reraise=True,
+)
+
+@provider_retry
+async def _post(url: str, payload: dict, timeout: float):
+    r = await get_client().post(url, json=payload, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+async def _coalesced(key: str, factory):
+    """Share one in-flight upstream call between concurrent callers with the same key."""
+    fut = _inflight.get(key)
+    if fut is not None:
+        return await asyncio.shield(fut)
+    fut = asyncio.ensure_future(factory())
+    _inflight[key] = fut
+
+    def _done(f):
+        _inflight.pop(key, None)
+        if not f.cancelled():
+            f.exception()   # mark retrieved even if every waiter was cancelled
+    fut.add_done_callback(_done)
+    return await asyncio.shield(fut)
+
+async def provider_embedding_call(text: str):
+    payload = {"model": settings.embedding_model, "input": text}
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def call():
+        data = await _post(settings.embedding_url, payload, settings.embedding_timeout_seconds)
+        return data["data"][0]["embedding"]
+    return await _coalesced(key, call)
+
+async def provider_embedding_batch(texts):
+    """Embed several inputs in one upstream call; results come back in input order."""
+    payload = {"model": settings.embedding_model, "input": list(texts)}
+    data = await _post(settings.embedding_url, payload, settings.embedding_timeout_seconds)
+    items = sorted(data["data"], key=lambda d: d.get("index", 0))
+    return [d["embedding"] for d in items]
+
+async def provider_llm_call(prompt: str, model: str = None):
+    payload = {"model": model or settings.llm_model_large, "messages": [{"role": "user", "content": prompt}]}
+    return await _post(settings.llm_url, payload, settings.llm_timeout_seconds)
+
+async def provider_llm_stream(prompt: str, model: str = None):
+    """
+    Stream a chat completion, yielding content deltas as they arrive. Not
+    retried: once chunks have been forwarded the stream cannot be replayed.
+    """
+    payload = {"model": model or settings.llm_model_large, "stream": True,
+               "messages": [{"role": "user", "content": prompt}]}
+    async with get_client().stream("POST", settings.llm_url, json=payload, timeout=settings.llm_timeout_seconds) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
@@ -0,0 +1,91 @@
+"""
+Quantized vector storage.
+
+Full (input_dim) embeddings are stored according to `embedding_storage`:
+
+    float32   vector(1536) in <col>                      4 bytes/dim
+    halfvec   halfvec(1536) in <col>_h                   2 bytes/dim (2x smaller)
+    int8      bytea in <col>_q: float32 scale + int8     1 byte/dim  (4x smaller)
+
+Readers go through full_embedding_sql/full_embedding, which accept any of the
+available modes, so rows written before a switch (or before migrate_quantized
+has reached them) stay readable. With `binary_codes` the resident indexes
+search sign codes before re-ranking on the float vectors.
+
+The halfvec columns and the atoms' sign codes (atomic_tokens.embedding_bits,
+bit(256), 32x smaller than float32, used as a Hamming prefilter by the SQL
+binder fallback) need pgvector >= 0.7. They live in schema_quantized.sql and
+are only used once `pgvector_quantized` says that migration was applied.
+"""
+import struct
+import numpy as np
+from .settings import Settings
+
+settings = Settings()
+
+# mode -> (column suffix, SQL type)
+STORAGE = {"float32": ("", "vector"), "halfvec": ("_h", "halfvec"), "int8": ("_q", "bytea")}
+
+_SCALE = struct.Struct(">f")
+
+def storage_modes():
+    """Storage modes the schema has columns for."""
+    return [m for m in STORAGE if m != "halfvec" or settings.pgvector_quantized]
+
+def storage_column(col: str, mode: str = None):
+    """(column name, SQL type) holding full embedding `col` under `mode` (default embedding_storage)."""
+    mode = mode or settings.embedding_storage
+    if mode not in storage_modes():
+        raise ValueError(f"embedding storage {mode!r} needs schema_quantized.sql and PGVECTOR_QUANTIZED=true")
+    suffix, sql_type = STORAGE[mode]
+    return col + suffix, sql_type
+
+def storage_columns(col: str):
+    return [col + STORAGE[m][0] for m in storage_modes()]
+
+def stores_sign_codes() -> bool:
+    """Whether atoms keep embedding_bits for the SQL Hamming prefilter."""
+    return settings.binary_codes and settings.pgvector_quantized
+
+def quantize_int8(x) -> bytes:
+    """Symmetric per-vector int8: scale = max|x| / 127, stored ahead of the codes."""
+    x = np.asarray(x, dtype=np.float32)
+    scale = float(np.abs(x).max()) / 127.0 if x.size else 0.0
+    q = np.zeros(x.shape, dtype=np.int8) if scale == 0.0 else np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+    return _SCALE.pack(scale) + q.tobytes()
+
+def dequantize_int8(data: bytes) -> np.ndarray:
+    (scale,) = _SCALE.unpack_from(data)
+    return np.frombuffer(data, dtype=np.int8, offset=_SCALE.size).astype(np.float32) * scale
+
+def encode_full(x, mode: str = None):
+    """Parameter value for the storage column of a full embedding."""
+    if x is None:
+        return None
+    if (mode or settings.embedding_storage) == "int8":
+        return quantize_int8(x)
+    return np.asarray(x, dtype=np.float32)
+
+def full_embedding_sql(col: str, alias: str = None) -> str:
+    """Select-list fragment reading full embedding `col` whatever it is stored as; decode with full_embedding()."""
+    alias = alias or col
+    full = f"coalesce({col}, {col}_h::vector)" if settings.pgvector_quantized else col
+    return f"{full} AS {alias}, {col}_q AS {alias}_q"
+
+def has_full_embedding_sql(col: str) -> str:
+    return "(" + " OR ".join(f"{c} IS NOT NULL" for c in storage_columns(col)) + ")"
+
+def full_embedding(row, alias: str):
+    if row[alias] is not None:
+        return row[alias]
+    if row[alias + "_q"] is not None:
+        return dequantize_int8(row[alias + "_q"])
+    return None
+
+def sign_bits(x) -> np.ndarray:
+    """Binary quantization (as pgvector's binary_quantize): one bit per dimension, set where x > 0."""
+    return np.asarray(x) > 0
+
+def sign_codes(X) -> np.ndarray:
+    """Packed sign codes of an (N, dim) matrix, (N, dim / 8) uint8 as FAISS binary indexes expect."""
+    return np.packbits(np.asarray(X) > 0, axis=1)
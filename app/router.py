@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from prometheus_client import Counter, Histogram
+from .provider import _is_retryable, provider_llm_call, provider_llm_stream
+from .scoring import estimate_tokens
+from .settings import Settings
+
+settings = Settings()
+
+ROUTER_DECISIONS = Counter('sems_router_decisions_total', 'Model routing decisions', ['model', 'reason'])
+ROUTER_FALLBACKS = Counter('sems_router_fallbacks_total', 'Calls retried on the other model', ['from_model'])
+LLM_LATENCY = Histogram('sems_llm_latency_seconds', 'Upstream LLM call latency by model', ['model'])
+LLM_FIRST_CHUNK = Histogram('sems_llm_first_chunk_seconds', 'Time to the first streamed chunk by model', ['model'])
+
+class ModelStats:
+    """Rolling latency and error window for one model."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)   # (latency_seconds, ok)
+
+    def record(self, latency: float, ok: bool):
+        self._samples.append((latency, ok))
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        latencies = sorted(l for l, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+class ModelRouter:
+    """
+    Picks llm_model_small or llm_model_large per request from cheap signals
+    (explicit tier, latency budget, prompt length, binder rewrite and
+    similarity) and the models' rolling health, then calls it with a timeout
+    and falls back to the other model on timeout or upstream failure.
+    """
+
+    def __init__(self, small: str, large: str, window: int = 200):
+        self.small, self.large = small, large
+        self.stats = {small: ModelStats(window), large: ModelStats(window)}
+
+    def other(self, model: str) -> str:
+        return self.large if model == self.small else self.small
+
+    def _healthy(self, model: str) -> bool:
+        s = self.stats[model]
+        return s.count < settings.router_min_samples or s.error_rate() <= settings.router_max_error_rate
+
+    def choose(self, prompt: str, rewrite_meta: Dict = None, binder_candidates: List[Dict] = None,
+               max_latency_ms: float = None, tier: str = None):
+        """Return (model, reason)."""
+        if tier in ("small", "fast"):
+            model, reason = self.small, "tier"
+        elif tier in ("large", "quality"):
+            model, reason = self.large, "tier"
+        else:
+            model, reason = self.small, "default"
+            tokens = estimate_tokens(prompt)
+            top = (binder_candidates or [None])[0]
+            familiar = bool((rewrite_meta or {}).get("rewritten")) or (
+                top is not None and top.get("distance") is not None
+                and top["distance"] <= settings.router_binder_max_distance)
+            if tokens >= settings.router_large_prompt_tokens and not familiar:
+                model, reason = self.large, "prompt_length"
+            if model == self.large and max_latency_ms is not None:
+                p95 = self.stats[self.large].latency_quantile(0.95)
+                if p95 is not None and p95 * 1000.0 > max_latency_ms:
+                    model, reason = self.small, "latency_budget"
+        if not self._healthy(model) and self._healthy(self.other(model)):
+            model, reason = self.other(model), "error_rate"
+        ROUTER_DECISIONS.labels(model, reason).inc()
+        return model, reason
+
+    def observe(self, model: str, latency: float, ok: bool):
+        self.stats[model].record(latency, ok)
+        if ok:
+            LLM_LATENCY.labels(model).observe(latency)
+
+    def _fallback(self, model: str, exc: BaseException) -> str:
+        """The model to retry on after `exc`, or re-raise if the error would recur there too."""
+        if not isinstance(exc, asyncio.TimeoutError) and not _is_retryable(exc):
+            raise exc
+        fallback = self.other(model)
+        print("LLM call failed on", model, "falling back to", fallback, repr(exc))
+        ROUTER_FALLBACKS.labels(model).inc()
+        return fallback
+
+    async def _timed_call(self, prompt: str, model: str, timeout: float):
+        start = time.perf_counter()
+        try:
+            resp = await asyncio.wait_for(provider_llm_call(prompt, model=model), timeout)
+        except Exception:
+            self.observe(model, time.perf_counter() - start, False)
+            raise
+        self.observe(model, time.perf_counter() - start, True)
+        return resp
+
+    async def call(self, prompt: str, model: str, max_latency_ms: float = None):
+        """Call `model`, falling back to the other one on timeout or a retryable upstream error. Returns (response, model used)."""
+        timeout = max_latency_ms / 1000.0 if max_latency_ms else settings.llm_timeout_seconds
+        try:
+            return await self._timed_call(prompt, model, timeout), model
+        except Exception as e:
+            fallback = self._fallback(model, e)
+        return await self._timed_call(prompt, fallback, settings.llm_timeout_seconds), fallback
+
+    async def stream(self, prompt: str, model: str, max_latency_ms: float = None):
+        """
+        Yield (model, delta) pairs from a streamed completion. If `model` fails
+        or sends nothing within the budget before its first chunk, the other
+        model is streamed instead; after the first chunk errors propagate.
+        """
+        timeout = max_latency_ms / 1000.0 if max_latency_ms else settings.llm_timeout_seconds
+        for attempt in range(2):
+            start = time.perf_counter()
+            chunks = provider_llm_stream(prompt, model=model)
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                self.observe(model, time.perf_counter() - start, True)
+                return
+            except Exception as e:
+                self.observe(model, time.perf_counter() - start, False)
+                await chunks.aclose()
+                if attempt:
+                    raise
+                model, timeout = self._fallback(model, e), settings.llm_timeout_seconds
+                continue
+            LLM_FIRST_CHUNK.labels(model).observe(time.perf_counter() - start)
+            try:
+                yield model, first
+                async for delta in chunks:
+                    yield model, delta
+            except Exception:
+                self.observe(model, time.perf_counter() - start, False)
+                raise
+            else:
+                self.observe(model, time.perf_counter() - start, True)
+            finally:
+                # a client disconnect (GeneratorExit / CancelledError) records nothing:
+                # it says nothing about the model's health
+                await chunks.aclose()
+            return
+
+model_router = ModelRouter(settings.llm_model_small, settings.llm_model_large, settings.router_window)
@@ -13,10 +13,13 @@ CREATE INDEX IF NOT EXISTS idx_essence_signature ON essences (signature);
 -- interactions table (hot + compressed)
 CREATE TABLE IF NOT EXISTS interactions (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  seq BIGINT UNIQUE,             -- position in the Merkle chain, assigned by the in-process sequencer
   input_text TEXT,
   output_text TEXT,
   input_embedding vector(1536),
   output_embedding vector(1536),
+  input_embedding_q BYTEA,           -- EMBEDDING_STORAGE=int8: float32 scale + 1536 int8 (halfvec: schema_quantized.sql)
+  output_embedding_q BYTEA,
   input_emb_compressed vector(256),
   output_emb_compressed vector(256),
   text_summary TEXT,
@@ -26,11 +29,37 @@ CREATE TABLE IF NOT EXISTS interactions (
   usage_score FLOAT DEFAULT 1.0,
   merkle_root TEXT NOT NULL,
   provider_response JSONB,
-  metadata JSONB
+  metadata JSONB,
+  centroid_id UUID,              -- set once compaction folds the row into a centroid
+  tier TEXT DEFAULT 'hot',       -- hot (full embeddings) | warm (compressed only, payload archived) | cold (folded into a centroid)
+  pca_version INT                -- PCA model that produced the *_emb_compressed columns (NULL = truncation fallback)
 );
 CREATE INDEX IF NOT EXISTS idx_input_embedding ON interactions USING ivfflat (input_embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_input_emb_compressed ON interactions USING ivfflat (input_emb_compressed vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_timestamp ON interactions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_tier ON interactions (tier, timestamp) WHERE tier <> 'cold';
+
+-- provider payloads of demoted interactions, zlib-compressed JSON
+CREATE TABLE IF NOT EXISTS interaction_archive (
+  id UUID PRIMARY KEY,
+  provider_response_z BYTEA NOT NULL,
+  archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- verified positions in the interaction chain; verification resumes after the latest one
+CREATE TABLE IF NOT EXISTS chain_checkpoints (
+  seq BIGINT PRIMARY KEY,
+  merkle_root TEXT NOT NULL,
+  verified_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- watermarks and persisted state for incremental background jobs
+CREATE TABLE IF NOT EXISTS job_state (
+  job TEXT PRIMARY KEY,
+  watermark BIGINT,              -- highest interactions.seq already processed
+  payload BYTEA,                 -- job-specific state (e.g. sketches)
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
 
 -- atomic tokens (binder)
 CREATE TABLE IF NOT EXISTS atomic_tokens (
@@ -40,10 +69,12 @@ CREATE TABLE IF NOT EXISTS atomic_tokens (
   base_repr TEXT,
   meaning TEXT,
   embedding vector(1536),
+  embedding_q BYTEA,
   embedding_compressed vector(256),
   provenance TEXT,
   version INT DEFAULT 1,
   trust_score FLOAT DEFAULT 0.5,
+  pca_version INT,
   created_at TIMESTAMPTZ DEFAULT NOW()
 );
 CREATE INDEX IF NOT EXISTS idx_atomic_embedding ON atomic_tokens USING ivfflat (embedding vector_cosine_ops);
@@ -56,21 +87,27 @@ CREATE TABLE IF NOT EXISTS centroids (
   centroid_emb vector(256),
   summary TEXT,
   refs JSONB DEFAULT '[]'::jsonb,
-  created_at TIMESTAMPTZ DEFAULT NOW()
+  member_count INT DEFAULT 0,
+  pca_version INT,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 CREATE INDEX IF NOT EXISTS idx_centroid_emb ON centroids USING ivfflat (centroid_emb vector_cosine_ops);
 
 -- rebase proposals (BEE)
 CREATE TABLE IF NOT EXISTS rebase_proposals (
   proposal_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  signature TEXT UNIQUE,         -- sha256 of the whitespace-normalised pattern; one row per pattern
   candidate_atoms JSONB,
   compression_gain FLOAT,
   predictive_delta FLOAT,
   causal_utility FLOAT,
   safety_risks JSONB,
-  status TEXT DEFAULT 'pending',
-  created_at TIMESTAMPTZ DEFAULT NOW()
+  status TEXT DEFAULT 'pending',  -- pending | needs_review | approved | rejected | expired
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  last_seen_at TIMESTAMPTZ DEFAULT NOW()
 );
+CREATE INDEX IF NOT EXISTS idx_proposals_pending ON rebase_proposals (last_seen_at) WHERE status = 'pending';
 
 -- governance users & audit
 CREATE TABLE IF NOT EXISTS governance_users (
@@ -96,3 +133,21 @@ CREATE TABLE IF NOT EXISTS governance_policies (
   policy_json JSONB NOT NULL,
   created_at TIMESTAMPTZ DEFAULT NOW()
 );
+
+-- upgrades for databases created from an earlier version of this file
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS seq BIGINT UNIQUE;
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS centroid_id UUID;
+ALTER TABLE centroids ADD COLUMN IF NOT EXISTS member_count INT DEFAULT 0;
+ALTER TABLE centroids ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS pca_version INT;
+ALTER TABLE atomic_tokens ADD COLUMN IF NOT EXISTS pca_version INT;
+ALTER TABLE centroids ADD COLUMN IF NOT EXISTS pca_version INT;
+ALTER TABLE rebase_proposals ADD COLUMN IF NOT EXISTS signature TEXT UNIQUE;
+ALTER TABLE rebase_proposals ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_proposals_pending ON rebase_proposals (last_seen_at) WHERE status = 'pending';
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS tier TEXT DEFAULT 'hot';
+UPDATE interactions SET tier = 'cold' WHERE centroid_id IS NOT NULL AND tier = 'hot';
+CREATE INDEX IF NOT EXISTS idx_interactions_tier ON interactions (tier, timestamp) WHERE tier <> 'cold';
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS input_embedding_q BYTEA;
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS output_embedding_q BYTEA;
+ALTER TABLE atomic_tokens ADD COLUMN IF NOT EXISTS embedding_q BYTEA;
@@ -0,0 +1,12 @@
+-- Optional quantized storage (needs pgvector >= 0.7). Apply after schema.sql, then set
+-- PGVECTOR_QUANTIZED=true on the API and workers:
+--   python -m app.migrate_quantized --schema      (or psql -f app/schema_quantized.sql)
+
+-- EMBEDDING_STORAGE=halfvec
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS input_embedding_h halfvec(1536);
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS output_embedding_h halfvec(1536);
+ALTER TABLE atomic_tokens ADD COLUMN IF NOT EXISTS embedding_h halfvec(1536);
+
+-- sign bits of embedding_compressed (BINARY_CODES): Hamming prefilter for the SQL binder fallback
+ALTER TABLE atomic_tokens ADD COLUMN IF NOT EXISTS embedding_bits bit(256);
+CREATE INDEX IF NOT EXISTS idx_atomic_emb_bits ON atomic_tokens USING hnsw (embedding_bits bit_hamming_ops);
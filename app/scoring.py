@@ -0,0 +1,123 @@
+import bisect
+import ahocorasick
+
+def atom_marker(label: str) -> str:
+    return f"<ATOM:{label}>"
+
+def estimate_tokens(text: str) -> int:
+    # ~4 bytes per token for English/code under BPE tokenizers
+    return max(1, (len(text.encode("utf-8")) + 3) // 4)
+
+PROMOTED_TRUST = 0.8   # trust_score of an atom promoted through /v1/approve
+
+def select_rewrites(spans):
+    """
+    Pick non-overlapping (start, end, info) spans greedily by value (bytes
+    saved by the marker, weighted by info["score"]); end is exclusive. Returns
+    the chosen spans in prompt order.
+    """
+    scored = []
+    for start, end, info in spans:
+        saved = (end - start) - len(atom_marker(info["label"]))
+        if saved > 0:
+            scored.append((saved * info["score"], start, end, info))
+    scored.sort(key=lambda s: (-s[0], s[1]))
+    starts, ends, chosen = [], [], []
+    for value, start, end, info in scored:
+        i = bisect.bisect_left(starts, start)
+        if (i > 0 and ends[i - 1] > start) or (i < len(starts) and starts[i] < end):
+            continue
+        starts.insert(i, start)
+        ends.insert(i, end)
+        chosen.insert(i, info)
+    return list(zip(starts, ends, chosen))
+
+def _overlaps(spans, starts, start, end, max_len, skip=None) -> bool:
+    """Whether any of `spans` (sorted by start, `starts` their starts) intersects [start, end)."""
+    for j in range(bisect.bisect_left(starts, start - max_len + 1), bisect.bisect_left(starts, end)):
+        o_start, o_end, owner = spans[j]
+        if o_end > start and owner != skip:
+            return True
+    return False
+
+def score_candidates(candidates, prompts, atoms):
+    """
+    Simulate the binder rewrite (select_rewrites) for every candidate over a
+    sample of prompts, as if that candidate alone were promoted at
+    PROMOTED_TRUST next to the existing atoms. One Aho-Corasick automaton over
+    all candidate patterns and atom base_repr forms finds every occurrence.
+
+    `candidates` is a list of {"pattern", "label"} dicts and `atoms` the
+    trusted atoms as {"base_repr", "label", "score"}. For each candidate returns
+    the occurrences the rewrite would substitute, the bytes and estimated
+    tokens saved, prompt coverage, and the fraction of those occurrences that
+    displace an existing atom (atom_overlap) or overlap another candidate
+    (collisions). Runs in a worker process.
+    """
+    infos = [{"label": c["label"], "score": PROMOTED_TRUST} for c in candidates]
+    owners = {}   # pattern -> (candidate index or -1, atom info or None)
+    for i, c in enumerate(candidates):
+        if c["pattern"]:
+            owners[c["pattern"]] = (i, owners.get(c["pattern"], (-1, None))[1])
+    for a in atoms:
+        p = a["base_repr"]
+        if not p:
+            continue
+        ci, atom = owners.get(p, (-1, None))
+        if atom is None or a["score"] > atom["score"]:
+            owners[p] = (ci, a)
+    automaton = ahocorasick.Automaton()
+    for p, (ci, atom) in owners.items():
+        automaton.add_word(p, (len(p), ci, atom))
+    max_len = max((len(p) for p in owners), default=0)
+
+    stats = [{"occurrences": 0, "prompts": 0, "atom_overlap": 0, "collisions": 0} for _ in candidates]
+    total_bytes = 0
+    if owners:
+        automaton.make_automaton()
+    for prompt in prompts:
+        total_bytes += len(prompt.encode("utf-8"))
+        if not owners:
+            continue
+        by_candidate, atom_spans, cand_spans = {}, [], []
+        for end, (length, ci, atom) in automaton.iter(prompt):
+            start, stop = end - length + 1, end + 1
+            if ci >= 0:
+                by_candidate.setdefault(ci, []).append((start, stop, infos[ci]))
+                cand_spans.append((start, stop, ci))
+            if atom is not None:
+                atom_spans.append((start, stop, atom))
+        if not by_candidate:
+            continue
+        atom_spans.sort(key=lambda s: s[0])
+        cand_spans.sort()
+        atom_starts = [s[0] for s in atom_spans]
+        cand_starts = [s[0] for s in cand_spans]
+        for ci, spans in by_candidate.items():
+            chosen = [(start, end) for start, end, info in select_rewrites(spans + atom_spans) if info is infos[ci]]
+            if not chosen:
+                continue
+            s = stats[ci]
+            s["occurrences"] += len(chosen)
+            s["prompts"] += 1
+            for start, end in chosen:
+                s["atom_overlap"] += _overlaps(atom_spans, atom_starts, start, end, max_len)
+                s["collisions"] += _overlaps(cand_spans, cand_starts, start, end, max_len, skip=ci)
+
+    results = []
+    n_prompts = max(len(prompts), 1)
+    for c, s in zip(candidates, stats):
+        marker = atom_marker(c["label"])
+        per_bytes = len(c["pattern"].encode("utf-8")) - len(marker.encode("utf-8"))
+        per_tokens = estimate_tokens(c["pattern"]) - estimate_tokens(marker)
+        occ = s["occurrences"]
+        results.append({
+            "occurrences": occ,
+            "coverage": s["prompts"] / n_prompts,
+            "bytes_saved": per_bytes * occ,
+            "tokens_saved": per_tokens * occ,
+            "byte_ratio_saved": (per_bytes * occ) / total_bytes if total_bytes else 0.0,
+            "atom_overlap": s["atom_overlap"] / occ if occ else 0.0,
+            "collisions": s["collisions"] / occ if occ else 0.0,
+        })
+    return results
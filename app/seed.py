@@ -1,5 +1,9 @@
 import asyncio
-from .db import create_pool, ensure_essence
+import numpy as np
+from .db import create_pool, ensure_essence, insert_atoms
+from .settings import Settings
+
+settings = Settings()
 
 async def seed_atomic_token():
     pool = await create_pool()
@@ -8,13 +12,11 @@ async def seed_atomic_token():
     form = "for (int i=0; i<n; i++)"
     async with pool.acquire() as conn:
         essence_id = await ensure_essence(pool, canonical_meaning, form=form, generation="G1")
-        sample_emb = [0.001] * 1536
-        sample_emb_comp = sample_emb[:256]
-        await conn.execute("""
-            INSERT INTO atomic_tokens (essence_id, label, base_repr, meaning, embedding, embedding_compressed, provenance, trust_score)
-            VALUES ($1,$2,$3,$4,$5::vector,$6::vector,$7,$8)
-            ON CONFLICT DO NOTHING
-        """, essence_id, 'ATOM_LOOP_INC', form, canonical_meaning, sample_emb, sample_emb_comp, 'seed', 0.9)
+        sample_emb = np.full(settings.input_dim, 0.001, dtype=np.float32)
+        sample_emb_comp = sample_emb[:settings.compressed_dim]
+        await insert_atoms(conn, [{"essence_id": essence_id, "label": 'ATOM_LOOP_INC', "base_repr": form,
+                                    "meaning": canonical_meaning, "embedding": sample_emb,
+                                    "embedding_compressed": sample_emb_comp, "provenance": 'seed', "trust_score": 0.9}])
     print("seeded atom with essence:", essence_id)
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
-from pydantic import BaseSettings
+from typing import Literal
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     # network / app
     app_host: str = "0.0.0.0"
     app_port: int = 8080
+    role: Literal["api", "worker", "all"] = "all"  # api: serve requests only; worker/all: also run the background jobs
+    worker_metrics_port: int = 9100    # /metrics of `python -m app.worker`
+    rate_limit_enabled: bool = True    # per-client-IP limits below (disable for load tests)
+    proxy_rate_limit: str = "100/minute"
+    batch_rate_limit: str = "10/minute"
     api_key: str
 
     # postgres
@@ -12,6 +18,7 @@ class Settings(BaseSettings):
     postgres_db: str
     postgres_user: str
     postgres_password: str
+    db_pool_max_size: int = 10
 
     # LLM / embeddings provider (you can provide small & large models)
     embedding_url: str
@@ -20,24 +27,101 @@ class Settings(BaseSettings):
     llm_model_large: str = "gpt-4o-mini"     # high-quality, slower
     llm_model_small: str = "gpt-3o-fast"     # fast, cheaper (configure)
     provider_api_key: str
+    router_large_prompt_tokens: int = 1500   # prompts at least this long go to the large model...
+    router_binder_max_distance: float = 0.35 # ...unless a rewrite fired or the nearest atom is this close
+    router_max_error_rate: float = 0.2       # a model above this rolling error rate is avoided
+    router_min_samples: int = 20             # calls observed before error rates count
+    router_window: int = 200                 # rolling window of calls per model
+    provider_http2: bool = True
+    provider_max_connections: int = 100
+    provider_max_keepalive: int = 20
+    provider_max_attempts: int = 3           # including the first try; retries 429/5xx/transport errors
+    embedding_timeout_seconds: float = 25.0
+    llm_timeout_seconds: float = 60.0
+    embedding_batch_max_items: int = 64      # flush a micro-batch once this many distinct inputs are queued
+    embedding_batch_max_wait_ms: float = 5.0 # ...or once the oldest queued input has waited this long
 
     # memory & compression
-    hot_max_age_seconds: int = 600
-    warm_max_age_seconds: int = 86400
+    hot_max_age_seconds: int = 600       # then full embeddings are dropped and the provider payload archived
+    warm_max_age_seconds: int = 86400    # then compaction folds the row into a centroid
+    tiering_interval_seconds: int = 60
+    tiering_batch_size: int = 1000       # rows demoted per transaction
+    tiering_max_batches: int = 50        # batches per tiering cycle
+    tier_metrics_interval_seconds: int = 300
+    cold_memory_top_k: int = 3
+    cold_memory_min_similarity: float = 0.75    # cosine similarity for a centroid to count as relevant
+    cold_memory_refresh_seconds: int = 60       # poll centroids.updated_at for changes made elsewhere
+    cold_memory_hnsw_threshold: int = 10000
+    input_dim: int = 1536
     compressed_dim: int = 256
+    pca_model_path: str = "/app/pca_model.pkl"    # promoted model read by the projection engine
+    pca_model_dir: str = "/app/data/models"       # versioned models (pca_v<N>.pkl)
+    pca_refit_interval_seconds: int = 3600
+    pca_min_rows: int = 2000                      # rows with full embeddings needed before fitting
+    pca_min_new_rows: int = 5000                  # new interactions since the last fit before refitting
+    pca_fit_batch_size: int = 1024
+    pca_reproject_batch_size: int = 1000
+    pca_drift_sample: int = 2000                  # newest full-embedding rows the current model is checked against
+    pca_variance_tolerance: float = 0.02          # refit only once the model retains this much less of their variance
     binder_score_threshold: float = 0.80
+    binder_index_hnsw_threshold: int = 10000   # atoms before the binder index switches from flat to HNSW
+    binder_index_resync_seconds: int = 300     # full reload of the binder index from atomic_tokens
+    binder_version_check_seconds: int = 15     # how soon the binder index follows a promoted PCA model
+    rewrite_delta_max: int = 512               # promoted atoms held in the delta automaton before a full rebuild
+
+    # quantized vector storage (app/quantize.py; convert existing rows with python -m app.migrate_quantized)
+    embedding_storage: str = "float32"   # full embeddings as float32 (vector) | halfvec | int8 (bytea + scale)
+    binary_codes: bool = False           # sign-bit codes: Hamming prefilter + exact re-rank for binder/cold memory search
+    binary_rerank_factor: int = 10       # prefilter candidates kept per requested neighbour
+    pgvector_quantized: bool = False     # app/schema_quantized.sql applied (pgvector >= 0.7): halfvec columns,
+                                         # atom sign codes + Hamming index; required for embedding_storage=halfvec
+    quantize_batch_size: int = 1000      # rows per migrate_quantized batch
 
     # performance/cost mitigation
     lite_mode: bool = True               # if True disables heavy compaction & reduces background freq
     compaction_min_rows: int = 1000      # only compact when interactions >= threshold
     compaction_check_interval: int = 600 # seconds (10min) default
+    compaction_batch_max: int = 20000    # new interactions considered per compaction run
+    compaction_residue_max: int = 20000  # earlier unclustered interactions re-offered to HDBSCAN
+    compaction_assign_max_distance: float = 0.15  # cosine distance for folding into an existing centroid
     cache_ttl_seconds: int = 300         # cache TTL for LRU cache
     cache_max_items: int = 2048
+    semantic_cache_max_distance: float = 0.05   # cosine distance for a semantic cache hit
+
+    # batch inference
+    batch_max_items: int = 10000          # prompts accepted per /v1/proxy/batch request
+    batch_inline_max: int = 200           # larger batches (or "async": true) run as a background job
+    batch_llm_concurrency: int = 16       # concurrent upstream LLM calls per batch
+    batch_job_max: int = 1000
+    batch_job_ttl_seconds: int = 3600     # finished job results are kept this long
+
+    # interaction write-behind queue
+    write_queue_max_items: int = 10000     # producers block once this many records are queued
+    write_batch_size: int = 200
+    write_flush_interval_ms: float = 50.0
+    write_flush_timeout_seconds: float = 5.0
+    write_spill_path: str = "/app/data/interactions.spill.jsonl"
+
+    # BEE pattern mining
+    bee_batch_max: int = 20000            # interactions folded into the n-gram sketch per batch
+    bee_sketch_capacity: int = 5000       # heavy-hitter n-grams tracked by the sketch
+    bee_candidate_pool: int = 500         # top sketch n-grams scored by rewrite simulation
+    bee_scoring_sample: int = 20000       # recent prompts the rewrite simulation runs over
+    bee_proposal_ttl_seconds: int = 86400 # pending proposals not re-discovered for this long are expired
+
+    # CPU offload & chain verification
+    cpu_workers: int = 0                  # process pool size; 0 = one per CPU
+    chain_segment_size: int = 50000       # rows per verification segment (and checkpoint interval)
+    chain_verify_parallelism: int = 4     # segments verified concurrently on the process pool
+    chain_lock_check_seconds: float = 5.0 # liveness check of the single-writer lock connection
+
+    # observability
+    server_timing: bool = False           # add Server-Timing to every proxy response, not only on x-server-timing: 1
+    loop_lag_interval_seconds: float = 0.25
 
     # local optional Redis
     use_redis_cache: bool = False
     redis_url: str = "redis://redis:6379/0"
 
-    class Config:
-        env_file = ".env"
-        env_prefix = ""
+    # .env may hold keys for other services (compose, bench), which v1 ignored too
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="", extra="ignore")
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import zlib
+from prometheus_client import Gauge
+from .cold_memory import cold_memory_index
+from .db import create_pool, run_exclusive
+from .memory_manager import cluster_and_compact
+from .quantize import has_full_embedding_sql, storage_columns
+from .settings import Settings
+
+settings = Settings()
+
+TIER_ROWS = Gauge('sems_tier_rows', 'Interactions per memory tier (cold and archive are planner estimates)', ['tier'])
+TIER_BYTES = Gauge('sems_tier_bytes', 'Estimated stored bytes per memory tier (hot/warm sampled, cold and archive from table sizes)', ['tier'])
+INDEX_BYTES = Gauge('sems_index_bytes', 'On-disk size of the interaction vector indexes', ['index'])
+
+# every storage variant (quantize.STORAGE), so rows written before a storage switch are cleared too
+_DROP_FULL_EMBEDDINGS = ", ".join(f"{c} = NULL" for c in storage_columns("input_embedding") + storage_columns("output_embedding"))
+
+async def demote_hot_batch(pool) -> int:
+    """
+    Move one batch of hot interactions older than hot_max_age_seconds to warm:
+    the provider payload is zlib-compressed into interaction_archive and the
+    full 1536-dim embeddings are dropped (compressed ones stay). The newest
+    pca_min_rows rows with full embeddings stay hot whatever their age, so the
+    PCA job always has enough to fit from. Rows locked by another worker are
+    skipped. Returns the number of rows demoted.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            keep_from = await conn.fetchval(f"""
+                SELECT seq FROM interactions
+                WHERE tier = 'hot' AND seq IS NOT NULL AND {has_full_embedding_sql('input_embedding')}
+                ORDER BY seq DESC
+                OFFSET $1 LIMIT 1
+            """, max(settings.pca_min_rows - 1, 0))
+            if keep_from is None:
+                return 0
+            rows = await conn.fetch("""
+                SELECT id, provider_response::text AS provider_response FROM interactions
+                WHERE tier = 'hot' AND timestamp < NOW() - make_interval(secs => $1) AND seq < $3
+                ORDER BY timestamp
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            """, float(settings.hot_max_age_seconds), settings.tiering_batch_size, keep_from)
+            if not rows:
+                return 0
+            archived = await asyncio.to_thread(
+                lambda: [(r["id"], zlib.compress(r["provider_response"].encode("utf-8")))
+                         for r in rows if r["provider_response"]])
+            if archived:
+                await conn.executemany("""
+                    INSERT INTO interaction_archive (id, provider_response_z) VALUES ($1, $2)
+                    ON CONFLICT (id) DO NOTHING
+                """, archived)
+            await conn.execute(f"""
+                UPDATE interactions SET tier = 'warm', {_DROP_FULL_EMBEDDINGS},
+                       provider_response = NULL
+                WHERE id = ANY($1::uuid[])
+            """, [r["id"] for r in rows])
+    return len(rows)
+
+async def demote_hot(pool) -> int:
+    demoted = 0
+    for _ in range(settings.tiering_max_batches):
+        n = await demote_hot_batch(pool)
+        demoted += n
+        if n < settings.tiering_batch_size:
+            break
+    return demoted
+
+TIER_SIZE_SAMPLE = 1000   # hot/warm rows read to estimate their average row size
+
+async def update_tier_metrics(pool):
+    """
+    Refresh the tier gauges without scanning the table. Hot and warm rows are
+    counted on the partial tier index and their bytes estimated from a bounded
+    sample of row sizes; cold gets the remainder of the planner's row estimate
+    and of the table's on-disk size, and the archive its on-disk size.
+    """
+    async with pool.acquire() as conn:
+        live = {}
+        for tier in ("hot", "warm"):
+            # the redundant tier <> 'cold' lets the parameterised query use the partial tier index
+            live[tier] = await conn.fetchrow("""
+                SELECT (SELECT count(*) FROM interactions WHERE tier = $1 AND tier <> 'cold') AS cnt,
+                       (SELECT coalesce(avg(pg_column_size(s.*)), 0) FROM (
+                            SELECT * FROM interactions WHERE tier = $1 AND tier <> 'cold' LIMIT $2) s) AS row_bytes
+            """, tier, TIER_SIZE_SAMPLE)
+        table = await conn.fetchrow("""
+            SELECT greatest(c.reltuples, 0)::bigint AS cnt, pg_table_size(c.oid) AS bytes
+            FROM pg_class c WHERE c.oid = 'interactions'::regclass
+        """)
+        archive = await conn.fetchrow("""
+            SELECT greatest(c.reltuples, 0)::bigint AS cnt, pg_table_size(c.oid) AS bytes
+            FROM pg_class c WHERE c.oid = 'interaction_archive'::regclass
+        """)
+        indexes = await conn.fetch("""
+            SELECT indexrelname AS name, pg_relation_size(indexrelid) AS bytes FROM pg_stat_user_indexes
+            WHERE relname = 'interactions' AND indexrelname IN ('idx_input_embedding', 'idx_input_emb_compressed')
+        """)
+    rows, size = table["cnt"], table["bytes"]
+    for tier, r in live.items():
+        tier_bytes = int(r["cnt"] * float(r["row_bytes"]))
+        TIER_ROWS.labels(tier).set(r["cnt"])
+        TIER_BYTES.labels(tier).set(tier_bytes)
+        rows, size = rows - r["cnt"], size - tier_bytes
+    TIER_ROWS.labels("cold").set(max(rows, 0))
+    TIER_BYTES.labels("cold").set(max(size, 0))
+    TIER_ROWS.labels("archive").set(archive["cnt"])
+    TIER_BYTES.labels("archive").set(archive["bytes"])
+    for r in indexes:
+        INDEX_BYTES.labels(r["name"]).set(r["bytes"])
+
+async def tiering_loop():
+    """
+    Hot -> warm demotion every tiering_interval_seconds; warm -> cold
+    compaction (cluster_and_compact, which only takes warm rows past
+    warm_max_age_seconds) every compaction_check_interval, followed by a
+    refresh of the centroids it touched in the cold memory index (when this
+    process serves it); tier metrics every tier_metrics_interval_seconds. Each
+    step runs under its own advisory lock, so with several workers only one
+    runs it at a time.
+    """
+    pool = await create_pool()
+
+    async def compact():
+        changed = await cluster_and_compact()
+        if changed and cold_memory_index.ready:
+            await cold_memory_index.refresh(pool, [c for c, _ in changed])
+
+    last_compaction = last_metrics = float("-inf")
+    while True:
+        try:
+            await run_exclusive(pool, "tiering", lambda: demote_hot(pool))
+        except Exception as e:
+            print("Tiering error", e)
+        now = time.monotonic()
+        if now - last_compaction >= settings.compaction_check_interval:
+            last_compaction = now
+            try:
+                await run_exclusive(pool, "compaction", compact)
+            except Exception as e:
+                print("Compaction error", e)
+        if now - last_metrics >= settings.tier_metrics_interval_seconds:
+            last_metrics = now
+            try:
+                await run_exclusive(pool, "tier_metrics", lambda: update_tier_metrics(pool))
+            except Exception as e:
+                print("Tier metrics error", e)
+        await asyncio.sleep(settings.tiering_interval_seconds)
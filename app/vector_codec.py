@@ -0,0 +1,103 @@
+"""
+Binary asyncpg codecs for pgvector's `vector` and `halfvec` types and for
+`bit` (binary-quantized codes).
+
+On the wire a vector is `int16 dim, int16 unused, dim x float32`, all
+big-endian (pgvector's vector_send/vector_recv); halfvec is the same with
+float16. Registered on every pool connection, so these columns decode
+straight into float32 NumPy arrays and parameters are encoded from arrays
+(or any float sequence) without the text round-trip through Python float
+lists. `bit` values decode to and encode from boolean arrays.
+
+Bulk readers skip the per-row arrays altogether: they select
+`vector_send(col)` (raw_vector_sql), which asyncpg returns as bytes, and
+stack_vector_bytes turns the whole result into one matrix.
+"""
+import struct
+from typing import Optional, Sequence
+import numpy as np
+
+_HEADER = struct.Struct(">hh")
+_BITLEN = struct.Struct(">i")
+_WIRE = np.dtype(">f4")
+_WIRE_HALF = np.dtype(">f2")
+
+def _encode(value, wire) -> bytes:
+    a = np.asarray(value, dtype=wire)
+    if a.ndim != 1:
+        raise ValueError(f"expected a 1-d vector, got shape {a.shape}")
+    return _HEADER.pack(a.shape[0], 0) + a.tobytes()
+
+def _decode(data: bytes, wire) -> np.ndarray:
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=wire, count=dim, offset=_HEADER.size).astype(np.float32)
+
+def encode_vector(value) -> bytes:
+    return _encode(value, _WIRE)
+
+def decode_vector(data: bytes) -> np.ndarray:
+    return _decode(data, _WIRE)
+
+def encode_halfvec(value) -> bytes:
+    return _encode(value, _WIRE_HALF)
+
+def decode_halfvec(data: bytes) -> np.ndarray:
+    return _decode(data, _WIRE_HALF)
+
+def encode_bits(value) -> bytes:
+    a = np.asarray(value, dtype=bool).ravel()
+    return _BITLEN.pack(a.shape[0]) + np.packbits(a).tobytes()
+
+def decode_bits(data: bytes) -> np.ndarray:
+    (n,) = _BITLEN.unpack_from(data)
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=_BITLEN.size), count=n).astype(bool)
+
+# (type, schema, encoder, decoder); vector is required, the others are registered where they exist
+_CODECS = [
+    ("vector", "public", encode_vector, decode_vector),
+    ("bit", "pg_catalog", encode_bits, decode_bits),
+    ("halfvec", "public", encode_halfvec, decode_halfvec),   # pgvector >= 0.7
+]
+
+async def register_vector_codec(conn):
+    """asyncpg `init=` hook; the pgvector extension must already exist."""
+    present = {(r["nspname"], r["typname"]) for r in await conn.fetch("""
+        SELECT n.nspname, t.typname FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE t.typname = ANY($1::text[])
+    """, [name for name, _, _, _ in _CODECS])}
+    for name, schema, encoder, decoder in _CODECS:
+        if name == "vector" or (schema, name) in present:
+            await conn.set_type_codec(name, schema=schema, encoder=encoder, decoder=decoder, format="binary")
+
+def raw_vector_sql(col: str, alias: str = None) -> str:
+    """Select-list fragment returning `vector` column `col` in its binary wire format, for stack_vector_bytes."""
+    return f"vector_send({col}) AS {alias or col}"
+
+def stack_vector_bytes(bufs: Sequence[Optional[bytes]], dim: int = None) -> np.ndarray:
+    """
+    (N, dim) float32 matrix from raw_vector_sql buffers with a single
+    conversion: the buffers are joined and read as rows of dim + 1 big-endian
+    float32 slots, the first slot being the 4-byte header, which is dropped.
+    NULLs become zero rows.
+    """
+    if dim is None:
+        dim = next((_HEADER.unpack_from(b)[0] for b in bufs if b is not None), 0)
+    width = _HEADER.size + dim * _WIRE.itemsize
+    data = b"".join(bytes(width) if b is None else b for b in bufs)
+    if len(data) != width * len(bufs):
+        raise ValueError(f"expected vectors of dimension {dim}")
+    return np.frombuffer(data, dtype=_WIRE).reshape(len(bufs), dim + 1)[:, 1:].astype(np.float32)
+
+def stack_vectors(values: Sequence[Optional[np.ndarray]], dim: int = None) -> np.ndarray:
+    """
+    Copy decoded vectors into one contiguous (N, dim) float32 matrix; NULLs
+    become zero rows. For rows that were decoded one by one anyway (mixed
+    storage modes); plain vector columns go through stack_vector_bytes.
+    """
+    if dim is None:
+        dim = next((v.shape[0] for v in values if v is not None), 0)
+    X = np.zeros((len(values), dim), dtype=np.float32)
+    for i, v in enumerate(values):
+        if v is not None:
+            X[i] = v
+    return X
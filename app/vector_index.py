@@ -0,0 +1,124 @@
+import numpy as np
+import faiss
+from .quantize import sign_codes
+
+RERANK_CHUNK_QUERIES = 64   # queries re-ranked together; bounds the gathered candidate block
+
+class VectorIndex:
+    """
+    Resident FAISS index over a float32 matrix. Small collections use an exact
+    flat index; once the row count reaches hnsw_threshold the index is rebuilt as
+    HNSW. Rows are addressed by insertion position, so callers keep their
+    metadata in a parallel list.
+
+    With binary=True the FAISS index holds only sign codes (dim / 8 bytes per
+    row): a search takes the rerank_factor * k nearest codes by Hamming
+    distance, then re-ranks them exactly on the float matrix. The float matrix
+    stays resident either way, so binary mode trades search time, not memory
+    (see resident_bytes).
+    """
+
+    def __init__(self, dim: int, metric: str = "l2", hnsw_threshold: int = 10000,
+                 hnsw_m: int = 32, ef_search: int = 64, binary: bool = False, rerank_factor: int = 10):
+        if metric not in ("l2", "ip"):
+            raise ValueError(f"unsupported metric: {metric}")
+        if binary and dim % 8:
+            raise ValueError(f"binary codes need a dimension divisible by 8, got {dim}")
+        self.dim = dim
+        self.metric = metric
+        self.binary = binary
+        self.rerank_factor = rerank_factor
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._index = self._new_index(0)
+
+    def __len__(self):
+        return self._vectors.shape[0]
+
+    @property
+    def kind(self) -> str:
+        return "hnsw" if isinstance(self._index, (faiss.IndexHNSW, faiss.IndexBinaryHNSW)) else "flat"
+
+    def _new_index(self, n: int):
+        if self.binary:
+            if n >= self.hnsw_threshold:
+                index = faiss.IndexBinaryHNSW(self.dim, self.hnsw_m)
+                index.hnsw.efSearch = self.ef_search
+                return index
+            return faiss.IndexBinaryFlat(self.dim)
+        faiss_metric = faiss.METRIC_L2 if self.metric == "l2" else faiss.METRIC_INNER_PRODUCT
+        if n >= self.hnsw_threshold:
+            index = faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss_metric)
+            index.hnsw.efSearch = self.ef_search
+            return index
+        if self.metric == "l2":
+            return faiss.IndexFlatL2(self.dim)
+        return faiss.IndexFlatIP(self.dim)
+
+    def build(self, matrix):
+        X = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        index = self._new_index(X.shape[0])
+        if X.shape[0]:
+            index.add(self._codes(X))
+        self._vectors, self._index = X, index
+
+    def add(self, matrix):
+        X = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        if not X.shape[0]:
+            return
+        vectors = np.concatenate([self._vectors, X])
+        if self.kind == "flat" and vectors.shape[0] >= self.hnsw_threshold:
+            # crossed the size threshold: switch to HNSW
+            self.build(vectors)
+            return
+        self._index.add(self._codes(X))
+        self._vectors = vectors
+
+    def resident_bytes(self) -> int:
+        """Float matrix plus the FAISS index (its serialized size, so graph links count for HNSW)."""
+        serialize = faiss.serialize_index_binary if self.binary else faiss.serialize_index
+        return int(self._vectors.nbytes + serialize(self._index).nbytes)
+
+    def _codes(self, X):
+        return sign_codes(X) if self.binary else X
+
+    def search(self, queries, k: int):
+        """
+        Return (distances, positions) arrays of shape (n_queries, k'). Distances are
+        euclidean for the l2 metric (as pgvector's <-> operator) and inner products
+        for ip. Positions of -1 mean fewer than k rows were available.
+        """
+        Q = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        k = min(k, len(self))
+        if k <= 0:
+            empty = np.zeros((Q.shape[0], 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        if self.binary:
+            return self._search_rerank(Q, k)
+        distances, positions = self._index.search(Q, k)
+        if self.metric == "l2":
+            distances = np.sqrt(np.maximum(distances, 0.0))
+        return distances, positions
+
+    def _search_rerank(self, Q, k: int):
+        _, candidates = self._index.search(sign_codes(Q), min(len(self), k * self.rerank_factor))
+        valid = candidates >= 0
+        distances = np.empty((Q.shape[0], min(k, candidates.shape[1])), dtype=np.float32)
+        positions = np.empty(distances.shape, dtype=np.int64)
+        # gathering every candidate row at once is n_queries * n_candidates * dim
+        # floats; a fixed block of queries keeps large batches bounded
+        for lo in range(0, Q.shape[0], RERANK_CHUNK_QUERIES):
+            hi = lo + RERANK_CHUNK_QUERIES
+            c, ok = candidates[lo:hi], valid[lo:hi]
+            V = self._vectors[np.where(ok, c, 0)]                   # (chunk, n_candidates, dim)
+            if self.metric == "l2":
+                scores = np.where(ok, np.linalg.norm(V - Q[lo:hi, None, :], axis=2), np.inf)
+                order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+            else:
+                scores = np.where(ok, np.einsum("qcd,qd->qc", V, Q[lo:hi]), -np.inf)
+                order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            distances[lo:hi] = np.take_along_axis(scores, order, axis=1)
+            positions[lo:hi] = np.where(np.take_along_axis(ok, order, axis=1), np.take_along_axis(c, order, axis=1), -1)
+        return distances, positions
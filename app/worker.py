@@ -0,0 +1,54 @@
+"""
+Background worker: runs the maintenance jobs (hot -> warm tiering and
+warm -> cold compaction, PCA refits, BEE mining) outside the API processes.
+
+    ROLE=api uvicorn app.main:app ...   # API replicas, no background jobs
+    python -m app.worker                # one or more workers
+
+Each job takes a Postgres advisory lock per run (db.run_exclusive), so any
+number of workers, and API processes left at role=all, can run side by side
+without duplicating work. CPU-heavy steps go to the shared process pool
+(executor.run_in_process).
+"""
+import asyncio
+import signal
+from prometheus_client import start_http_server
+from .bee import bee_loop
+from .db import create_pool
+from .executor import shutdown_process_pool
+from .metrics import loop_lag_monitor
+from .pca_job import pca_loop
+from .settings import Settings
+from .tiering import tiering_loop
+
+settings = Settings()
+
+def start_background_jobs():
+    """Start the background job loops on the running event loop; returns their tasks."""
+    return [asyncio.create_task(tiering_loop()),
+            asyncio.create_task(pca_loop()),
+            asyncio.create_task(bee_loop())]
+
+async def run_worker():
+    pool = await create_pool()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    tasks = start_background_jobs()
+    tasks.append(asyncio.create_task(loop_lag_monitor(settings.loop_lag_interval_seconds)))
+    print(f"Worker started; metrics on :{settings.worker_metrics_port}")
+    await stop.wait()
+    # cancelling releases any held advisory locks (run_exclusive unlocks in finally)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    shutdown_process_pool()
+    await pool.close()
+
+def main():
+    start_http_server(settings.worker_metrics_port)
+    asyncio.run(run_worker())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import json
+import os
+import numpy as np
+from prometheus_client import Counter, Gauge
+from .db import insert_interactions
+from .settings import Settings
+
+settings = Settings()
+
+WRITE_QUEUE_DEPTH = Gauge('sems_write_queue_depth', 'Interaction records waiting to be persisted')
+WRITE_ROWS = Counter('sems_write_rows_total', 'Interaction records handled by the write-behind queue', ['outcome'])
+
+def _json_default(value):
+    # embeddings are float32 arrays; the vector codec accepts them back as lists
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class InteractionWriter:
+    """
+    Write-behind queue for interaction rows. Handlers enqueue records and return;
+    a single flusher drains the queue in batches with executemany. The queue is
+    bounded, so a stalled database slows producers (backpressure) instead of
+    growing memory. Batches that fail or exceed flush_timeout are appended to a
+    local JSONL spill file and replayed after the next successful flush.
+    Records arrive already stamped by the chain sequencer, so flush order does
+    not affect the chain.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval_ms: float,
+                 flush_timeout: float, spill_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_timeout = flush_timeout
+        self.spill_path = spill_path
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._pool = None
+        self._task = None
+        self._puts = set()
+
+    async def start(self, pool):
+        self._pool = pool
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, *records: dict):
+        """
+        Queue stamped records. The puts are shielded from the caller's
+        cancellation: a record that already holds a seq must reach the queue,
+        or the chain shows a gap.
+        """
+        task = asyncio.ensure_future(self._put_all(records))
+        self._puts.add(task)
+        task.add_done_callback(self._puts.discard)
+        await asyncio.shield(task)
+
+    async def _put_all(self, records):
+        for record in records:
+            await self._queue.put(record)
+        WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain queued records; whatever cannot be written in time goes to the spill file."""
+        if self._task is None:
+            return
+        if self._puts:
+            await asyncio.wait(list(self._puts), timeout=timeout)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if leftover:
+            self._spill(leftover)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                # records taken off the queue belong to this batch from here on, so
+                # cancellation while still gathering spills them with the rest
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                # shutting down mid-batch: keep it on disk rather than dropping it
+                if batch:
+                    self._spill(batch)
+                raise
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _flush(self, batch):
+        try:
+            await asyncio.wait_for(self._write(batch), self.flush_timeout)
+        except Exception as e:
+            print("Interaction flush error", repr(e))
+            self._spill(batch)
+            return
+        WRITE_ROWS.labels("written").inc(len(batch))
+        if os.path.exists(self.spill_path):
+            await self._replay_spill()
+
+    async def _write(self, batch):
+        async with self._pool.acquire() as conn:
+            await insert_interactions(conn, batch)
+
+    def _spill(self, batch):
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for r in batch:
+                f.write(json.dumps(dict(r, timestamp=r["timestamp"].isoformat()), default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        WRITE_ROWS.labels("spilled").inc(len(batch))
+
+    def spilled_head(self):
+        """The highest-seq record still waiting in a spill file, if any."""
+        head = None
+        for path in (self.spill_path + ".replay", self.spill_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    r = json.loads(line)
+                    if head is None or r["seq"] > head["seq"]:
+                        head = {"seq": r["seq"], "merkle_root": r["merkle_root"]}
+        return head
+
+    async def _replay_spill(self):
+        replay_path = self.spill_path + ".replay"
+        if os.path.exists(self.spill_path):
+            if os.path.exists(replay_path):
+                # a previous replay was interrupted: fold the new spill into it
+                with open(self.spill_path, encoding="utf-8") as src, open(replay_path, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.spill_path)
+            else:
+                os.replace(self.spill_path, replay_path)
+        if not os.path.exists(replay_path):
+            return
+        with open(replay_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        for r in records:
+            r["timestamp"] = datetime.datetime.fromisoformat(r["timestamp"])
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            try:
+                await asyncio.wait_for(self._write(batch), self.flush_timeout)
+            except Exception as e:
+                print("Spill replay error", repr(e))
+                self._spill(records[i:])
+                break
+            WRITE_ROWS.labels("replayed").inc(len(batch))
+        os.remove(replay_path)
+
+interaction_writer = InteractionWriter(settings.write_queue_max_items, settings.write_batch_size,
+                                       settings.write_flush_interval_ms, settings.write_flush_timeout_seconds,
+                                       settings.write_spill_path)
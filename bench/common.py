@@ -0,0 +1,58 @@
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# app.settings requires these; benchmarks that never reach Postgres or the
+# provider only need them to be present
+for _k, _v in {"API_KEY": "bench", "POSTGRES_HOST": "localhost", "POSTGRES_DB": "sems",
+               "POSTGRES_USER": "sems_user", "POSTGRES_PASSWORD": "sems_password",
+               "EMBEDDING_URL": "http://localhost:9000/v1/embeddings",
+               "LLM_URL": "http://localhost:9000/v1/chat/completions", "PROVIDER_API_KEY": "bench"}.items():
+    os.environ.setdefault(_k, _v)
+
+def percentiles(samples) -> dict:
+    if not len(samples):
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    a = np.asarray(samples, dtype=np.float64)
+    return {"p50": float(np.percentile(a, 50)), "p95": float(np.percentile(a, 95)),
+            "p99": float(np.percentile(a, 99)), "mean": float(a.mean())}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def measure(fn, repeat: int, items_per_call: int = 1) -> dict:
+    """Run fn() `repeat` times (after one warm-up call); latencies in ms, traced allocation peak in MiB."""
+    fn()
+    tracemalloc.start()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total_s = sum(samples) / 1000.0
+    return dict(percentiles(samples), unit="ms", repeat=repeat,
+                throughput_per_s=(repeat * items_per_call / total_s) if total_s else None,
+                alloc_peak_mb=peak / (1024 * 1024))
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "numpy": np.__version__}
+
+def write_report(report: dict, path: str = None):
+    report = dict(report, environment=environment(), peak_rss_mb=peak_rss_mb(), created_at=time.time())
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
@@ -0,0 +1,57 @@
+"""
+Compare a benchmark report against a stored baseline.
+
+    python -m bench.compare bench/baseline/micro.json bench/results/micro.json --tolerance 0.15
+
+A result regresses when its p95 latency grows (or its throughput drops) by
+more than the tolerance, or when it reports more errors than the baseline. Prints one JSON line per benchmark and exits 1 if
+anything regressed, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+def compare(baseline: dict, current: dict, tolerance: float, metric: str = "p95"):
+    rows, regressed = [], False
+    for name, cur in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new"})
+            continue
+        row = {"name": name, "status": "ok"}
+        if base.get(metric) and cur.get(metric) is not None:
+            row[f"{metric}_change"] = cur[metric] / base[metric] - 1.0
+            if row[f"{metric}_change"] > tolerance:
+                row["status"] = "regressed"
+        if base.get("throughput_per_s") and cur.get("throughput_per_s") is not None:
+            row["throughput_change"] = cur["throughput_per_s"] / base["throughput_per_s"] - 1.0
+            if row["throughput_change"] < -tolerance:
+                row["status"] = "regressed"
+        if cur.get("errors"):
+            row["errors"] = cur["errors"]
+            if cur["errors"] > (base.get("errors") or 0):
+                row["status"] = "regressed"
+        regressed |= row["status"] == "regressed"
+        rows.append(row)
+    for name in sorted(set(baseline["results"]) - set(current["results"])):
+        rows.append({"name": name, "status": "missing"})
+    return rows, regressed
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("baseline")
+    ap.add_argument("current")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    ap.add_argument("--metric", default="p95", choices=["p50", "p95", "p99", "mean"])
+    args = ap.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows, regressed = compare(baseline, current, args.tolerance, args.metric)
+    for row in rows:
+        print(json.dumps(row))
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
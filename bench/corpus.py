@@ -0,0 +1,53 @@
+"""
+Deterministic synthetic corpus: prompts built from a fixed vocabulary with a
+set of recurring boilerplate phrases (so BEE and the binder have something to
+find), and clustered embeddings (so compaction has structure to recover).
+"""
+import numpy as np
+
+PHRASES = [
+    "please answer the following question concisely",
+    "you are a helpful assistant that writes python code",
+    "for (int i=0; i<n; i++)",
+    "summarize the text below in three bullet points",
+    "return the result as valid json",
+    "explain step by step",
+    "translate the following into french",
+    "def main(): pass",
+]
+
+def vocabulary(size: int = 5000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return ["".join(rng.choice(letters, size=rng.integers(3, 10))) for _ in range(size)]
+
+def prompts(n: int, seed: int = 1, words: int = 40, phrase_rate: float = 0.6):
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary()
+    out = []
+    for _ in range(n):
+        body = " ".join(rng.choice(vocab, size=words))
+        if rng.random() < phrase_rate:
+            phrase = PHRASES[rng.integers(len(PHRASES))]
+            body = f"{phrase} {body}" if rng.random() < 0.5 else f"{body} {phrase}"
+        out.append(body)
+    return out
+
+def embeddings(n: int, dim: int = 1536, clusters: int = 50, spread: float = 0.15, seed: int = 2):
+    """Unit vectors drawn around `clusters` random centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    X = centres[rng.integers(clusters, size=n)] + spread * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32)
+
+def atoms(n: int, seed: int = 3):
+    """Atom dicts shaped like binder token info, base_repr drawn from PHRASES plus random n-grams."""
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary()
+    out = []
+    for i in range(n):
+        base = PHRASES[i] if i < len(PHRASES) else " ".join(rng.choice(vocab, size=rng.integers(2, 5)))
+        out.append({"token_id": f"bench-{i}", "essence_id": None, "label": f"ATOM_{i}",
+                    "base_repr": base, "meaning": base, "score": 0.9})
+    return out
@@ -0,0 +1,108 @@
+"""
+End-to-end load driver for /v1/proxy.
+
+Start Postgres+pgvector and the stub provider, point the app at the stub, then:
+
+    EMBEDDING_URL=http://stub:9000/v1/embeddings LLM_URL=http://stub:9000/v1/chat/completions \\
+        RATE_LIMIT_ENABLED=false docker compose --profile bench up -d db stub app
+    python -m bench.load --url http://localhost:8080 --requests 2000 --concurrency 32 \\
+        --out bench/results/load.json
+
+Prompts come from the synthetic corpus; --repeat-ratio controls how many are
+re-sent (exercising the response cache). The report has throughput, latency
+percentiles, status counts, and the server's resident memory before and after
+(scraped from /metrics). Latency and throughput cover 200 responses only;
+everything else (429s from a rate-limited server included) is counted under
+`errors`, and a warning is printed when there are any.
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+import httpx
+import numpy as np
+from . import common
+from . import corpus
+
+RSS_RE = re.compile(r"^process_resident_memory_bytes\s+([0-9.e+]+)$", re.M)
+
+async def server_rss_mb(client, url):
+    try:
+        r = await client.get(f"{url}/metrics")
+        m = RSS_RE.search(r.text)
+        return float(m.group(1)) / (1024 * 1024) if m else None
+    except httpx.HTTPError:
+        return None
+
+async def run(args):
+    texts = corpus.prompts(args.requests, seed=args.seed, words=args.words)
+    rng = np.random.default_rng(args.seed)
+    repeat = rng.random(len(texts)) < args.repeat_ratio
+    for i in np.flatnonzero(repeat):
+        texts[i] = texts[rng.integers(max(1, i))]
+    headers = {"x-api-key": args.api_key}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    latencies, ttfb, statuses = [], [], {}
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=args.timeout) as client:
+        rss_before = await server_rss_mb(client, args.url)
+        queue = asyncio.Queue()
+        for t in texts:
+            queue.put_nowait(t)
+
+        async def worker():
+            while not queue.empty():
+                prompt = queue.get_nowait()
+                body = {"prompt": prompt, "stream": args.stream, "cache": not args.no_cache}
+                start = time.perf_counter()
+                try:
+                    async with client.stream("POST", f"{args.url}/v1/proxy", json=body) as r:
+                        first = None
+                        async for _ in r.aiter_raw():
+                            if first is None:
+                                first = time.perf_counter()
+                        status = str(r.status_code)
+                except httpx.HTTPError as e:
+                    status, first = type(e).__name__, None
+                end = time.perf_counter()
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == "200":
+                    latencies.append((end - start) * 1000.0)
+                    ttfb.append(((first or end) - start) * 1000.0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+        rss_after = await server_rss_mb(client, args.url)
+    errors = len(texts) - statuses.get("200", 0)
+    if errors:
+        print(f"warning: {errors} of {len(texts)} requests did not return 200: {statuses}", file=sys.stderr)
+    return {
+        "load.proxy": dict(common.percentiles(latencies), unit="ms", requests=len(texts),
+                           concurrency=args.concurrency, stream=args.stream,
+                           throughput_per_s=len(latencies) / elapsed if elapsed else None,
+                           statuses=statuses, errors=errors, error_rate=errors / len(texts) if texts else 0.0,
+                           elapsed_s=elapsed,
+                           server_rss_mb_before=rss_before, server_rss_mb_after=rss_after),
+        "load.proxy_ttfb": dict(common.percentiles(ttfb), unit="ms"),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8080")
+    ap.add_argument("--api-key", default="replace-with-client-api-key")
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--words", type=int, default=40)
+    ap.add_argument("--repeat-ratio", type=float, default=0.2, help="fraction of prompts that repeat an earlier one")
+    ap.add_argument("--stream", action="store_true", help="use the SSE mode and report time to first byte")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=11)
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+    results = asyncio.run(run(args))
+    common.write_report({"suite": "load", "results": results}, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Micro-benchmarks for the hot and background paths, parameterised over corpus size.
+
+    python -m bench.micro --sizes 1000,10000,100000 --out bench/results/micro.json
+    python -m bench.compare bench/baseline/micro.json bench/results/micro.json
+
+No database or provider is needed: each benchmark drives the same functions
+the service uses (projection, binder index + rewrite, n-gram mining, the
+compaction assign/cluster step, chain stamping and verification, the
+vector codec, quantized search and storage) on the synthetic corpus.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import numpy as np
+from . import common
+from . import corpus
+
+def bench_compress(size: int, repeat: int):
+    from sklearn.decomposition import IncrementalPCA
+    from app.memory_manager import ProjectionEngine, write_pickle_atomic
+    from app.settings import Settings
+    dim = Settings().compressed_dim
+    X = corpus.embeddings(size)
+    ipca = IncrementalPCA(n_components=dim, batch_size=max(dim, 1024)).fit(X[:max(dim * 4, min(size, 5000))])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pca.pkl")
+        write_pickle_atomic(ipca, path)
+        engine = ProjectionEngine(path)
+        engine.reload()
+        return {
+            "single": common.measure(lambda: engine.project(X[0]), repeat * 100),
+            "matrix": common.measure(lambda: engine.project(X), repeat, items_per_call=size),
+        }
+
+def bench_binder(size: int, repeat: int):
+    # a fresh BinderIndex behaves as binder_lookup does once the shared index is loaded
+    from app.binder import BinderIndex, maybe_rewrite_prompt, rewrite_engine
+    index = BinderIndex()
+    atoms = corpus.atoms(size)
+    index.add_atoms(atoms, corpus.embeddings(size, dim=index.dim, seed=4))
+    rewrite_engine.build(atoms)
+    prompts = corpus.prompts(200, seed=5)
+    Q = corpus.embeddings(len(prompts), dim=index.dim, seed=6)
+
+    def run():
+        for p, q in zip(prompts, Q):
+            maybe_rewrite_prompt(p, index.search(q, top_k=3))
+    return {"lookup_and_rewrite": common.measure(run, repeat, items_per_call=len(prompts)),
+            "rewrite_only": common.measure(lambda: [maybe_rewrite_prompt(p, []) for p in prompts], repeat,
+                                           items_per_call=len(prompts))}
+
+def bench_bee(size: int, repeat: int):
+    from app.bee import ngrams_from_text
+    from app.mining import NgramSketch, count_ngrams
+    texts = corpus.prompts(size, seed=7)
+
+    def sketch_update():
+        sketch = NgramSketch(capacity=5000)
+        sketch.update(*count_ngrams(texts))
+    return {
+        "ngrams_from_text": common.measure(lambda: [ngrams_from_text(t) for t in texts], repeat, items_per_call=size),
+        "count_ngrams": common.measure(lambda: count_ngrams(texts), repeat, items_per_call=size),
+        "count_and_sketch": common.measure(sketch_update, repeat, items_per_call=size),
+    }
+
+def bench_compaction(size: int, repeat: int):
+    from app.memory_manager import assign_and_cluster
+    from app.settings import Settings
+    dim = Settings().compressed_dim
+    X = corpus.embeddings(size, dim=dim, seed=8)
+    C = corpus.embeddings(64, dim=dim, clusters=64, spread=0.0, seed=9)
+    return {"assign_and_cluster": common.measure(
+        lambda: assign_and_cluster(X, C, 0.15, 8), repeat, items_per_call=size)}
+
+def bench_chain(size: int, repeat: int):
+    from app.chain import GENESIS, ChainSequencer, verify_segment
+    from app.db import new_interaction_record
+    ts = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    texts = corpus.prompts(size, seed=10, words=20)
+    records = []
+    for t in texts:
+        r = new_interaction_record(t, t[::-1], None, None)
+        r["timestamp"] = ts
+        records.append(r)
+
+    def stamp():
+        ChainSequencer().stamp_batch(records)
+    stamp()
+    rows = [(r["seq"], r["input_text"], r["output_text"], r["timestamp"].isoformat(), r["merkle_root"]) for r in records]
+    return {"stamp": common.measure(stamp, repeat, items_per_call=size),
+            "verify_segment": common.measure(lambda: verify_segment(GENESIS, 1, rows), repeat, items_per_call=size)}
+
+def bench_codec(size: int, repeat: int):
+    # what a bulk fetch of `size` compressed vectors costs after the wire: raw
+    # vector_send buffers stacked in one pass, per-row binary decode + one matrix
+    # copy, and parsing pgvector's text format
+    from app.settings import Settings
+    from app.vector_codec import decode_vector, encode_vector, stack_vector_bytes, stack_vectors
+    X = corpus.embeddings(size, dim=Settings().compressed_dim, seed=12)
+    binary = [encode_vector(x) for x in X]
+    text = ["[" + ",".join(map(str, x.tolist())) + "]" for x in X]
+    return {
+        "binary_bulk": common.measure(lambda: stack_vector_bytes(binary), repeat, items_per_call=size),
+        "binary_decode": common.measure(lambda: stack_vectors([decode_vector(b) for b in binary]), repeat,
+                                        items_per_call=size),
+        "text_parse": common.measure(lambda: np.array([[float(v) for v in t[1:-1].split(",")] for t in text],
+                                                      dtype=np.float32), repeat, items_per_call=size),
+    }
+
+def _recall(exact, approx, k: int) -> float:
+    return float(np.mean([len(set(e[:k]) & set(a[:k])) / k for e, a in zip(exact, approx)]))
+
+def bench_quantized(size: int, repeat: int, k: int = 10):
+    # two-stage (Hamming prefilter + exact re-rank) search against exact search, with
+    # recall@k, and the int8 round trip of full embeddings with its cosine error
+    from app.quantize import dequantize_int8, quantize_int8
+    from app.settings import Settings
+    from app.vector_index import VectorIndex
+    s = Settings()
+    clusters = max(size // 50, 1)
+    X = corpus.embeddings(size, dim=s.compressed_dim, clusters=clusters, spread=1.0, seed=13)
+    # same centres, fresh points
+    Q = corpus.embeddings(200, dim=s.compressed_dim, clusters=clusters, spread=1.0, seed=13)
+    exact = VectorIndex(s.compressed_dim, hnsw_threshold=size + 1)
+    exact.build(X)
+    truth = exact.search(Q, k)[1]
+    results = {"exact": dict(common.measure(lambda: exact.search(Q, k), repeat, items_per_call=len(Q)),
+                             code_bytes_per_vector=4 * s.compressed_dim, resident_bytes=exact.resident_bytes())}
+    for factor in sorted({4, s.binary_rerank_factor}):
+        index = VectorIndex(s.compressed_dim, hnsw_threshold=size + 1, binary=True, rerank_factor=factor)
+        index.build(X)
+        results[f"binary_rerank_x{factor}"] = dict(
+            common.measure(lambda: index.search(Q, k), repeat, items_per_call=len(Q)),
+            recall=_recall(truth, index.search(Q, k)[1], k), code_bytes_per_vector=s.compressed_dim // 8,
+            resident_bytes=index.resident_bytes())
+    E = corpus.embeddings(min(size, 5000), dim=s.input_dim, seed=15)
+    codes = [quantize_int8(e) for e in E]
+    D = np.stack([dequantize_int8(c) for c in codes])
+    cos = np.sum(D * E, axis=1) / (np.linalg.norm(D, axis=1) * np.linalg.norm(E, axis=1))
+    results["int8_encode"] = dict(common.measure(lambda: [quantize_int8(e) for e in E], repeat, items_per_call=len(E)),
+                                  bytes_per_vector=len(codes[0]), float32_bytes=4 * s.input_dim,
+                                  mean_cosine=float(cos.mean()), min_cosine=float(cos.min()))
+    return results
+
+BENCHMARKS = {"compress": bench_compress, "binder": bench_binder, "bee": bench_bee,
+              "compaction": bench_compaction, "chain": bench_chain, "codec": bench_codec,
+              "quantized": bench_quantized}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes")
+    ap.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmark names")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--max-compaction-size", type=int, default=20000,
+                    help="skip compaction above this size (HDBSCAN is super-linear)")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+    results = {}
+    for name in args.only.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            if name == "compaction" and size > args.max_compaction_size:
+                continue
+            print(f"{name} @ {size}...", file=sys.stderr, flush=True)
+            for case, stats in BENCHMARKS[name](size, args.repeat).items():
+                results[f"{name}.{case}[{size}]"] = dict(stats, size=size)
+    common.write_report({"suite": "micro", "results": results}, args.out)
+
+if __name__ == "__main__":
+    main()
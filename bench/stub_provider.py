@@ -0,0 +1,63 @@
+"""
+Local stand-in for the embedding and chat-completion provider.
+
+    STUB_LATENCY_MS=200 STUB_CHUNK_MS=20 uvicorn bench.stub_provider:app --port 9000
+
+then point EMBEDDING_URL at http://localhost:9000/v1/embeddings and LLM_URL at
+http://localhost:9000/v1/chat/completions. Embeddings are deterministic
+pseudo-random unit vectors seeded from the input text; completions echo a
+fixed number of words, streamed as OpenAI-style SSE chunks when `stream` is set.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))          # before the first byte
+CHUNK_MS = float(os.getenv("STUB_CHUNK_MS", "0"))              # between streamed chunks
+EMBEDDING_LATENCY_MS = float(os.getenv("STUB_EMBEDDING_LATENCY_MS", "0"))
+OUTPUT_WORDS = int(os.getenv("STUB_OUTPUT_WORDS", "64"))
+EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "1536"))
+
+app = FastAPI(title="SEMS stub provider")
+
+def stub_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+def stub_completion_words(prompt: str):
+    words = prompt.split() or ["ok"]
+    return [words[i % len(words)] for i in range(OUTPUT_WORDS)]
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    if EMBEDDING_LATENCY_MS:
+        await asyncio.sleep(EMBEDDING_LATENCY_MS / 1000.0)
+    return {"object": "list", "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": stub_embedding(t)} for i, t in enumerate(inputs)]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    words = stub_completion_words(prompt)
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000.0)
+    if not body.get("stream"):
+        return JSONResponse({"model": body.get("model"), "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}]})
+
+    async def chunks():
+        for i, w in enumerate(words):
+            if i and CHUNK_MS:
+                await asyncio.sleep(CHUNK_MS / 1000.0)
+            delta = {"content": w if i == 0 else " " + w}
+            yield "data: " + json.dumps({"model": body.get("model"), "choices": [{"index": 0, "delta": delta}]}) + "\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(chunks(), media_type="text/event-stream")
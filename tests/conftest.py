@@ -0,0 +1,9 @@
+import os
+
+# app.settings requires these; the unit tests never reach Postgres or the
+# provider, they only need them to be present
+for _k, _v in {"API_KEY": "test", "POSTGRES_HOST": "localhost", "POSTGRES_DB": "sems",
+               "POSTGRES_USER": "sems_user", "POSTGRES_PASSWORD": "sems_password",
+               "EMBEDDING_URL": "http://localhost:9000/v1/embeddings",
+               "LLM_URL": "http://localhost:9000/v1/chat/completions", "PROVIDER_API_KEY": "test"}.items():
+    os.environ.setdefault(_k, _v)
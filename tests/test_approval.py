@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import json
+import pytest
+from fastapi import HTTPException
+import app.main as main
+from app.db import essence_signature, upsert_essences
+
+class ApprovalConn:
+    """Just enough of a connection for the approval path; records every statement."""
+
+    def __init__(self, proposal, status_at_lock="pending"):
+        self.proposal, self.status_at_lock = proposal, status_at_lock
+        self.calls, self.in_transaction = [], False
+
+    async def fetchrow(self, sql, *args):
+        self.calls.append((sql, args, self.in_transaction))
+        return self.proposal
+
+    async def fetchval(self, sql, *args):
+        self.calls.append((sql, args, self.in_transaction))
+        return self.status_at_lock
+
+    async def fetch(self, sql, *args):
+        self.calls.append((sql, args, self.in_transaction))
+        meanings = args[0]
+        return [{"essence_id": f"e-{i}", "canonical_meaning": m} for i, m in enumerate(meanings)]
+
+    async def execute(self, sql, *args):
+        self.calls.append((sql, args, self.in_transaction))
+
+    executemany = execute
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+class ApprovalPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+class StubRequest:
+    headers = {"x-approver-key": "k"}
+
+class StubIndex:
+    def __init__(self):
+        self.added = []
+
+    def add_atoms(self, atoms, embs):
+        self.added.append((atoms, embs))
+
+def stub_approval(monkeypatch, conn):
+    embedded = []
+    async def verify_approver(key):
+        return {"user_id": "u1"}
+    async def provider_embedding_batch(texts):
+        embedded.append(list(texts))
+        return [[1.0] * main.settings.input_dim for _ in texts]
+    index = StubIndex()
+    monkeypatch.setattr(main, "verify_approver", verify_approver)
+    monkeypatch.setattr(main, "provider_embedding_batch", provider_embedding_batch)
+    monkeypatch.setattr(main, "compress_embeddings", lambda E: E[:, :2])
+    monkeypatch.setattr(main, "db_pool", ApprovalPool(conn))
+    monkeypatch.setattr(main, "binder_index", index)
+    return embedded, index
+
+def proposal(candidates):
+    return {"status": "pending", "safety_risks": [], "candidate_atoms": candidates}
+
+def test_approval_embeds_once_and_writes_in_one_transaction(monkeypatch):
+    conn = ApprovalConn(proposal([{"label": "ATOM_A", "pattern": "a b"},
+                                  {"label": "ATOM_C", "pattern": "c d", "canonical_meaning": "see dee"}]))
+    embedded, index = stub_approval(monkeypatch, conn)
+    result = asyncio.run(main.approve_proposal("p1", StubRequest()))
+    assert result == {"status": "approved", "promoted": 2}
+    assert embedded == [["a b", "c d"]]
+    # after the initial read: lock, essences, tokens, status and audit log, all in the transaction
+    assert len(conn.calls) == 6 and all(in_tx for _, _, in_tx in conn.calls[1:])
+    assert "FOR UPDATE" in conn.calls[1][0] and "proposal_audit_log" in conn.calls[-1][0]
+    tokens = next(args[0] for sql, args, _ in conn.calls if "INSERT INTO atomic_tokens" in sql)
+    assert [(t[1], t[2], t[4]) for t in tokens] == [("e-0", "ATOM_A", "a b"), ("e-1", "ATOM_C", "see dee")]
+    # the in-memory index only learns about atoms after the commit
+    (atoms, embs), = index.added
+    assert [a["token_id"] for a in atoms] == [str(t[0]) for t in tokens] and embs.shape == (2, 2)
+
+def test_approval_conflicts_when_the_proposal_changed_meanwhile(monkeypatch):
+    conn = ApprovalConn(proposal([{"label": "ATOM_A", "pattern": "a b"}]), status_at_lock="approved")
+    _, index = stub_approval(monkeypatch, conn)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(main.approve_proposal("p1", StubRequest()))
+    assert e.value.status_code == 409
+    assert not any("INSERT" in sql for sql, _, _ in conn.calls) and index.added == []
+
+def test_upsert_essences_groups_forms_by_signature():
+    conn = ApprovalConn(None)
+    ids = asyncio.run(upsert_essences(conn, [
+        {"canonical_meaning": "greet", "form": "hi", "generation": "G1"},
+        {"canonical_meaning": "greet", "form": "hello"},
+        {"canonical_meaning": "part", "form": None}]))
+    assert ids == {"greet": "e-0", "part": "e-1"}
+    sql, (meanings, sigs, histories), _ = conn.calls[0]
+    assert "form_history || EXCLUDED.form_history" in sql
+    assert meanings == ["greet", "part"] and sigs == [essence_signature("greet"), essence_signature("part")]
+    greet = json.loads(histories[0])
+    assert [(h["form"], h["generation"]) for h in greet] == [("hi", "G1"), ("hello", "unknown")]
+    assert json.loads(histories[1]) == []
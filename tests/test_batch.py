@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import numpy as np
+from cachetools import TTLCache
+import app.batch as batch
+from app.chain import ChainSequencer
+
+class StubRouter:
+    async def call(self, prompt, model, max_latency_ms=None):
+        return {"choices": [{"message": {"content": f"re: {prompt}"}}]}, model
+
+class StubWriter:
+    def __init__(self):
+        self.records = []
+
+    async def enqueue(self, *records):
+        self.records.extend(records)
+
+def stub_pipeline(monkeypatch):
+    async def embed_texts(texts):
+        return np.zeros((len(texts), 4), np.float32), np.zeros((len(texts), 2), np.float32)
+    async def binder_lookup_many(pool, C, top_k=3):
+        return [[] for _ in range(len(C))]
+    async def embed_text(text):
+        return None, None
+    writer = StubWriter()
+    monkeypatch.setattr(batch, "embed_texts", embed_texts)
+    monkeypatch.setattr(batch, "binder_lookup_many", binder_lookup_many)
+    monkeypatch.setattr(batch, "embed_text", embed_text)
+    monkeypatch.setattr(batch, "prepare_call", lambda prompt, *a, **kw: (prompt, "small", {"cache_key": None}))
+    ts = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    monkeypatch.setattr(batch, "interaction_record",
+                        lambda context, text, resp, model: {"input_text": "", "output_text": text, "timestamp": ts})
+    monkeypatch.setattr(batch, "proxy_result", lambda record, context, model: {"seq": record["seq"]})
+    monkeypatch.setattr(batch, "model_router", StubRouter())
+    monkeypatch.setattr(batch, "chain_sequencer", ChainSequencer())
+    monkeypatch.setattr(batch, "interaction_writer", writer)
+    return writer
+
+def test_stamped_records_are_queued_before_a_consumer_stops_reading(monkeypatch):
+    writer = stub_pipeline(monkeypatch)
+    items = [{"prompt": f"p{i}"} for i in range(5)]
+
+    async def first_result():
+        gen = batch.run_batch(None, items, use_cache=False)
+        r = await gen.__anext__()
+        await gen.aclose()
+        return r
+    first = asyncio.run(first_result())
+    stamped = batch.chain_sequencer.seq
+    assert first["seq"] == 1 and stamped >= 1
+    # every stamped seq reached the writer, so the chain has no gap
+    assert sorted(r["seq"] for r in writer.records) == list(range(1, stamped + 1))
+
+def test_running_jobs_outlive_the_ttl_and_move_when_finished(monkeypatch):
+    release = asyncio.Event()
+
+    async def run_batch(pool, items, use_cache=True):
+        yield {"index": 0}
+        await release.wait()
+        yield {"index": 1, "error": "Upstream error"}
+    monkeypatch.setattr(batch, "run_batch", run_batch)
+    monkeypatch.setattr(batch, "running_jobs", {})
+    monkeypatch.setattr(batch, "finished_jobs", TTLCache(maxsize=1, ttl=0.01))
+
+    async def main():
+        job = batch.start_batch_job(None, [{"prompt": "a"}, {"prompt": "b"}])
+        await asyncio.sleep(0.05)   # past the TTL while still running
+        assert batch.get_batch_job(job["job_id"]) is job and job["status"] == "running"
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return job
+    job = asyncio.run(main())
+    assert job["status"] == "done" and job["completed"] == 2 and job["errors"] == 1
+    assert job["job_id"] not in batch.running_jobs and job["job_id"] in batch.finished_jobs
+
+class RecordingCache:
+    def __init__(self):
+        self.lookups, self.stored = [], []
+
+    async def get_exact(self, key):
+        self.lookups.append(key)
+
+    async def get_semantic(self, emb, tier=None):
+        self.lookups.append("semantic")
+
+    async def put(self, key, emb, value, tier=None):
+        self.stored.append(key)
+
+def test_use_memory_items_bypass_the_response_cache(monkeypatch):
+    stub_pipeline(monkeypatch)
+    cache = RecordingCache()
+    monkeypatch.setattr(batch, "response_cache", cache)
+    monkeypatch.setattr(batch, "prepare_call", lambda prompt, E, C, cands, key, **kw:
+                        (prompt, "small", {"cache_key": key, "input_emb_c": C, "tier": None}))
+
+    async def run():
+        return [r async for r in batch.run_batch(None, [{"prompt": "plain"}, {"prompt": "mem", "use_memory": True}])]
+    results = asyncio.run(run())
+    key = batch.prompt_key("plain")
+    assert sorted(r["index"] for r in results) == [0, 1]
+    assert cache.lookups == [key, "semantic"] and cache.stored == [key]
@@ -0,0 +1,35 @@
+import asyncio
+import json
+from app import bee
+
+class RecordingPool:
+    def __init__(self):
+        self.calls = []
+
+    async def execute(self, sql, *args):
+        self.calls.append((sql, args))
+
+def proposal(pattern, utility):
+    sim = {"byte_ratio_saved": utility, "coverage": 0.1, "atom_overlap": 0.0, "collisions": 0}
+    return bee._proposal(pattern, 3, sim)
+
+def test_pattern_signature_ignores_whitespace_differences():
+    assert bee.pattern_signature("please  summarise\nthis") == bee.pattern_signature("please summarise this")
+    assert bee.pattern_signature("please summarise this") != bee.pattern_signature("please summarise that")
+
+def test_causal_utility_discounts_overlap_and_collisions():
+    sim = {"byte_ratio_saved": 0.4, "coverage": 0.2, "atom_overlap": 0.5, "collisions": 1}
+    assert bee._proposal("a b", 2, sim)["causal_utility"] == 0.4 * 0.5 * 0.5
+
+def test_upsert_writes_one_row_per_signature_in_one_statement():
+    pool = RecordingPool()
+    asyncio.run(bee.upsert_proposals(pool, [proposal("a  b", 0.3), proposal("a b", 0.1), proposal("c d", 0.2)]))
+    assert len(pool.calls) == 1
+    sql, (sigs, atoms, gains, deltas, utilities, risks, ttl) = pool.calls[0]
+    assert sigs == [bee.pattern_signature("a b"), bee.pattern_signature("c d")]
+    assert [json.loads(a)[0]["pattern"] for a in atoms] == ["a  b", "c d"]   # the first sighting wins
+    assert gains == [0.3, 0.2] and len(deltas) == len(utilities) == len(risks) == 2
+    assert ttl == float(bee.settings.bee_proposal_ttl_seconds)
+    # reviewed proposals are never reset to pending; unseen pending ones expire
+    assert "WHERE rebase_proposals.status IN ('pending', 'expired')" in sql
+    assert "SET status = 'expired'" in sql and "signature <> ALL($1::text[])" in sql
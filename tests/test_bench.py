@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import functools
+import httpx
+from bench import common, load
+from bench.compare import compare
+
+def report(**results):
+    return {"results": results}
+
+def test_compare_flags_latency_throughput_and_error_regressions():
+    baseline = report(fast={"p95": 10.0, "throughput_per_s": 100.0}, steady={"p95": 10.0, "errors": 2},
+                      flaky={"p95": 10.0}, gone={"p95": 1.0})
+    current = report(fast={"p95": 10.5, "throughput_per_s": 80.0}, steady={"p95": 11.0, "errors": 2},
+                     flaky={"p95": 9.0, "errors": 1}, added={"p95": 1.0})
+    rows, regressed = compare(baseline, current, tolerance=0.15)
+    status = {r["name"]: r["status"] for r in rows}
+    assert regressed
+    assert status == {"fast": "regressed", "steady": "ok", "flaky": "regressed", "added": "new", "gone": "missing"}
+
+def test_compare_passes_within_tolerance():
+    rows, regressed = compare(report(a={"p95": 10.0}), report(a={"p95": 11.0}), tolerance=0.15)
+    assert not regressed and abs(rows[0]["p95_change"] - 0.1) < 1e-9
+
+def test_percentiles_handle_empty_samples():
+    assert common.percentiles([]) == {"p50": None, "p95": None, "p99": None, "mean": None}
+    assert common.percentiles([1.0, 2.0, 3.0])["p50"] == 2.0
+
+async def body(data):
+    yield data
+
+def test_load_counts_non_200_responses_as_errors(monkeypatch):
+    seen = []
+    async def handler(request):
+        if request.url.path == "/metrics":
+            return httpx.Response(200, text="process_resident_memory_bytes 1048576.0\n")
+        seen.append(request)
+        return httpx.Response(429 if len(seen) % 3 == 0 else 200, content=body(b"{}"))
+    monkeypatch.setattr(load.httpx, "AsyncClient",
+                        functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(handler)))
+    args = argparse.Namespace(requests=9, seed=1, words=5, repeat_ratio=0.0, api_key="k", concurrency=3,
+                              timeout=5.0, url="http://test", stream=False, no_cache=False)
+    result = asyncio.run(load.run(args))["load.proxy"]
+    assert result["statuses"] == {"200": 6, "429": 3}
+    assert result["errors"] == 3 and abs(result["error_rate"] - 1 / 3) < 1e-9
+    assert result["server_rss_mb_before"] == 1.0
@@ -0,0 +1,34 @@
+import asyncio
+import types
+from app import binder
+
+class CountingIndex:
+    def __init__(self):
+        self.loads, self.pca_version, self.stale = 0, 1, False
+
+    async def load(self, pool):
+        self.loads += 1
+        self.pca_version = engine.version
+
+engine = types.SimpleNamespace(version=1)
+
+def test_binder_index_follows_a_promoted_model(monkeypatch):
+    index = CountingIndex()
+    monkeypatch.setattr(binder, "binder_index", index)
+    monkeypatch.setattr(binder, "get_projection_engine", lambda: engine)
+    monkeypatch.setattr(binder.settings, "binder_version_check_seconds", 0.01)
+    monkeypatch.setattr(binder.settings, "binder_index_resync_seconds", 3600)
+
+    async def main():
+        engine.version = 1
+        loop = asyncio.create_task(binder.binder_index_loop(None))
+        await asyncio.sleep(0.05)
+        assert index.loads == 0          # same model, resync not due
+        engine.version = 2
+        await asyncio.sleep(0.05)
+        assert index.loads == 1 and index.pca_version == 2
+        index.stale = True               # atoms still being mapped: keep reloading
+        await asyncio.sleep(0.05)
+        loop.cancel()
+        return index.loads
+    assert asyncio.run(main()) > 2
@@ -0,0 +1,58 @@
+import asyncio
+import numpy as np
+from app.cache import LocalExactStore, RedisExactStore, ResponseCache, SemanticIndex, cache_hit, prompt_key
+
+def test_prompt_key_normalises_whitespace_and_scopes_by_tier():
+    assert prompt_key("hello   world\n") == prompt_key(" hello world")
+    assert prompt_key("hello world", "large") != prompt_key("hello world")
+    assert prompt_key("hello world", "large") != prompt_key("hello world", "small")
+
+def test_cache_hit_moves_provenance_under_cached_from():
+    result = {"output": "hi", "interaction_id": "abc", "seq": 7, "merkle_root": "r"}
+    hit = cache_hit(result, "semantic")
+    assert hit == {"output": "hi", "cache": "semantic",
+                   "cached_from": {"interaction_id": "abc", "seq": 7, "merkle_root": "r"}}
+
+def test_semantic_lookup_only_matches_the_same_tier():
+    index = SemanticIndex(maxsize=10, ttl=60, max_distance=0.05)
+    index.add("k-small", [1.0, 0.0], "small")
+    index.add("k-none", [0.0, 1.0])
+    assert index.nearest([0.99, 0.01], "small") == "k-small"
+    assert index.nearest([0.99, 0.01], "large") is None
+    assert index.nearest([0.99, 0.01]) is None            # nearest untiered entry is too far
+    assert index.nearest([0.01, 0.99]) == "k-none"
+
+def test_semantic_index_follows_the_lru_bound():
+    index = SemanticIndex(maxsize=2, ttl=60, max_distance=0.05)
+    index.add("a", [1.0, 0.0, 0.0])
+    index.add("b", [0.0, 1.0, 0.0])
+    index.add("c", [0.0, 0.0, 1.0])
+    assert len(index) == 2
+    assert index.nearest([1.0, 0.0, 0.0]) is None
+    assert index.nearest([0.0, 0.0, 1.0]) == "c"
+
+def test_response_cache_resolves_semantic_hits_through_the_exact_tier():
+    cache = ResponseCache(LocalExactStore(10, 60), SemanticIndex(10, 60, max_distance=0.05))
+
+    async def run():
+        key = prompt_key("what is the capital of france")
+        await cache.put(key, np.array([1.0, 0.0]), {"output": "Paris"})
+        return (await cache.get_exact(key), await cache.get_exact(prompt_key("other")),
+                await cache.get_semantic(np.array([0.98, 0.02])))
+    exact, miss, semantic = asyncio.run(run())
+    assert exact == {"output": "Paris"} and miss is None and semantic == {"output": "Paris"}
+
+class BrokenRedis:
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("down")
+
+def test_redis_failures_degrade_to_misses():
+    store = RedisExactStore(BrokenRedis(), ttl=60)
+
+    async def run():
+        await store.set("k", {"output": "x"})
+        return await store.get("k")
+    assert asyncio.run(run()) is None
@@ -0,0 +1,45 @@
+import datetime
+from app.backfill_chain import restamp
+from app.chain import GENESIS, ChainSequencer, verify_segment
+from app.db import merkle_record
+
+def records(n):
+    t0 = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [{"input_text": f"in {i}", "output_text": f"out {i}", "timestamp": t0 + datetime.timedelta(seconds=i)}
+            for i in range(n)]
+
+def rows(stamped):
+    return [(r["seq"], r["input_text"], r["output_text"], merkle_record(r)["timestamp"], r["merkle_root"])
+            for r in stamped]
+
+def test_stamp_batch_links_records():
+    seqr = ChainSequencer()
+    stamped = seqr.stamp_batch(records(3))
+    assert [r["seq"] for r in stamped] == [1, 2, 3]
+    assert seqr.seq == 3 and seqr.head == stamped[-1]["merkle_root"]
+    assert verify_segment(GENESIS, 1, rows(stamped)) == []
+
+def test_verify_segment_from_an_anchor():
+    stamped = ChainSequencer().stamp_batch(records(6))
+    assert verify_segment(stamped[2]["merkle_root"], 4, rows(stamped[3:])) == []
+
+def test_verify_segment_reports_tampered_row_only():
+    r = rows(ChainSequencer().stamp_batch(records(4)))
+    r[1] = (r[1][0], "tampered", *r[1][2:])
+    problems = verify_segment(GENESIS, 1, r)
+    assert [p["seq"] for p in problems] == [2]
+    assert problems[0]["expected"] == r[1][4]
+
+def test_verify_segment_reports_gaps():
+    r = rows(ChainSequencer().stamp_batch(records(4)))
+    problems = verify_segment(GENESIS, 1, r[:1] + r[2:])
+    assert problems[0] == {"seq": 2, "error": "missing", "next_seq": 3}
+
+def test_restamp_continues_a_chain_the_sequencer_would_produce():
+    recs = records(5)
+    expected = ChainSequencer().stamp_batch([dict(r) for r in recs])
+    rows = [(i, r["input_text"], r["output_text"], r["timestamp"]) for i, r in enumerate(recs)]
+    # in two batches, as the backfill writes them
+    first = restamp(GENESIS, 0, rows[:2])
+    updates = first + restamp(first[-1][2], first[-1][1], rows[2:])
+    assert [(seq, root) for _, seq, root in updates] == [(r["seq"], r["merkle_root"]) for r in expected]
@@ -0,0 +1,75 @@
+import asyncio
+import contextlib
+import datetime
+import types
+import numpy as np
+import app.cold_memory as cold_memory
+from app.cold_memory import ColdMemoryIndex, memory_context
+from app.vector_codec import encode_vector
+
+T0 = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+def centroid(cid, emb, minutes=0, summary=None):
+    return {"centroid_id": cid, "label": cid.upper(), "centroid_emb": encode_vector(emb),
+            "summary": summary or f"about {cid}", "member_count": 3,
+            "updated_at": T0 + datetime.timedelta(minutes=minutes)}
+
+class CentroidConn:
+    """Serves the centroids table, honouring the since / ids filters of ColdMemoryIndex._fetch."""
+
+    def __init__(self, rows):
+        self.rows, self.queries = rows, 0
+
+    async def fetch(self, sql, pca_version, since, ids):
+        self.queries += 1
+        return [r for r in self.rows
+                if (since is None or r["updated_at"] >= since) and (ids is None or r["centroid_id"] in ids)]
+
+class CentroidPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+def use_pca_version(monkeypatch, version):
+    monkeypatch.setattr(cold_memory, "get_projection_engine", lambda: types.SimpleNamespace(version=version))
+
+def test_search_returns_cosine_matches_above_the_threshold(monkeypatch):
+    use_pca_version(monkeypatch, 1)
+    pool = CentroidPool(CentroidConn([centroid("a", [1, 0, 0, 0]), centroid("b", [0, 2, 0, 0])]))
+    index = ColdMemoryIndex(dim=4)
+    assert index.search([1, 0, 0, 0]) == []          # not loaded yet
+    asyncio.run(index.load(pool))
+    hits = index.search([3, 0.1, 0, 0], top_k=2, min_similarity=0.5)
+    assert [h["centroid_id"] for h in hits] == ["a"]
+    assert abs(hits[0]["similarity"] - 1.0) < 0.01 and hits[0]["summary"] == "about a"
+
+def test_refresh_replaces_updated_centroids(monkeypatch):
+    use_pca_version(monkeypatch, 1)
+    conn = CentroidConn([centroid("a", [1, 0, 0, 0]), centroid("b", [0, 1, 0, 0])])
+    pool = CentroidPool(conn)
+    index = ColdMemoryIndex(dim=4)
+    asyncio.run(index.load(pool))
+    conn.rows[0] = centroid("a", [0, 0, 1, 0], minutes=5, summary="moved")
+    asyncio.run(index.refresh(pool))
+    assert len(index) == 2 and index._dead == 1
+    assert index.search([1, 0, 0, 0], top_k=1, min_similarity=0.5) == []   # the old position is tombstoned
+    assert index.search([0, 0, 1, 0], top_k=1)[0]["summary"] == "moved"
+
+def test_refresh_reloads_after_a_pca_change(monkeypatch):
+    use_pca_version(monkeypatch, 1)
+    pool = CentroidPool(CentroidConn([centroid("a", [1, 0, 0, 0])]))
+    index = ColdMemoryIndex(dim=4)
+    asyncio.run(index.load(pool))
+    index._dead = 1
+    use_pca_version(monkeypatch, 2)
+    asyncio.run(index.refresh(pool))
+    assert index.pca_version == 2 and index._dead == 0
+
+def test_memory_context_prepends_summaries():
+    assert memory_context("q", []) == "q"
+    assert memory_context("q", [{"summary": None}]) == "q"
+    text = memory_context("q", [{"summary": "one"}, {"summary": "two"}])
+    assert text == "Relevant context from memory:\n- one\n- two\n\nq"
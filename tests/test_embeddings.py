@@ -0,0 +1,55 @@
+import asyncio
+import numpy as np
+import app.embeddings as embeddings
+
+def stub_provider(monkeypatch, fail=False):
+    """Each text embeds to [len(text), batch number]; compression keeps the first column."""
+    calls = []
+    async def provider_embedding_batch(texts):
+        calls.append(list(texts))
+        await asyncio.sleep(0)
+        if fail:
+            raise ConnectionError("upstream down")
+        return [[float(len(t)), float(len(calls))] for t in texts]
+    monkeypatch.setattr(embeddings, "provider_embedding_batch", provider_embedding_batch)
+    monkeypatch.setattr(embeddings, "compress_embeddings", lambda X: X[:, :1] * 10)
+    return calls
+
+def test_concurrent_requests_share_one_upstream_batch(monkeypatch):
+    calls = stub_provider(monkeypatch)
+    batcher = embeddings.EmbeddingBatcher(max_items=10, max_wait_ms=5)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(t) for t in ["a", "bb", "a", "ccc"]))
+    results = asyncio.run(run())
+    assert calls == [["a", "bb", "ccc"]]     # identical texts share a slot
+    assert [float(e[0]) for e, _ in results] == [1.0, 2.0, 1.0, 3.0]
+    assert [float(c[0]) for _, c in results] == [10.0, 20.0, 10.0, 30.0]
+    assert batcher._futures == {} and batcher._queued == []
+
+def test_a_full_batch_flushes_without_waiting(monkeypatch):
+    calls = stub_provider(monkeypatch)
+    batcher = embeddings.EmbeddingBatcher(max_items=2, max_wait_ms=10_000)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.embed(t) for t in ["a", "b", "c", "d"])), 1.0)
+    asyncio.run(run())
+    assert calls == [["a", "b"], ["c", "d"]]
+
+def test_upstream_errors_reach_every_waiter(monkeypatch):
+    stub_provider(monkeypatch, fail=True)
+    batcher = embeddings.EmbeddingBatcher(max_items=10, max_wait_ms=1)
+
+    async def run():
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert batcher._futures == {}
+
+def test_embed_texts_dedupes_chunks_and_keeps_input_order(monkeypatch):
+    calls = stub_provider(monkeypatch)
+    monkeypatch.setattr(embeddings.settings, "embedding_batch_max_items", 2)
+    X, C = asyncio.run(embeddings.embed_texts(["ccc", "a", "ccc", "bb", "dddd"]))
+    assert sorted(map(tuple, calls)) == [("bb", "dddd"), ("ccc", "a")]
+    assert X[:, 0].tolist() == [3.0, 1.0, 3.0, 2.0, 4.0]
+    assert np.array_equal(C[:, 0], X[:, 0] * 10)
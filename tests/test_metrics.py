@@ -0,0 +1,81 @@
+import asyncio
+import contextlib
+from prometheus_client import REGISTRY
+from app import metrics
+from app.metrics import InstrumentedPool, ServerTimingMiddleware, stage, track_job
+
+async def asgi_app(scope, receive, send):
+    with stage("embed"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def call(middleware, headers=()):
+    sent = []
+    async def send(message):
+        sent.append(message)
+    async def receive():
+        return {"type": "http.request"}
+    asyncio.run(middleware({"type": "http", "headers": list(headers)}, receive, send))
+    return sent
+
+def test_server_timing_is_added_only_when_opted_in():
+    plain = call(ServerTimingMiddleware(asgi_app))
+    assert plain[0]["headers"] == [(b"content-type", b"text/plain")]
+    timed = call(ServerTimingMiddleware(asgi_app), [(b"x-server-timing", b"1")])
+    name, value = timed[0]["headers"][-1]
+    assert name == b"server-timing"
+    assert [part.split(b";")[0] for part in value.split(b", ")] == [b"embed", b"app"]
+    assert timed[1]["body"] == b"ok"      # the body is passed through untouched
+    assert call(ServerTimingMiddleware(asgi_app, enabled=True))[0]["headers"][-1][0] == b"server-timing"
+
+def test_stages_outside_a_request_only_feed_the_histogram():
+    metrics._trace.set(None)
+    before = REGISTRY.get_sample_value("sems_stage_latency_seconds_count", {"stage": "test_stage"}) or 0.0
+    with stage("test_stage"):
+        pass
+    assert REGISTRY.get_sample_value("sems_stage_latency_seconds_count", {"stage": "test_stage"}) == before + 1
+
+def test_track_job_labels_the_outcome():
+    def count(outcome):
+        return REGISTRY.get_sample_value("sems_job_duration_seconds_count", {"job": "test_job", "outcome": outcome}) or 0.0
+    ok, err = count("ok"), count("error")
+    with track_job("test_job"):
+        pass
+    with contextlib.suppress(ValueError), track_job("test_job"):
+        raise ValueError("boom")
+    assert count("ok") == ok + 1 and count("error") == err + 1
+
+class FakePool:
+    def __init__(self):
+        self.size, self.idle, self.released = 2, 2, []
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return self.idle
+
+    def get_max_size(self):
+        return 10
+
+    async def acquire(self, timeout=None):
+        self.idle -= 1
+        return "conn"
+
+    async def release(self, conn):
+        self.idle += 1
+        self.released.append(conn)
+
+def test_instrumented_pool_tracks_connections_in_use():
+    pool = FakePool()
+    wrapped = InstrumentedPool(pool)
+    def gauge(state):
+        return REGISTRY.get_sample_value("sems_db_pool_connections", {"state": state})
+
+    async def run():
+        async with wrapped.acquire() as conn:
+            assert conn == "conn" and gauge("in_use") == 1 and gauge("waiting") == 0
+    asyncio.run(run())
+    assert pool.released == ["conn"] and gauge("in_use") == 0 and gauge("max") == 10
+    assert wrapped.get_max_size() == 10      # everything else is delegated
@@ -0,0 +1,50 @@
+import asyncio
+import numpy as np
+from app.mining import NgramSketch, count_ngrams, load_sketch, merge_counts
+
+def counts_by_text(texts, **kw):
+    ids, counts, examples = count_ngrams(texts, **kw)
+    return {examples[int(i)]: int(c) for i, c in zip(ids, counts) if int(i) in examples}
+
+def test_count_ngrams_does_not_cross_text_boundaries():
+    counts = counts_by_text(["a b", "c d", "a b"])
+    assert counts["a b"] == 2 and counts["c d"] == 1
+    assert "b c" not in counts and "b a" not in counts
+
+def test_merge_counts_sums_shards():
+    texts = ["x y z", "x y", "y z", "x y z"]
+    merged = merge_counts([count_ngrams(texts[0::2]), count_ngrams(texts[1::2])])
+    whole = count_ngrams(texts)
+    assert np.array_equal(merged[0], whole[0]) and np.array_equal(merged[1], whole[1])
+
+def test_sketch_never_underestimates_and_keeps_heavy_hitters():
+    sketch = NgramSketch(width=64, depth=4, capacity=3)
+    ids, counts, examples = count_ngrams(["hot path"] * 50 + [f"rare{i}" for i in range(200)], ns=(1, 2))
+    sketch.update(ids, counts, examples)
+    assert (sketch.estimate(ids) >= counts).all()
+    assert len(sketch.heavy) == 3
+    assert {text for text, _ in sketch.top(3)} == {"hot", "path", "hot path"}
+
+def test_sketch_round_trips_through_its_payload():
+    sketch = NgramSketch(width=64, capacity=10)
+    sketch.update(*count_ngrams(["a b c"] * 3))
+    restored = NgramSketch.loads(sketch.dumps())
+    assert restored.top(10) == sketch.top(10)
+
+class JobStateConn:
+    def __init__(self):
+        self.row = None
+
+    async def fetchrow(self, sql, job):
+        return self.row
+
+def test_load_sketch_reads_the_latest_saved_state():
+    conn = JobStateConn()
+    first = asyncio.run(load_sketch(conn))
+    assert first[0] == 0 and first[1].top(5) == []
+    # another worker mines and saves in between
+    other = NgramSketch(capacity=10)
+    other.update(*count_ngrams(["saved elsewhere"] * 4))
+    conn.row = {"watermark": 42, "payload": other.dumps()}
+    watermark, sketch = asyncio.run(load_sketch(conn))
+    assert watermark == 42 and sketch.top(10) == other.top(10)
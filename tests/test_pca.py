@@ -0,0 +1,63 @@
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+from app import pca_job
+from app.memory_manager import basis_change
+from app.pca_job import BasisMaps, _reproject_rows, retained_variance, save_model_version
+from app.vector_codec import encode_vector
+
+def corpus(n, seed, shift=0.0):
+    """Rank-6 data in 32 dims plus a little noise."""
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(0).normal(size=(6, 32))
+    return (rng.normal(size=(n, 6)) @ basis + shift + rng.normal(scale=0.01, size=(n, 32))).astype(np.float32)
+
+def fit(X, k=8):
+    return IncrementalPCA(n_components=k).fit(X)
+
+def test_basis_change_is_the_round_trip_through_input_space():
+    old, new = fit(corpus(400, 1)), fit(corpus(400, 2, shift=0.5))
+    C = old.transform(corpus(20, 3))
+    A, b = basis_change(old, new, input_dim=32)
+    assert np.allclose(C @ A + b, new.transform(old.inverse_transform(C)), atol=1e-4)
+
+def warm_row(key, version, c):
+    # a warm row: its full embedding was dropped at demotion, only the compressed vector is left
+    return {"k": key, "v": version, "emb0": None, "emb0_q": None, "c0": encode_vector(c)}
+
+def test_warm_rows_survive_a_refit(tmp_path, monkeypatch):
+    monkeypatch.setattr(pca_job.settings, "pca_model_dir", str(tmp_path))
+    old, new = fit(corpus(500, 1)), fit(corpus(500, 2, shift=0.5))
+    save_model_version(old, 1)
+    X = corpus(50, 4)
+    rows = [warm_row(i, 1, c) for i, c in enumerate(old.transform(X))]
+    rows.append(warm_row(99, 7, np.ones(8)))    # its model file is gone
+    params = _reproject_rows(rows, [("input_embedding", "input_emb_compressed", None)], 2, BasisMaps(new))
+    # the row from the lost model stays at its old version, untouched
+    assert [p[0] for p in params] == list(range(50))
+    assert all(p[1] == 2 and p[2] == 1 for p in params)
+    mapped = np.stack([p[3] for p in params])
+    expected = new.transform(X)
+    assert np.allclose(mapped, expected, atol=0.05 * np.abs(expected).max())
+    # each mapped row is still nearest to its own fresh projection
+    d = np.linalg.norm(mapped[:, None] - expected[None], axis=2)
+    assert (d.argmin(axis=1) == np.arange(50)).all()
+
+def test_retained_variance_drops_when_the_data_drifts():
+    model = fit(corpus(500, 1), k=6)
+    fitted = float(np.sum(model.explained_variance_ratio_))
+    assert fitted - retained_variance(model, corpus(300, 5)) < 0.02
+    drifted = np.random.default_rng(6).normal(size=(300, 32)).astype(np.float32)
+    assert fitted - retained_variance(model, drifted) > 0.5
+
+def test_pca_version_moves_only_with_every_compressed_column(tmp_path, monkeypatch):
+    monkeypatch.setattr(pca_job.settings, "pca_model_dir", str(tmp_path))
+    old, new = fit(corpus(500, 1)), fit(corpus(500, 2))
+    save_model_version(old, 1)
+    columns = [("input_embedding", "input_emb_compressed", None), ("output_embedding", "output_emb_compressed", None)]
+    x, c = corpus(1, 7)[0], old.transform(corpus(1, 8))[0]
+    # input still has its full embedding, output only an old-basis compressed vector
+    row = {"emb0": x, "emb0_q": None, "c0": None, "emb1": None, "emb1_q": None, "c1": encode_vector(c)}
+    mappable, lost = dict(row, k="a", v=1), dict(row, k="b", v=5)
+    params = _reproject_rows([mappable, lost], columns, 2, BasisMaps(new))
+    assert [p[0] for p in params] == ["a"]
+    assert params[0][3] is not None and params[0][4] is not None
@@ -0,0 +1,80 @@
+import asyncio
+import httpx
+from tenacity import wait_none
+import app.provider as provider
+
+def use_transport(monkeypatch, handler):
+    """Point the shared client at an in-process handler; returns the list of requests it saw."""
+    seen = []
+    async def record(request):
+        seen.append(request)
+        return await handler(request)
+    monkeypatch.setattr(provider, "_client", httpx.AsyncClient(transport=httpx.MockTransport(record)))
+    monkeypatch.setattr(provider._post.retry, "wait", wait_none())
+    return seen
+
+def test_get_client_requires_startup(monkeypatch):
+    monkeypatch.setattr(provider, "_client", None)
+    try:
+        provider.get_client()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected RuntimeError")
+
+def test_concurrent_identical_embeddings_share_one_upstream_call(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"data": [{"embedding": [0.1, 0.2]}]})
+    seen = use_transport(monkeypatch, handler)
+
+    async def run():
+        return await asyncio.gather(*(provider.provider_embedding_call("same") for _ in range(5)),
+                                    provider.provider_embedding_call("other"))
+    results = asyncio.run(run())
+    assert all(r == [0.1, 0.2] for r in results)
+    assert len(seen) == 2
+    assert provider._inflight == {}
+
+def test_retries_on_429_and_5xx_but_not_4xx(monkeypatch):
+    statuses = iter([429, 503, 200])
+    async def handler(request):
+        status = next(statuses)
+        return httpx.Response(status, json={"choices": []} if status == 200 else {})
+    seen = use_transport(monkeypatch, handler)
+    assert asyncio.run(provider.provider_llm_call("p")) == {"choices": []}
+    assert len(seen) == 3
+
+    async def bad_request(request):
+        return httpx.Response(400, json={})
+    seen = use_transport(monkeypatch, bad_request)
+    try:
+        asyncio.run(provider.provider_llm_call("p"))
+    except httpx.HTTPStatusError as e:
+        assert e.response.status_code == 400
+    else:
+        raise AssertionError("expected HTTPStatusError")
+    assert len(seen) == 1
+
+def test_embedding_batch_returns_input_order(monkeypatch):
+    async def handler(request):
+        return httpx.Response(200, json={"data": [{"index": 1, "embedding": [2.0]}, {"index": 0, "embedding": [1.0]}]})
+    use_transport(monkeypatch, handler)
+    assert asyncio.run(provider.provider_embedding_batch(["a", "b"])) == [[1.0], [2.0]]
+
+def test_stream_yields_content_deltas_until_done(monkeypatch):
+    body = "\n".join([
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+        ": keep-alive",
+        'data: {"choices": [{"delta": {"content": "lo"}}]}',
+        "data: [DONE]",
+        'data: {"choices": [{"delta": {"content": "ignored"}}]}',
+    ])
+    async def handler(request):
+        return httpx.Response(200, text=body)
+    use_transport(monkeypatch, handler)
+
+    async def run():
+        return [d async for d in provider.provider_llm_stream("p")]
+    assert asyncio.run(run()) == ["Hel", "lo"]
@@ -0,0 +1,56 @@
+import numpy as np
+from app.quantize import dequantize_int8, quantize_int8, sign_bits, sign_codes
+from app import vector_index
+from app.vector_index import VectorIndex
+
+def test_int8_round_trip_within_one_step():
+    x = np.random.default_rng(0).normal(size=1536).astype(np.float32)
+    data = quantize_int8(x)
+    assert len(data) == 4 + x.size
+    step = np.abs(x).max() / 127
+    assert np.abs(dequantize_int8(data) - x).max() <= step / 2 + 1e-6
+
+def test_int8_zero_vector():
+    assert np.all(dequantize_int8(quantize_int8(np.zeros(8))) == 0)
+
+def test_sign_codes_match_sign_bits():
+    X = np.random.default_rng(1).normal(size=(5, 64))
+    assert np.array_equal(np.unpackbits(sign_codes(X), axis=1).astype(bool), sign_bits(X))
+
+def test_binary_index_reranks_exactly():
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(500, 64)).astype(np.float32)
+    Q = X[:10] + rng.normal(scale=0.01, size=(10, 64)).astype(np.float32)
+    index = VectorIndex(64, binary=True, rerank_factor=len(X))
+    index.build(X)
+    distances, positions = index.search(Q, 3)
+    exact = np.argsort(np.linalg.norm(X[None] - Q[:, None], axis=2), axis=1)[:, :3]
+    assert np.array_equal(positions, exact)
+    assert np.allclose(distances[:, 0], np.linalg.norm(X[:10] - Q, axis=1), atol=1e-5)
+
+def test_binary_index_pads_short_results():
+    index = VectorIndex(16, metric="ip", binary=True)
+    index.build(np.eye(16, dtype=np.float32)[:2])
+    distances, positions = index.search(np.ones(16), 5)
+    assert positions.shape == (1, 2) and set(positions[0]) == {0, 1}
+
+def test_resident_bytes_include_the_float_matrix():
+    X = np.random.default_rng(3).normal(size=(100, 64)).astype(np.float32)
+    flat, binary = VectorIndex(64), VectorIndex(64, binary=True)
+    flat.build(X)
+    binary.build(X)
+    assert binary.resident_bytes() >= X.nbytes + len(X) * 64 // 8
+    assert flat.resident_bytes() >= 2 * X.nbytes
+
+def test_binary_rerank_in_chunks_matches_one_pass(monkeypatch):
+    rng = np.random.default_rng(4)
+    X = rng.normal(size=(300, 32)).astype(np.float32)
+    Q = rng.normal(size=(10, 32)).astype(np.float32)
+    for metric in ("l2", "ip"):
+        index = VectorIndex(32, metric=metric, binary=True, rerank_factor=4)
+        index.build(X)
+        whole = index.search(Q, 5)
+        monkeypatch.setattr(vector_index, "RERANK_CHUNK_QUERIES", 3)
+        chunked = index.search(Q, 5)
+        monkeypatch.undo()
+        assert np.array_equal(whole[1], chunked[1]) and np.allclose(whole[0], chunked[0])
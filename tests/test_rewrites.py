@@ -0,0 +1,22 @@
+from app.binder import RewriteEngine, apply_rewrites
+from app.scoring import atom_marker
+
+def atom(label, base_repr=None, score=1.0, token_id=None):
+    return {"token_id": token_id or label, "essence_id": None, "label": label,
+            "base_repr": base_repr, "meaning": None, "score": score}
+
+def test_apply_rewrites_substitutes_markers():
+    pattern = "for (int i=0; i<n; i++)"
+    loop = atom("LOOP", pattern)
+    prompt = f"x {pattern} y {pattern}"
+    spans = [(2, 2 + len(pattern), loop), (5 + len(pattern), 5 + 2 * len(pattern), loop)]
+    new_prompt, used = apply_rewrites(prompt, spans)
+    assert new_prompt == f"x {atom_marker('LOOP')} y {atom_marker('LOOP')}"
+    assert used == [loop, loop]
+
+def test_rewrite_engine_delta_supersedes_main():
+    engine = RewriteEngine()
+    engine.build([atom("OLD", "some repeated phrase", score=0.9)])
+    engine.add([atom("NEW", "some repeated phrase", score=0.95)])
+    labels = [info["label"] for _, _, info in engine.matches("xx some repeated phrase")]
+    assert labels == ["NEW"]
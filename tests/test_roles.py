@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+import pytest
+from prometheus_client import REGISTRY
+from pydantic import ValidationError
+from app.db import run_exclusive
+from app.settings import Settings
+
+class LockConn:
+    def __init__(self, held):
+        self.held, self.calls = held, []
+
+    async def fetchval(self, sql, key):
+        self.calls.append(sql)
+        return not self.held
+
+    async def execute(self, sql, key):
+        self.calls.append(sql)
+
+class LockPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+def skipped():
+    return REGISTRY.get_sample_value("sems_job_skipped_total", {"job": "test_exclusive"}) or 0.0
+
+def test_run_exclusive_skips_when_another_worker_holds_the_lock():
+    ran, before = [], skipped()
+    async def job():
+        ran.append(True)
+    conn = LockConn(held=True)
+    assert asyncio.run(run_exclusive(LockPool(conn), "test_exclusive", job)) is False
+    assert ran == [] and skipped() == before + 1
+    assert not any("pg_advisory_unlock" in sql for sql in conn.calls)
+
+def test_run_exclusive_unlocks_even_when_the_job_fails():
+    async def job():
+        raise RuntimeError("boom")
+    conn = LockConn(held=False)
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_exclusive(LockPool(conn), "test_exclusive", job))
+    assert "pg_advisory_unlock" in conn.calls[-1]
+
+def test_role_rejects_unknown_values(monkeypatch):
+    monkeypatch.setenv("ROLE", "worker")
+    assert Settings().role == "worker"
+    monkeypatch.setenv("ROLE", "workers")
+    with pytest.raises(ValidationError):
+        Settings()
@@ -0,0 +1,65 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+import app.router as router
+from app.main import _latency_budget
+from app.router import ModelRouter
+
+def warmed(latency=0.1, ok=True, n=50):
+    r = ModelRouter("small", "large", window=n)
+    for m in (r.small, r.large):
+        for _ in range(n):
+            r.observe(m, latency, ok)
+    return r
+
+def test_choose_sends_long_unfamiliar_prompts_to_the_large_model():
+    r = warmed()
+    long_prompt = "word " * 3000
+    assert r.choose("short prompt") == ("small", "default")
+    assert r.choose(long_prompt) == ("large", "prompt_length")
+    assert r.choose(long_prompt, rewrite_meta={"rewritten": True}) == ("small", "default")
+    assert r.choose("short prompt", tier="large") == ("large", "tier")
+
+def test_choose_respects_the_latency_budget_and_health():
+    r = warmed(latency=2.0)
+    long_prompt = "word " * 3000
+    assert r.choose(long_prompt, max_latency_ms=500) == ("small", "latency_budget")
+    for _ in range(50):
+        r.observe("small", 0.1, False)
+    assert r.choose("short prompt") == ("large", "error_rate")
+
+def fake_stream(deltas, fail_after=None):
+    async def stream(prompt, model):
+        for i, d in enumerate(deltas):
+            if i == fail_after:
+                raise httpx.ReadError("connection reset")
+            yield d
+    return stream
+
+def test_client_disconnect_is_not_a_model_failure(monkeypatch):
+    monkeypatch.setattr(router, "provider_llm_stream", fake_stream(["a", "b", "c"]))
+    r = ModelRouter("small", "large")
+    async def main():
+        gen = r.stream("p", "small")
+        assert await gen.__anext__() == ("small", "a")
+        await gen.aclose()
+    asyncio.run(main())
+    assert r.stats["small"].count == 0
+
+def test_provider_error_mid_stream_is_recorded(monkeypatch):
+    monkeypatch.setattr(router, "provider_llm_stream", fake_stream(["a", "b", "c"], fail_after=2))
+    r = ModelRouter("small", "large")
+    async def main():
+        return [d async for _, d in r.stream("p", "small")]
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(main())
+    assert r.stats["small"].count == 1 and r.stats["small"].error_rate() == 1.0
+
+def test_latency_budget_must_be_a_positive_number():
+    assert _latency_budget(None) is None
+    assert _latency_budget(250) == 250.0
+    for bad in ("250", -1, 0, True, float("nan"), float("inf")):
+        with pytest.raises(HTTPException) as e:
+            _latency_budget(bad)
+        assert e.value.status_code == 400
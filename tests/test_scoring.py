@@ -0,0 +1,46 @@
+from app.scoring import PROMOTED_TRUST, atom_marker, score_candidates, select_rewrites
+
+def atom(label, base_repr=None, score=1.0, token_id=None):
+    return {"token_id": token_id or label, "essence_id": None, "label": label,
+            "base_repr": base_repr, "meaning": None, "score": score}
+
+def test_select_rewrites_prefers_highest_value_and_skips_overlaps():
+    a, b, c = atom("A"), atom("B"), atom("C")
+    # B saves the most, so it wins over both spans it overlaps
+    chosen = select_rewrites([(0, 20, a), (5, 30, b), (20, 40, c)])
+    assert chosen == [(5, 30, b)]
+
+def test_select_rewrites_weights_by_trust_and_drops_unprofitable():
+    low, high = atom("LOW", score=0.1), atom("HIGH", score=1.0)
+    assert select_rewrites([(0, 30, low), (10, 35, high)]) == [(10, 35, high)]
+    # the marker is longer than the span it would replace
+    assert select_rewrites([(0, 3, atom("LONG_LABEL"))]) == []
+
+def test_select_rewrites_keeps_adjacent_spans_in_prompt_order():
+    a, b = atom("A"), atom("B")
+    assert select_rewrites([(20, 40, b), (0, 20, a)]) == [(0, 20, a), (20, 40, b)]
+
+def test_score_candidates_counts_only_selected_occurrences():
+    prompts = ["a" * 40, "nothing here"]
+    cands = [{"pattern": "a" * 20, "label": "A"}]
+    sim, = score_candidates(cands, prompts, [])
+    # 21 raw (overlapping) occurrences, but only two fit side by side
+    assert sim["occurrences"] == 2
+    assert sim["coverage"] == 0.5
+    assert sim["bytes_saved"] == 2 * (20 - len(atom_marker("A")))
+
+def test_score_candidates_loses_to_a_more_valuable_atom():
+    prompts = ["x for (int i=0; i<n; i++) y"]
+    cands = [{"pattern": "int i=0; i<n;", "label": "I"}]
+    existing = [{"base_repr": "for (int i=0; i<n; i++)", "label": "LOOP", "score": PROMOTED_TRUST}]
+    sim, = score_candidates(cands, prompts, existing)
+    assert sim["occurrences"] == 0 and sim["bytes_saved"] == 0
+
+def test_score_candidates_reports_displaced_atoms_and_collisions():
+    prompts = ["x for (int i=0; i<n; i++) y"]
+    cands = [{"pattern": "for (int i=0; i<n; i++)", "label": "LOOP"},
+             {"pattern": "int i=0; i<n; i++", "label": "INNER"}]
+    existing = [{"base_repr": "i<n;", "label": "N", "score": 1.0}]
+    loop, inner = score_candidates(cands, prompts, existing)
+    assert loop["occurrences"] == 1
+    assert loop["atom_overlap"] == 1.0 and loop["collisions"] == 1.0
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from prometheus_client import REGISTRY
+import app.main as main
+
+def count(status):
+    return REGISTRY.get_sample_value("sems_requests_total", {"status": status}) or 0.0
+
+def in_progress():
+    return REGISTRY.get_sample_value("sems_requests_in_progress")
+
+class StubRouter:
+    async def stream(self, prompt, model, max_latency_ms=None):
+        for d in ("a", "b", "c"):
+            yield model, d
+
+def run_stream(monkeypatch, chunks_to_read=None):
+    """Drive _stream_proxy as the proxy endpoint hands it over; None reads to the end."""
+    persisted = []
+    async def persist(record, context, result, complete):
+        persisted.append(complete)
+    monkeypatch.setattr(main, "model_router", StubRouter())
+    monkeypatch.setattr(main, "_persist_streamed", persist)
+    monkeypatch.setattr(main, "interaction_record", lambda context, text, resp, model: {"output_text": text, "metadata": {}})
+    monkeypatch.setattr(main.chain_sequencer, "stamp", lambda record: record)
+    monkeypatch.setattr(main, "proxy_result", lambda record, context, model: {"output": record["output_text"]})
+
+    async def run():
+        main.REQUESTS_IN_PROGRESS.inc()
+        gen = main._stream_proxy("p", "small", None, {}, time.perf_counter())
+        seen = []
+        async for _ in gen:
+            seen.append(in_progress())
+            if chunks_to_read is not None and len(seen) == chunks_to_read:
+                await gen.aclose()
+                break
+        await asyncio.sleep(0)
+        return seen
+    return asyncio.run(run()), persisted
+
+def test_stream_settles_metrics_when_it_ends(monkeypatch):
+    before, ok_before = in_progress(), count("200")
+    seen, persisted = run_stream(monkeypatch)
+    # still in progress while chunks are being sent, settled once the stream is done
+    assert seen[0] == before + 1
+    assert in_progress() == before
+    assert count("200") == ok_before + 1
+    assert persisted == [True]
+
+def test_client_disconnect_is_counted_when_the_stream_stops(monkeypatch):
+    before, gone_before, ok_before = in_progress(), count("499"), count("200")
+    _, persisted = run_stream(monkeypatch, chunks_to_read=1)
+    assert in_progress() == before
+    assert count("499") == gone_before + 1 and count("200") == ok_before
+    assert persisted == [False]
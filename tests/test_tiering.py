@@ -0,0 +1,73 @@
+import asyncio
+import contextlib
+from prometheus_client import REGISTRY
+from app import tiering
+
+class ScriptedConn:
+    """Answers fetch/fetchrow/fetchval by the first matching SQL fragment; records every call."""
+
+    def __init__(self, answers):
+        self.answers, self.calls = answers, []
+
+    def _answer(self, sql, args):
+        self.calls.append((sql, args))
+        for fragment, answer in self.answers.items():
+            if fragment in sql:
+                return answer(*args) if callable(answer) else answer
+        raise AssertionError(f"unexpected query: {sql}")
+
+    async def fetch(self, sql, *args):
+        return self._answer(sql, args)
+
+    fetchrow = fetchval = fetch
+
+    async def execute(self, sql, *args):
+        self.calls.append((sql, args))
+
+    executemany = execute
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+class ScriptedPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+def test_nothing_is_demoted_until_pca_min_rows_have_full_embeddings():
+    conn = ScriptedConn({"ORDER BY seq DESC": None})
+    assert asyncio.run(tiering.demote_hot_batch(ScriptedPool(conn))) == 0
+    assert len(conn.calls) == 1
+    assert conn.calls[0][1] == (tiering.settings.pca_min_rows - 1,)
+
+def test_demotion_stops_below_the_newest_full_embedding_rows():
+    rows = [{"id": "a", "provider_response": '{"x": 1}'}, {"id": "b", "provider_response": None}]
+    conn = ScriptedConn({"ORDER BY seq DESC": 500, "FOR UPDATE SKIP LOCKED": rows})
+    assert asyncio.run(tiering.demote_hot_batch(ScriptedPool(conn))) == 2
+    select = next(args for sql, args in conn.calls if "FOR UPDATE SKIP LOCKED" in sql)
+    assert select[2] == 500     # only rows below the kept seq
+    archived = next(args for sql, args in conn.calls if "interaction_archive" in sql)
+    assert [a[0] for a in archived[0]] == ["a"]
+    update = next(sql for sql, _ in conn.calls if "SET tier = 'warm'" in sql)
+    assert "input_embedding = NULL" in update and "output_embedding = NULL" in update
+
+def gauge(name, tier):
+    return REGISTRY.get_sample_value(name, {"tier": tier})
+
+def test_tier_metrics_estimate_cold_from_table_size():
+    live = {"hot": {"cnt": 10, "row_bytes": 8000.0}, "warm": {"cnt": 100, "row_bytes": 1000.0}}
+    conn = ScriptedConn({
+        "WHERE tier = $1": lambda tier, limit: live[tier],
+        "'interactions'::regclass": {"cnt": 1110, "bytes": 1_000_000},
+        "'interaction_archive'::regclass": {"cnt": 100, "bytes": 5000},
+        "pg_stat_user_indexes": [],
+    })
+    asyncio.run(tiering.update_tier_metrics(ScriptedPool(conn)))
+    assert gauge("sems_tier_rows", "hot") == 10 and gauge("sems_tier_bytes", "hot") == 80_000
+    assert gauge("sems_tier_rows", "cold") == 1000 and gauge("sems_tier_bytes", "cold") == 820_000
+    assert gauge("sems_tier_bytes", "archive") == 5000
+    # no query touches every row of interactions
+    assert not any("pg_column_size(i.*)" in sql or "GROUP BY tier" in sql for sql, _ in conn.calls)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from app.vector_codec import (decode_bits, decode_halfvec, decode_vector, encode_bits, encode_halfvec,
+                              encode_vector, stack_vector_bytes, stack_vectors)
+
+def test_vector_round_trip():
+    x = np.random.default_rng(0).normal(size=256).astype(np.float32)
+    assert np.array_equal(decode_vector(encode_vector(x)), x)
+    assert np.allclose(decode_halfvec(encode_halfvec(x)), x, atol=1e-2)
+
+def test_bits_round_trip():
+    b = np.random.default_rng(1).random(13) > 0.5
+    assert np.array_equal(decode_bits(encode_bits(b)), b)
+
+def test_stack_vector_bytes_matches_per_row_decode():
+    X = np.random.default_rng(2).normal(size=(50, 32)).astype(np.float32)
+    bufs = [encode_vector(x) for x in X]
+    bufs[7] = None
+    M = stack_vector_bytes(bufs)
+    assert M.dtype == np.float32 and M.flags["C_CONTIGUOUS"]
+    assert np.array_equal(M, stack_vectors([None if b is None else decode_vector(b) for b in bufs]))
+    assert not M[7].any()
+
+def test_stack_vector_bytes_empty_and_mixed_dims():
+    assert stack_vector_bytes([], 8).shape == (0, 8)
+    with pytest.raises(ValueError):
+        stack_vector_bytes([encode_vector(np.ones(4)), encode_vector(np.ones(8))])
@@ -0,0 +1,65 @@
+import asyncio
+import datetime
+from app.writer import InteractionWriter
+
+def record(seq):
+    return {"seq": seq, "merkle_root": f"root{seq}", "input_text": "in", "output_text": "out",
+            "timestamp": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)}
+
+class MemoryWriter(InteractionWriter):
+    """Writes into a list instead of Postgres; fail=True makes every write raise."""
+
+    def __init__(self, tmp_path, **kw):
+        kw = {"maxsize": 10, "batch_size": 4, "flush_interval_ms": 10.0, "flush_timeout": 1.0, **kw}
+        super().__init__(spill_path=str(tmp_path / "spill.jsonl"), **kw)
+        self.rows = []
+        self.fail = False
+
+    async def _write(self, batch):
+        if self.fail:
+            raise ConnectionError("database down")
+        self.rows.extend(batch)
+
+def test_failed_flush_spills_and_next_flush_replays(tmp_path):
+    async def main():
+        w = MemoryWriter(tmp_path)
+        await w.start(None)
+        w.fail = True
+        await w.enqueue(record(1), record(2))
+        await w._queue.join()
+        assert w.rows == [] and w.spilled_head() == {"seq": 2, "merkle_root": "root2"}
+        w.fail = False
+        await w.enqueue(record(3))
+        await w._queue.join()
+        await w.stop()
+        return w
+    w = asyncio.run(main())
+    assert sorted(r["seq"] for r in w.rows) == [1, 2, 3]
+    assert w.spilled_head() is None
+
+def test_cancel_while_gathering_spills_the_partial_batch(tmp_path):
+    async def main():
+        # a long flush interval keeps the flusher gathering after the first record
+        w = MemoryWriter(tmp_path, flush_interval_ms=60_000)
+        await w.start(None)
+        await w.enqueue(record(1))
+        await asyncio.sleep(0.01)
+        assert w._queue.empty()
+        await w.stop(timeout=0.01)
+        return w
+    w = asyncio.run(main())
+    assert w.rows == [] and w.spilled_head()["seq"] == 1
+
+def test_enqueue_survives_caller_cancellation(tmp_path):
+    async def main():
+        w = MemoryWriter(tmp_path, maxsize=1)
+        w._queue.put_nowait(record(1))
+        caller = asyncio.create_task(w.enqueue(record(2)))
+        await asyncio.sleep(0)
+        caller.cancel()
+        w._queue.get_nowait()
+        w._queue.task_done()
+        await asyncio.wait(list(w._puts))
+        return w
+    w = asyncio.run(main())
+    assert w._queue.get_nowait()["seq"] == 2